@@ -14,10 +14,13 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from participant.routing import websocket_urlpatterns as participant_websocket_urlpatterns
 from manager.routing import websocket_urlpatterns as manager_websocket_urlpatterns
+from manager.utils.maintenance import start_maintenance_runner
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django.setup()
 
+start_maintenance_runner()
+
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AuthMiddlewareStack(
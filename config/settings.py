@@ -57,12 +57,6 @@ INSTALLED_APPS = [
     'django_browser_reload',
 ]
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    }
-}
-
 TAILWIND_APP_NAME = 'theme'
 
 INTERNAL_IPS = [
@@ -113,7 +107,8 @@ ASGI_APPLICATION = "config.asgi.application"
 #
 TEST = config('TEST', default=False, cast=bool)
 
-if TEST or 'test' in sys.argv:
+# Tests run on DATABASE_URL when it is set (CI starts PostgreSQL), otherwise on SQLite.
+if (TEST or 'test' in sys.argv) and not config('DATABASE_URL', default=''):
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
@@ -128,6 +123,25 @@ else:
         )
     }
 
+# Channel layer carrying live updates between server processes through the database.
+# Tests run in one process and keep the in-memory layer.
+if TEST or 'test' in sys.argv:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'manager.utils.channel_layer.DatabaseChannelLayer',
+            'CONFIG': {
+                # Seconds between checks for new messages where the database cannot notify (SQLite)
+                'poll_interval': config('CHANNEL_LAYER_POLL_INTERVAL', default=0.5, cast=float),
+            },
+        }
+    }
+
 
 # DATABASES = {
 #     "default": {
@@ -278,4 +292,31 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 SITE_DOMAIN = config('SITE_DOMAIN', default='http://127.0.0.1:8000/')
 
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+
+# Days to keep raw line length samples and per-minute line length buckets;
+# hourly buckets are kept forever (see `prune_queue_line_length`).
+QUEUE_LINE_LENGTH_RAW_RETENTION_DAYS = config('QUEUE_LINE_LENGTH_RAW_RETENTION_DAYS', default=7, cast=int)
+QUEUE_LINE_LENGTH_MINUTE_RETENTION_DAYS = config('QUEUE_LINE_LENGTH_MINUTE_RETENTION_DAYS', default=2, cast=int)
+
+# Size of the featured queue leaderboard on the home page and how long it is cached.
+FEATURED_QUEUES_COUNT = config('FEATURED_QUEUES_COUNT', default=10, cast=int)
+FEATURED_QUEUES_CACHE_SECONDS = config('FEATURED_QUEUES_CACHE_SECONDS', default=30, cast=int)
+
+# Weight of the newest observation in the moving-average wait time estimators.
+WAIT_TIME_EWMA_ALPHA = config('WAIT_TIME_EWMA_ALPHA', default=0.3, cast=float)
+
+# Ticket numbers each process reserves at a time; 1 hands them out strictly in join order.
+TICKET_BLOCK_SIZE = config('TICKET_BLOCK_SIZE', default=1, cast=int)
+
+# Code sequence IDs each process reserves at a time.
+CODE_BLOCK_SIZE = config('CODE_BLOCK_SIZE', default=100, cast=int)
+
+# Days completed participants are kept, unless their queue sets its own retention.
+PARTICIPANT_RETENTION_DAYS = config('PARTICIPANT_RETENTION_DAYS', default=30, cast=int)
+# Seconds between the maintenance runs of each server process; 0 leaves them to `run_maintenance`.
+MAINTENANCE_INTERVAL_SECONDS = config('MAINTENANCE_INTERVAL_SECONDS', default=3600, cast=int)
+# Seconds after which live views push a state no change event refreshed; 0 only pushes on events.
+LIVE_UPDATE_RESYNC_SECONDS = config('LIVE_UPDATE_RESYNC_SECONDS', default=60, cast=int)
+# Seconds without events after which Server-Sent Events streams send a heartbeat comment.
+SSE_HEARTBEAT_SECONDS = config('SSE_HEARTBEAT_SECONDS', default=15, cast=int)
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from manager.models import Queue, RestaurantQueue, BankQueue, HospitalQueue, Resource, Doctor, Table, Counter, UserProfile
+from manager.models import Queue, RestaurantQueue, BankQueue, HospitalQueue, Resource, Doctor, Table, Counter, UserProfile, \
+    QueueDailyStats, QueueLineLengthBucket, QueueDurationSketch, QueueSequence, \
+    QueueTicketSequence, CodeSequence
 # Register your models here.
 
 admin.site.register(Queue)
@@ -11,3 +13,9 @@ admin.site.register(Doctor)
 admin.site.register(Table)
 admin.site.register(Counter)
 admin.site.register(UserProfile)
+admin.site.register(QueueDailyStats)
+admin.site.register(QueueLineLengthBucket)
+admin.site.register(QueueDurationSketch)
+admin.site.register(QueueSequence)
+admin.site.register(QueueTicketSequence)
+admin.site.register(CodeSequence)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from participant.models import Participant
+
+
+class Command(BaseCommand):
+    """Link the participants served before per-resource statistics to the resource that served them."""
+    help = ("Fill the served-by resource of older participants from their resource or resource name, "
+            "so per-resource statistics include them. Run it once after upgrading.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Maximum number of participants updated per statement.")
+
+    def handle(self, *args, **options):
+        """Fill the missing resources in bounded chunks."""
+        updated = Participant.backfill_resource_served(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Linked {updated} participant(s) to the resource that served them."))
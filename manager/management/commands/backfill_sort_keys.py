@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from participant.models import Participant
+
+
+def legacy_positions() -> dict:
+    """
+    Read the old positions of the waiting participants without an ordering key.
+
+    :return: The positions keyed by participant ID, empty once the old `position` column is dropped.
+    """
+    table = Participant._meta.db_table
+    with connection.cursor() as cursor:
+        columns = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+        if 'position' not in columns:
+            return {}
+        quote = connection.ops.quote_name
+        cursor.execute(
+            f"SELECT {quote('id')}, {quote('position')} FROM {quote(table)} "
+            f"WHERE {quote('state')} = %s AND {quote('sort_key')} IS NULL AND {quote('position')} IS NOT NULL",
+            ['waiting'])
+        return dict(cursor.fetchall())
+
+
+class Command(BaseCommand):
+    """Give an ordering key to the participants waiting from before the waiting lists were keyed."""
+    help = ("Key the waiting participants that have no ordering key yet, ahead of those who joined since, "
+            "and advance the queue sequences past them. Run it once after upgrading.")
+
+    def handle(self, *args, **options):
+        """Rebalance every queue with unkeyed waiting participants, in their old order."""
+        changed = Participant.backfill_sort_keys(legacy_positions())
+        self.stdout.write(self.style.SUCCESS(f"Keyed {changed} waiting participant(s)."))
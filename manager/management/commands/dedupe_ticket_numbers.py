@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from participant.models import Participant
+
+
+def duplicate_ticket_numbers() -> list:
+    """
+    Find the participants sharing a ticket number with an earlier participant of the same queue and period.
+
+    Only the columns that predate the unique (queue, ticket_period, number)
+    constraint are required, so this can run before the migration adding it.
+
+    :return: (participant ID, queue ID, number) rows of every duplicate but the earliest of each number.
+    """
+    table = Participant._meta.db_table
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        columns = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+        period = quote('ticket_period') if 'ticket_period' in columns else "''"
+        cursor.execute(
+            f"SELECT {quote('id')}, {quote('queue_id')}, {period}, {quote('number')} FROM {quote(table)} "
+            f"ORDER BY {quote('queue_id')}, {period}, {quote('number')}, {quote('joined_at')}, {quote('id')}")
+        rows = cursor.fetchall()
+    seen, duplicates = set(), []
+    for pk, queue_id, ticket_period, number in rows:
+        if (queue_id, ticket_period, number) in seen:
+            duplicates.append((pk, queue_id, number))
+        seen.add((queue_id, ticket_period, number))
+    return duplicates
+
+
+class Command(BaseCommand):
+    """Check or repair the duplicate ticket numbers that older versions could hand out."""
+    help = ("Renumber participants whose ticket number repeats one of their queue, e.g. 'A001' to 'A001-2', "
+            "keeping the earliest. Run it before migrating to the unique (queue, ticket_period, number) "
+            "constraint, or with --check to find out whether that is needed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only report duplicates and exit with an error if any is found.")
+
+    def handle(self, *args, **options):
+        """Report the duplicates, then renumber them unless `--check` is given."""
+        duplicates = duplicate_ticket_numbers()
+        for pk, queue_id, number in duplicates:
+            self.stdout.write(f"Queue {queue_id}: participant {pk} repeats ticket {number}")
+        if options['check']:
+            if duplicates:
+                raise CommandError(f"{len(duplicates)} participant(s) repeat a ticket number.")
+            self.stdout.write(self.style.SUCCESS("No duplicate ticket numbers."))
+            return
+
+        table = Participant._meta.db_table
+        quote = connection.ops.quote_name
+        max_length = Participant._meta.get_field('number').max_length
+        with transaction.atomic(), connection.cursor() as cursor:
+            for pk, queue_id, number in duplicates:
+                cursor.execute(f"SELECT {quote('number')} FROM {quote(table)} WHERE {quote('queue_id')} = %s",
+                               [queue_id])
+                taken = {row[0] for row in cursor.fetchall()}
+                suffix = 2
+                while (renumbered := f"{number[:max_length - len(str(suffix)) - 1]}-{suffix}") in taken:
+                    suffix += 1
+                cursor.execute(f"UPDATE {quote(table)} SET {quote('number')} = %s WHERE {quote('id')} = %s",
+                               [renumbered, pk])
+        self.stdout.write(self.style.SUCCESS(f"Renumbered {len(duplicates)} participant(s)."))
@@ -0,0 +1,39 @@
+import csv
+import json
+from django.core.management.base import BaseCommand, CommandError
+from manager.models import Queue
+from manager.utils.category_handler import CategoryHandlerFactory
+
+
+class Command(BaseCommand):
+    """Pre-load many participants into a queue from a CSV or JSON file."""
+    help = "Import participants into a queue from a CSV file with a header row or a JSON list of objects."
+
+    def add_arguments(self, parser):
+        parser.add_argument('queue_id', type=int, help="The ID of the queue to join.")
+        parser.add_argument('path', help="The CSV or JSON file of participants, in joining order.")
+        parser.add_argument('--format', choices=['csv', 'json'],
+                            help="The file format (default is guessed from the file extension).")
+
+    def handle(self, *args, **options):
+        """Read the rows and create the participants with the handler of the queue's category."""
+        queue = Queue.objects.filter(pk=options['queue_id']).first()
+        if queue is None:
+            raise CommandError(f"Queue {options['queue_id']} does not exist.")
+        file_format = options['format'] or ('json' if options['path'].lower().endswith('.json') else 'csv')
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as file:
+                rows = json.load(file) if file_format == 'json' else list(csv.DictReader(file))
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {options['path']}: {e}")
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise CommandError("A JSON import must be a list of objects.")
+
+        handler = CategoryHandlerFactory.get_handler(queue.category)
+        try:
+            participants = handler.import_participants(handler.get_queue_object(queue.pk), rows)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {len(participants)} participant(s) into {queue.name}. "
+            f"Run send_pending_qr_emails to send their QR codes."))
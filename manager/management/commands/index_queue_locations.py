@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from manager.models import Queue
+from manager.utils.geo import geo_cell
+
+
+class Command(BaseCommand):
+    """Recompute the grid cell every queue is indexed by for nearby-queue lookups."""
+    help = "Recompute the geo grid cell of every queue from its latitude and longitude."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Number of queues updated per statement.")
+
+    def handle(self, *args, **options):
+        """Update the queues whose stored cell does not match their location."""
+        stale = []
+        for queue in Queue.objects.only('latitude', 'longitude', 'geo_cell').iterator():
+            cell = geo_cell(queue.latitude, queue.longitude)
+            if queue.geo_cell != cell:
+                queue.geo_cell = cell
+                stale.append(queue)
+        Queue.objects.bulk_update(stale, ['geo_cell'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {len(stale)} queue locations."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from manager.models import QueueLineLengthBucket
+
+
+class Command(BaseCommand):
+    """Apply the retention of the raw line length samples and the per-minute buckets."""
+    help = "Delete raw line length samples and per-minute buckets past their retention."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Recreate the buckets from the retained raw samples first.")
+        parser.add_argument('--queue', type=int, dest='queue_id',
+                            help="Only rebuild the buckets of this queue ID.")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Maximum number of rows deleted per statement.")
+
+    def handle(self, *args, **options):
+        """
+        Optionally rebuild the buckets, then prune old rows in bounded chunks.
+
+        Rebuilding replaces hourly buckets too, so history older than the raw
+        retention is lost for the rebuilt queues.
+        """
+        if options['rebuild']:
+            with transaction.atomic():
+                created = QueueLineLengthBucket.rebuild(options['queue_id'])
+            self.stdout.write(f"Rebuilt {created} line length buckets.")
+        samples, buckets = QueueLineLengthBucket.prune(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {samples} raw samples and {buckets} minute buckets."))
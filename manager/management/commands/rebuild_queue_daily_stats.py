@@ -0,0 +1,87 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from manager.models import Queue, QueueDailyStats, QueueDurationSketch
+from manager.utils.queue_statistics import participant_aggregates
+from participant.models import Participant
+
+
+def first_retained_day(queue_id=None):
+    """
+    Return the first join day whose participants are all still stored.
+
+    Retention deletes participants completed longer ago than their queue's
+    retention, so a participant who joined after that cutoff cannot have been
+    deleted yet. Without a queue, the shortest retention of any queue applies.
+
+    :param queue_id: The queue to check, or None for every queue.
+    :return: The first day the rollups can be rebuilt from participants.
+    :raises Queue.DoesNotExist: If the queue does not exist.
+    """
+    if queue_id:
+        days = Queue.objects.get(pk=queue_id).get_retention_days()
+    else:
+        overrides = Queue.objects.exclude(retention_days=None).aggregate(shortest=Min('retention_days'))
+        days = min(filter(None, [Queue.default_retention_days(), overrides['shortest']]))
+    return timezone.localdate(timezone.now() - timedelta(days=days)) + timedelta(days=1)
+
+
+class Command(BaseCommand):
+    """Rebuild the QueueDailyStats rollups and duration sketches from the participant table."""
+    help = "Rebuild the daily queue statistics rollups and duration sketches from the participants currently stored."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', type=int, dest='queue_id',
+                            help="Only rebuild the rollups of this queue ID.")
+        parser.add_argument('--days', type=int,
+                            help="Only rebuild the last N days (including today).")
+
+    def handle(self, *args, **options):
+        """
+        Replace the selected rollup rows with fresh aggregates, grouped by queue and local join day.
+
+        Only days whose participants are all still stored are rebuilt; older days
+        may have lost participants to retention cleanup, so their rollups and
+        sketches are the only record left and are kept as they are.
+        """
+        participants = Participant.objects.all()
+        rollups = QueueDailyStats.objects.all()
+        sketches = QueueDurationSketch.objects.all()
+        if options['queue_id']:
+            participants = participants.filter(queue_id=options['queue_id'])
+            rollups = rollups.filter(queue_id=options['queue_id'])
+            sketches = sketches.filter(queue_id=options['queue_id'])
+        try:
+            first_day = first_retained_day(options['queue_id'])
+        except Queue.DoesNotExist:
+            raise CommandError(f"Queue {options['queue_id']} does not exist.")
+        requested_day = timezone.localdate() - timedelta(days=options['days'] - 1) if options['days'] else None
+        if requested_day and requested_day >= first_day:
+            first_day = requested_day
+        else:
+            self.stdout.write(f"Keeping the rollups before {first_day}, as retention may have deleted participants.")
+        participants = participants.filter(joined_at__date__gte=first_day)
+        rollups = rollups.filter(day__gte=first_day)
+        sketches = sketches.filter(day__gte=first_day)
+
+        rows = (
+            participants
+            .annotate(day=TruncDate('joined_at', tzinfo=timezone.get_current_timezone()))
+            .values('queue_id', 'day')
+            .annotate(**participant_aggregates())
+            .order_by()
+        )
+        with transaction.atomic():
+            rollups.delete()
+            created = QueueDailyStats.objects.bulk_create([
+                QueueDailyStats(queue_id=row.pop('queue_id'), day=row.pop('day'),
+                                **{field: value or 0 for field, value in row.items()})
+                for row in rows
+            ], batch_size=500)
+            sketches.delete()
+            sketch_count = QueueDurationSketch.rebuild(participants)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(created)} daily rollups and {sketch_count} duration sketches."))
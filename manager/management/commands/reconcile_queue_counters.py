@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from manager.models import Queue
+
+
+class Command(BaseCommand):
+    """Check or repair the live participant counters stored on each queue."""
+    help = "Compare the live queue counters with the participants and repair any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', type=int, dest='queue_id',
+                            help="Only check this queue ID.")
+        parser.add_argument('--check', action='store_true',
+                            help="Only report drift and exit with an error if any is found.")
+
+    def handle(self, *args, **options):
+        """Report the drifted counters, then repair them unless `--check` is given."""
+        queue_ids = [options['queue_id']] if options['queue_id'] else None
+        if options['check']:
+            drift = Queue.check_live_counters(queue_ids)
+        else:
+            drift = Queue.reconcile_live_counters(queue_ids)
+
+        for queue_id, differences in drift.items():
+            details = ", ".join(f"{field} {stored} != {actual}"
+                                for field, (stored, actual) in differences.items())
+            self.stdout.write(f"Queue {queue_id}: {details}")
+        if options['check'] and drift:
+            raise CommandError(f"Live counters drifted on {len(drift)} queue(s).")
+        verb = "Checked" if options['check'] else "Reconciled"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} live counters, {len(drift)} queue(s) drifted."))
@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from manager.utils.maintenance import run_maintenance
+
+
+class Command(BaseCommand):
+    """Apply the retention of completed participants and line length history."""
+    help = "Delete completed participants and line length history past their retention, in bounded chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Maximum number of rows deleted per statement.")
+        parser.add_argument('--every', type=int, default=0, metavar='SECONDS',
+                            help="Keep running, this many seconds apart (default is to run once).")
+
+    def handle(self, *args, **options):
+        """Run the maintenance once, or forever with `--every`."""
+        while True:
+            deleted = run_maintenance(chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                "Deleted " + ", ".join(f"{count} {name.replace('_', ' ')}" for name, count in deleted.items()) + "."))
+            if options['every'] <= 0:
+                break
+            time.sleep(options['every'])
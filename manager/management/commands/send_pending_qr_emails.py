@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from manager.utils.send_email import send_pending_qr_emails
+
+
+class Command(BaseCommand):
+    """Send the QR code emails deferred by bulk imports."""
+    help = "Generate QR codes and send them to waiting participants who have an email but no QR code email yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', type=int, dest='queue_id',
+                            help="Only send for this queue ID.")
+        parser.add_argument('--limit', type=int, default=500,
+                            help="The maximum number of emails to send (default is 500).")
+
+    def handle(self, *args, **options):
+        """Send the pending emails and report how many were sent or failed."""
+        sent, failed = send_pending_qr_emails(options['queue_id'], options['limit'])
+        for participant, error in failed:
+            self.stderr.write(f"Participant {participant.pk}: {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {sent} QR code email(s), {len(failed)} failed."))
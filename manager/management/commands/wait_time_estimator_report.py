@@ -0,0 +1,38 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from manager.models import Queue
+from manager.utils.wait_time_estimators import replay_accuracy
+from participant.models import Participant
+
+
+class Command(BaseCommand):
+    """Compare how accurately each wait time estimator would have predicted past waits."""
+    help = "Replay the served participants of each queue through every wait time estimator."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', type=int, dest='queue_id',
+                            help="Only report on this queue ID.")
+        parser.add_argument('--days', type=int, default=30,
+                            help="Number of past days to replay.")
+
+    def handle(self, *args, **options):
+        """Print the number of predictions, MAE, RMSE and bias of each estimator per queue."""
+        since = timezone.localtime() - timedelta(days=options['days'])
+        queues = Queue.objects.order_by('pk')
+        if options['queue_id']:
+            queues = queues.filter(pk=options['queue_id'])
+        for queue in queues:
+            participants = Participant.objects.filter(
+                queue=queue, joined_at__gte=since, service_started_at__isnull=False
+            ).only('joined_at', 'service_started_at', 'service_completed_at')
+            report = replay_accuracy(participants.iterator(), queue.get_parallel_servers())
+            self.stdout.write(f"Queue {queue.pk} ({queue.name}), using {queue.wait_estimator}:")
+            for name, metrics in report.items():
+                if not metrics['count']:
+                    self.stdout.write(f"  {name}: no predictions")
+                    continue
+                self.stdout.write(
+                    f"  {name}: {metrics['count']} predictions, MAE {metrics['mae']:.1f} min, "
+                    f"RMSE {metrics['rmse']:.1f} min, bias {metrics['bias']:+.1f} min")
+        self.stdout.write(self.style.SUCCESS(f"Replayed {queues.count()} queue(s)."))
@@ -1,4 +1,11 @@
 from .queue import Queue, QueueLineLength
+from .queue_daily_stats import QueueDailyStats
+from .queue_line_length_bucket import QueueLineLengthBucket
+from .queue_duration_sketch import QueueDurationSketch
+from .queue_sequence import QueueSequence
+from .queue_ticket_sequence import QueueTicketSequence
+from .code_sequence import CodeSequence
 from .resource import Resource, Doctor, Counter, Table
 from .user_profile import UserProfile
 from .categorized_queues import RestaurantQueue, BankQueue, HospitalQueue
+from .channel_message import ChannelMessage, ChannelGroupMembership
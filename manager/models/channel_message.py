@@ -0,0 +1,69 @@
+from django.db import models
+from django.utils import timezone
+
+
+class ChannelMessage(models.Model):
+    """
+    A message waiting in a channel of the database channel layer.
+
+    Messages of process-specific channels (``<prefix>!<name>``) are filed under
+    the inbox of the process, the prefix up to the ``!``, so a process claims
+    the messages of all of its channels with one query.
+    """
+    channel = models.CharField(max_length=100)
+    inbox = models.CharField(max_length=100)
+    message = models.JSONField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['inbox', 'id']),
+            models.Index(fields=['channel', 'expires_at']),
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"Message to {self.channel}"
+
+    @classmethod
+    def prune(cls, now=None, chunk_size=1000):
+        """
+        Delete expired messages and group memberships, in chunks.
+
+        Receivers skip expired rows already; this only reclaims the space of
+        those nobody claimed, such as the messages of a stopped process.
+
+        :param now: The reference time (defaults to the current time).
+        :param chunk_size: The maximum number of rows deleted per statement.
+        :return: A tuple of the number of messages and group memberships deleted.
+        """
+        now = now or timezone.now()
+        deleted = []
+        for queryset in (
+            cls.objects.filter(expires_at__lte=now),
+            ChannelGroupMembership.objects.filter(expires_at__lte=now),
+        ):
+            count = 0
+            while True:
+                ids = list(queryset.values_list('id', flat=True)[:chunk_size])
+                if not ids:
+                    break
+                count += queryset.model.objects.filter(id__in=ids).delete()[0]
+            deleted.append(count)
+        return tuple(deleted)
+
+
+class ChannelGroupMembership(models.Model):
+    """A channel belonging to a group of the database channel layer, until it expires."""
+    group = models.CharField(max_length=100)
+    channel = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('group', 'channel')
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.channel} in {self.group}"
@@ -0,0 +1,30 @@
+from django.db import models
+from .queue_sequence import increment_counter
+
+
+class CodeSequence(models.Model):
+    """
+    Counter of the sequence IDs codes of a model are encoded from.
+
+    Each ID is encoded into a distinct code, so codes are unique by construction.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    last_value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def reserve(cls, name, count=1) -> range:
+        """
+        Take consecutive IDs from a sequence with one atomic increment.
+
+        :param name: The name of the sequence.
+        :param count: How many IDs to take (default is 1).
+        :return: The range of IDs taken.
+        """
+        last = increment_counter(cls, 'last_value', count, name=name)
+        if last is None:
+            cls.objects.get_or_create(name=name)
+            return cls.reserve(name, count)
+        return range(last - count + 1, last + 1)
+
+    def __str__(self):
+        return f"{self.name} codes ({self.last_value} issued)"
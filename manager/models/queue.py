@@ -1,4 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (Case, Count, ExpressionWrapper, F, FloatField,
+                              OuterRef, Q, Subquery, Sum, Value, When)
+from django.db.models.functions import Coalesce
+from django.core.cache import cache
+from django.apps import apps
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.utils.timezone import localtime
@@ -6,14 +11,33 @@ from datetime import datetime, timedelta
 from manager.utils.code_generator import generate_unique_code
 from manager.utils.aws_s3_storage import get_s3_base_url
 from manager.utils.helpers import format_duration
+from manager.utils.queue_statistics import QueueStatistics, start_of_day
 from django.core.exceptions import ValidationError
 from django.conf import settings
 import math
-from math import radians, sin, cos, sqrt, atan2
+from functools import reduce
+from operator import or_
+from manager.utils.geo import bounding_box, cells_in_box, geo_cell, haversine_km
+from manager.utils.wait_time_estimators import (ESTIMATOR_CHOICES, SERVICE, WAIT,
+                                                WaitTimeEstimatorFactory)
+
+FEATURED_QUEUES_CACHE_KEY = 'manager:featured_queues'
+DEFAULT_PARTICIPANT_RETENTION_DAYS = 30
+# Ticket prefix of participants without a service type under the per-service-type scheme.
+UNTYPED_TICKET_PREFIX = 'GEN'
 
 
 class Queue(models.Model):
     """Represents a queue created by a user."""
+    TICKET_SCHEME_CHOICES = [
+        ('sequential', 'Sequential'),
+        ('service_type', 'Prefix per service type'),
+    ]
+    TICKET_RESET_CHOICES = [
+        ('never', 'Never'),
+        ('daily', 'Daily'),
+        ('shift', 'Every shift'),
+    ]
     STATUS_CHOICES = [
         ('normal', 'Normal'),
         ('busy', 'Busy'),
@@ -46,13 +70,194 @@ class Queue(models.Model):
     longitude = models.FloatField()
     distance_from_user = models.FloatField(null=True, blank=True)
     tts_notifications_enabled = models.BooleanField(default=True)
+    geo_cell = models.CharField(max_length=20, blank=True, editable=False,
+                                db_index=True)
+    # Live counters, only ever written with F() updates by participant transitions.
+    waiting_count = models.IntegerField(default=0, editable=False)
+    serving_count = models.IntegerField(default=0, editable=False)
+    completed_today = models.IntegerField(default=0, editable=False)
+    completed_today_date = models.DateField(null=True, blank=True, editable=False)
+    wait_estimator = models.CharField(max_length=20, choices=ESTIMATOR_CHOICES,
+                                      default='cumulative')
+    ticket_scheme = models.CharField(max_length=20, choices=TICKET_SCHEME_CHOICES,
+                                     default='sequential')
+    ticket_reset = models.CharField(max_length=10, choices=TICKET_RESET_CHOICES,
+                                    default='never')
+    # Ticket prefixes keyed by service type, overriding the default of its first three letters.
+    ticket_prefixes = models.JSONField(default=dict, blank=True)
+    # Days completed participants are kept, the site's PARTICIPANT_RETENTION_DAYS if empty.
+    retention_days = models.PositiveIntegerField(null=True, blank=True)
+    # Learned state of every estimator keyed by name, only written by `observe_duration`.
+    wait_estimator_state = models.JSONField(default=dict, blank=True, editable=False)
+
+    LIVE_COUNTER_FIELDS = ('waiting_count', 'serving_count', 'completed_today',
+                           'completed_today_date')
+    # Fields written with targeted updates that full saves must not overwrite.
+    UNSAVED_FIELDS = LIVE_COUNTER_FIELDS + ('wait_estimator_state',)
+    LIVE_COUNTER_STATES = {'waiting': 'waiting_count', 'serving': 'serving_count'}
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude']),
+        ]
 
     def save(self, *args, **kwargs):
         """Generate a unique ticket code for the participant if not already."""
         if not self.pk:
             self.code = generate_unique_code(Queue)
+        if self.latitude is not None and self.longitude is not None:
+            self.geo_cell = geo_cell(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geo_cell'}
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write the live counters back from a possibly stale instance.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.UNSAVED_FIELDS
+            ]
         super().save(*args, **kwargs)
 
+    def delete(self, *args, **kwargs):
+        """Delete the queue and drop it from the featured queue leaderboard."""
+        result = super().delete(*args, **kwargs)
+        self.invalidate_featured_queues()
+        return result
+
+    @staticmethod
+    def live_counter_key(participant):
+        """
+        Describe what a participant contributes to the live counters of its queue.
+
+        :param participant: The participant to describe.
+        :return: A tuple of the queue ID, the state and the local completion day
+                 (None unless the participant is completed).
+        """
+        completed_on = None
+        if participant.state == 'completed' and participant.service_completed_at:
+            completed_on = timezone.localdate(participant.service_completed_at)
+        return participant.queue_id, participant.state, completed_on
+
+    @classmethod
+    def update_live_counters(cls, previous, current, count=1):
+        """
+        Apply a participant's change to the live counters with atomic `F()` updates.
+
+        :param previous: The participant's `live_counter_key` before the change,
+                         or None for a new participant.
+        :param current: The key after the change, or None for a deleted participant.
+        :param count: How many participants made the same change (default is 1).
+        """
+        if previous == current:
+            return
+        today = timezone.localdate()
+        updates = {}
+        for key, delta in ((previous, -count), (current, count)):
+            if key is None:
+                continue
+            queue_id, state, completed_on = key
+            queue_updates = updates.setdefault(queue_id, {})
+            if state in cls.LIVE_COUNTER_STATES:
+                field = cls.LIVE_COUNTER_STATES[state]
+                queue_updates[field] = queue_updates.get(field, F(field)) + delta
+            if completed_on == today:
+                queue_updates['completed_today'] = Case(
+                    When(completed_today_date=today, then=F('completed_today') + delta),
+                    default=Value(max(delta, 0)),
+                )
+                queue_updates['completed_today_date'] = today
+        for queue_id, queue_updates in updates.items():
+            if queue_updates:
+                Queue.objects.filter(pk=queue_id).update(**queue_updates)
+
+    def get_live_counters(self) -> dict:
+        """
+        Read the live counters of this queue with a primary key lookup.
+
+        :return: A dictionary with the 'waiting', 'serving' and 'completed_today' counts.
+        """
+        self.refresh_from_db(fields=self.LIVE_COUNTER_FIELDS)
+        return {
+            'waiting': self.waiting_count,
+            'serving': self.serving_count,
+            'completed_today': self.completed_today
+            if self.completed_today_date == timezone.localdate() else 0,
+        }
+
+    @classmethod
+    def count_live_counters(cls, queue_ids=None) -> dict:
+        """
+        Count the live counters from the participants, grouped by queue.
+
+        :param queue_ids: Restrict the count to these queues (optional).
+        :return: A dictionary of counter values keyed by queue ID; queues without
+                 participants are omitted.
+        """
+        Participant = apps.get_model('participant', 'Participant')  # Lazy load
+        today = timezone.localdate()
+        participants = Participant.objects.all()
+        if queue_ids is not None:
+            participants = participants.filter(queue_id__in=queue_ids)
+        rows = participants.values('queue_id').annotate(
+            waiting_count=Count('id', filter=Q(state='waiting')),
+            serving_count=Count('id', filter=Q(state='serving')),
+            completed_today=Count('id', filter=Q(
+                state='completed',
+                service_completed_at__gte=start_of_day(today),
+                service_completed_at__lt=start_of_day(today + timedelta(days=1)),
+            )),
+        ).order_by()
+        return {row.pop('queue_id'): row for row in rows}
+
+    @classmethod
+    def check_live_counters(cls, queue_ids=None) -> dict:
+        """
+        Compare the stored live counters against the participants.
+
+        :param queue_ids: Restrict the check to these queues (optional).
+        :return: A dictionary keyed by queue ID of the drifted counters, each
+                 mapped to a (stored, actual) tuple.
+        """
+        today = timezone.localdate()
+        actual = cls.count_live_counters(queue_ids)
+        queues = cls.objects.all()
+        if queue_ids is not None:
+            queues = queues.filter(pk__in=queue_ids)
+        drift = {}
+        for queue in queues.only(*cls.LIVE_COUNTER_FIELDS):
+            stored = {
+                'waiting_count': queue.waiting_count,
+                'serving_count': queue.serving_count,
+                'completed_today': queue.completed_today
+                if queue.completed_today_date == today else 0,
+            }
+            expected = actual.get(queue.pk, dict.fromkeys(stored, 0))
+            differences = {field: (stored[field], expected[field])
+                           for field in stored if stored[field] != expected[field]}
+            if differences:
+                drift[queue.pk] = differences
+        return drift
+
+    @classmethod
+    def reconcile_live_counters(cls, queue_ids=None) -> dict:
+        """
+        Overwrite drifted live counters with the values counted from the participants.
+
+        Transitions committed between the count and the write are lost, so run
+        this while the queues are quiet, or again afterwards.
+
+        :param queue_ids: Restrict the reconciliation to these queues (optional).
+        :return: The drift that was corrected, as returned by `check_live_counters`.
+        """
+        today = timezone.localdate()
+        drift = cls.check_live_counters(queue_ids)
+        for queue_id, differences in drift.items():
+            values = {field: actual for field, (stored, actual) in differences.items()}
+            if 'completed_today' in values:
+                values['completed_today_date'] = today
+            cls.objects.filter(pk=queue_id).update(**values)
+        return drift
+
     def is_queue_closed(self):
         """
         Determine if the queue is closed based on the `is_closed` flag or current time,
@@ -108,57 +313,100 @@ class Queue(models.Model):
 
         :return: A float representing the estimated average wait time for the new participant.
         """
-        return self.estimated_wait_time_per_turn * (self.get_number_waiting_now() + 1)
+        return self.get_estimated_wait_time_per_turn() * (self.get_number_waiting_now() + 1)
+
+    @staticmethod
+    def get_top_featured_queues(limit=None):
+        """
+        Retrieve the top featured queues based on the Queue Length / Max Capacity * 100 ratio.
+
+        The ratio is computed in a single query from the live waiting counter and
+        the summed capacity of each queue's resources. Queues nobody is waiting in
+        are left out, and queues without capacity rank with a ratio of 0.
+
+        :param limit: The number of queues to return (defaults to `FEATURED_QUEUES_COUNT`).
+        :return: A list of the top queues sorted by their queue-to-capacity ratio in descending order.
+        """
+        Resource = apps.get_model('manager', 'Resource')  # Lazy load
+        if limit is None:
+            limit = getattr(settings, 'FEATURED_QUEUES_COUNT', 10)
+        capacity = Resource.objects.filter(queue=OuterRef('pk')).order_by().values(
+            'queue').annotate(total=Sum('capacity')).values('total')
+        queues = Queue.objects.filter(waiting_count__gt=0).annotate(
+            max_capacity=Coalesce(Subquery(capacity), 0),
+        ).annotate(
+            ratio=Case(
+                When(max_capacity__gt=0,
+                     then=ExpressionWrapper(F('waiting_count') * 100.0 / F('max_capacity'),
+                                            output_field=FloatField())),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+        ).order_by('-ratio', 'pk')
+        return list(queues[:limit])
 
     @staticmethod
-    def get_top_featured_queues():
+    def get_cached_featured_queues():
         """
-        Retrieve the top 10 featured queues based on the Queue Length / Max Capacity * 100 ratio.
+        Return the featured queue leaderboard from the cache, computing it when missing.
 
-        :return: A list of the top 10 queues sorted by their queue-to-capacity ratio in descending order.
+        The leaderboard is recomputed once it expires after `FEATURED_QUEUES_CACHE_SECONDS`
+        rather than on every waiting count change, which on a busy site would
+        happen on almost every home page request.
+
+        :return: A list of the top featured queues.
         """
-        queue_ratios = []
-        for queue in Queue.objects.all():
-            num_participants = queue.get_number_waiting_now()
-            if num_participants == 0:
-                continue
-            max_capacity = sum(
-                resource.capacity for resource in queue.resource_set.all())
-            if max_capacity == 0:
-                ratio = 0
-            else:
-                ratio = (num_participants / max_capacity) * 100
-            queue_ratios.append((queue, ratio))
-        queue_ratios.sort(key=lambda x: x[1], reverse=True)
-        top_10_queues = [queue for queue, ratio in queue_ratios[:10]]
-        return top_10_queues
+        return cache.get_or_set(
+            FEATURED_QUEUES_CACHE_KEY, Queue.get_top_featured_queues,
+            getattr(settings, 'FEATURED_QUEUES_CACHE_SECONDS', 30))
 
     @staticmethod
-    def get_nearby_queues(user_lat, user_lon, radius_km=2):
+    def invalidate_featured_queues():
+        """Drop the cached featured queue leaderboard."""
+        cache.delete(FEATURED_QUEUES_CACHE_KEY)
+
+    @staticmethod
+    def get_nearby_queues(user_lat, user_lon, radius_km=2, limit=None):
         """
-        Retrieve queues within a specified radius of the user's location and store their distance.
+        Retrieve queues within a specified radius of the user's location, nearest first.
+
+        Candidates are preselected in SQL by their grid cell, if indexed, and a
+        bounding box, then the exact distance is computed for the candidates only. The distance
+        is set on `distance_from_user` of the returned instances but never saved.
 
         :param user_lat: Latitude of the user's location.
         :param user_lon: Longitude of the user's location.
         :param radius_km: The radius within which to find nearby queues, in kilometers (default is 2 km).
-        :return: A list of queues within the specified radius from the user's location.
-        """
+        :param limit: The maximum number of queues to return (optional).
+        :return: A list of queues within the specified radius, sorted by distance.
+        """
+        latitude_range, longitude_ranges = bounding_box(user_lat, user_lon, radius_km)
+        in_box = Q(latitude__range=latitude_range)
+        in_box &= reduce(or_, (Q(longitude__range=longitude_range)
+                               for longitude_range in longitude_ranges))
+        cells = cells_in_box(latitude_range, longitude_ranges)
+        if cells is not None:
+            # Queues saved before cells existed have none until `index_queue_locations` runs.
+            in_box &= Q(geo_cell__in=cells) | Q(geo_cell='')
+
         nearby_queues = []
-        for queue in Queue.objects.all():
-            queue_lat, queue_lon = radians(queue.latitude), radians(
-                queue.longitude)
-            user_lat_rad, user_lon_rad = radians(user_lat), radians(user_lon)
-            dlat = queue_lat - user_lat_rad
-            dlon = queue_lon - user_lon_rad
-            a = sin(dlat / 2) ** 2 + cos(user_lat_rad) * cos(queue_lat) * sin(
-                dlon / 2) ** 2
-            c = 2 * atan2(sqrt(a), sqrt(1 - a))
-            distance_km = 6371 * c
-            queue.distance_from_user = distance_km
-            queue.save()
-            if distance_km <= radius_km:
+        for queue in Queue.objects.filter(in_box):
+            queue.distance_from_user = haversine_km(user_lat, user_lon,
+                                                    queue.latitude, queue.longitude)
+            if queue.distance_from_user <= radius_km:
                 nearby_queues.append(queue)
-        return nearby_queues
+        nearby_queues.sort(key=lambda queue: queue.distance_from_user)
+        return nearby_queues[:limit] if limit is not None else nearby_queues
+
+    def set_distance_from(self, user_lat, user_lon):
+        """
+        Set `distance_from_user` to the distance from a location, without saving.
+
+        :param user_lat: Latitude of the user's location.
+        :param user_lon: Longitude of the user's location.
+        """
+        self.distance_from_user = haversine_km(user_lat, user_lon,
+                                               self.latitude, self.longitude)
 
     @property
     def formatted_distance(self):
@@ -190,6 +438,24 @@ class Queue(models.Model):
         if not (-180 <= self.longitude <= 180):
             raise ValidationError("Longitude must be between -180 and 180.")
 
+        for service_type, prefix in (self.ticket_prefixes or {}).items():
+            if not self.is_valid_ticket_prefix(prefix):
+                raise ValidationError(
+                    f"The ticket prefix of {service_type} must be two or three letters, not {prefix!r}.")
+
+    @staticmethod
+    def is_valid_ticket_prefix(prefix) -> bool:
+        """
+        Check that a ticket prefix fits its series and cannot produce another series' numbers.
+
+        Prefixes are two or three letters, so prefixed numbers never look like the
+        single letter ones of sequential numbering, nor like those of another prefix.
+
+        :param prefix: The prefix to check.
+        :return: True if the prefix can be used.
+        """
+        return isinstance(prefix, str) and 2 <= len(prefix) <= 3 and prefix.isascii() and prefix.isalpha()
+
     def has_resources(self):
         """
         Determine if the queue has resources based on its category.
@@ -215,12 +481,79 @@ class Queue(models.Model):
 
         :param time_taken: The time (in minutes) taken for the current turn.
         """
-        total_time = (
-                             self.estimated_wait_time_per_turn * self.completed_participants_count) + time_taken
-        self.completed_participants_count += 1
-        self.estimated_wait_time_per_turn = math.ceil(
-            total_time / self.completed_participants_count)
-        self.save()
+        self.observe_duration(WAIT, time_taken)
+
+    def observe_service_duration(self, serve_time: int) -> None:
+        """
+        Teach the wait time estimators how long a service took.
+
+        :param serve_time: The time (in minutes) taken to serve the most recent participant.
+        """
+        self.observe_duration(SERVICE, serve_time)
+
+    def observe_duration(self, kind, minutes, at=None) -> None:
+        """
+        Feed a wait or service duration to every wait time estimator.
+
+        All estimators learn from every observation so the queue can switch
+        between them without losing history.
+
+        :param kind: WAIT or SERVICE.
+        :param minutes: The observed duration in minutes.
+        :param at: When the observation was made (default is now).
+        """
+        self.observe_durations([(kind, minutes)], at)
+
+    def observe_durations(self, observations, at=None) -> None:
+        """
+        Feed several wait or service durations to every wait time estimator at once.
+
+        The queue row is locked while the state is updated so concurrent
+        observations are not lost.
+
+        :param observations: (kind, minutes) pairs, in the order they were made.
+        :param at: When the observations were made (default is now).
+        """
+        if not observations:
+            return
+        at = at or timezone.localtime()
+        with transaction.atomic():
+            state = Queue.objects.select_for_update().values_list(
+                'wait_estimator_state', flat=True).get(pk=self.pk) or {}
+            for name, estimator in WaitTimeEstimatorFactory.all_estimators().items():
+                for kind, minutes in observations:
+                    estimator.observe(state.setdefault(name, {}), kind, minutes, at)
+            self.wait_estimator_state = state
+            self.estimated_wait_time_per_turn = self.get_estimated_wait_time_per_turn(at)
+            Queue.objects.filter(pk=self.pk).update(
+                wait_estimator_state=state,
+                estimated_wait_time_per_turn=self.estimated_wait_time_per_turn)
+
+    def get_parallel_servers(self) -> int:
+        """
+        Return the number of resources able to serve participants in parallel.
+
+        :return: The number of resources that are not unavailable, at least 1.
+        """
+        if not self.has_resources():
+            return 1
+        return max(self.resource_set.exclude(status='unavailable').count(), 1)
+
+    def get_estimated_wait_time_per_turn(self, at=None) -> int:
+        """
+        Estimate the wait time per turn with the queue's selected estimator.
+
+        :param at: The time the estimate is for (default is now).
+        :return: The estimated minutes per turn, or the stored `estimated_wait_time_per_turn`
+                 if the estimator has not learned anything yet.
+        """
+        estimator = WaitTimeEstimatorFactory.get_estimator(self.wait_estimator)
+        servers = self.get_parallel_servers() if estimator.uses_servers else 1
+        estimate = estimator.estimate(self.wait_estimator_state.get(estimator.name, {}),
+                                      at or timezone.localtime(), servers)
+        if estimate is None:
+            return self.estimated_wait_time_per_turn
+        return math.ceil(round(estimate, 2))
 
     def calculate_average_service_duration(self, serve_time: int):
         """
@@ -239,6 +572,56 @@ class Queue(models.Model):
             self.completed_participants_count += 1
         self.save()
 
+    @staticmethod
+    def default_retention_days() -> int:
+        """Return the site-wide number of days completed participants are kept."""
+        return getattr(settings, 'PARTICIPANT_RETENTION_DAYS', DEFAULT_PARTICIPANT_RETENTION_DAYS)
+
+    def get_retention_days(self) -> int:
+        """
+        Return how many days the completed participants of this queue are kept.
+
+        :return: The queue's own retention, or the site-wide default if it has none.
+        """
+        return self.retention_days or self.default_retention_days()
+
+    def get_ticket_prefix(self, service_type=None) -> str:
+        """
+        Return the ticket prefix of a service type under the queue's numbering scheme.
+
+        Service types without a valid prefix of their own use the first three
+        letters of their name, and participants without one `UNTYPED_TICKET_PREFIX`.
+
+        :param service_type: The participant's service type (optional).
+        :return: The prefix, or an empty string for sequential numbering.
+        """
+        if self.ticket_scheme != 'service_type':
+            return ''
+        prefix = (self.ticket_prefixes or {}).get(service_type)
+        if self.is_valid_ticket_prefix(prefix):
+            return prefix.upper()
+        prefix = ''.join(char for char in service_type or '' if char.isascii() and char.isalpha())[:3].upper()
+        return prefix if self.is_valid_ticket_prefix(prefix) else UNTYPED_TICKET_PREFIX
+
+    def get_ticket_period(self, at=None) -> str:
+        """
+        Return the numbering period ticket numbers restart from.
+
+        Shifts start at the queue's opening time; queues without one reset daily.
+
+        :param at: The time to find the period of (default is now).
+        :return: An empty string if numbers never reset, otherwise a key of the period's start.
+        """
+        if self.ticket_reset == 'never':
+            return ''
+        at = timezone.localtime(at)
+        if self.ticket_reset == 'shift' and self.open_time:
+            start = datetime.combine(at.date(), self.open_time)
+            if at.time() < self.open_time:
+                start -= timedelta(days=1)
+            return start.strftime('%Y-%m-%dT%H:%M')
+        return at.date().isoformat()
+
     def get_participants(self) -> models.QuerySet:
         """
         Return a queryset of all participants in this queue, ordered by their join time.
@@ -247,18 +630,17 @@ class Queue(models.Model):
         """
         return self.participant_set.all().order_by('joined_at')
 
-    def update_participants_positions(self):
+    def update_participants_positions(self) -> int:
         """
-        Update the positions of all participants in the queue who are in the 'waiting' state,
-        ordered by their join time.
+        Spread the ordering keys of the waiting participants evenly, keeping their order.
 
-        :return: None
+        Positions are ranks over the ordering keys, so this is never needed for
+        joins, leaves or moves; it only restores the gaps between keys.
+
+        :return: The number of participants whose ordering key changed.
         """
-        participants = self.participant_set.filter(state='waiting').order_by(
-            'joined_at')
-        for index, participant in enumerate(participants, start=1):
-            participant.position = index
-            participant.save(update_fields=["position"])
+        Participant = apps.get_model('participant', 'Participant')  # Lazy load
+        return Participant.rebalance_sort_keys(self.pk)
 
     def get_number_of_participants(self) -> int:
         """
@@ -266,8 +648,7 @@ class Queue(models.Model):
 
         :return: The number of active participants in the queue.
         """
-        return self.participant_set.exclude(
-            state__in=['cancelled', 'removed']).count()
+        return self.get_statistics().active
 
     def get_participants_today(self) -> int:
         """
@@ -346,6 +727,20 @@ class Queue(models.Model):
         """
         return f"{settings.SITE_DOMAIN}welcome/{self.code}/"
 
+    def get_statistics(self, start_date=None, end_date=None, use_rollups=False):
+        """
+        Return the statistics engine for this queue, optionally within a date range.
+
+        The engine computes every metric with a single aggregation query, so callers
+        needing several metrics should reuse the returned instance.
+
+        :param start_date: The start date for the filter (optional).
+        :param end_date: The end date for the filter (optional).
+        :param use_rollups: Whether whole past days are read from the daily rollups (optional).
+        :return: A `QueueStatistics` instance for the given date range.
+        """
+        return QueueStatistics(self, start_date, end_date, use_rollups=use_rollups)
+
     def get_number_of_participants_by_date(self, start_date, end_date):
         """
         Return the number of participants within a given date range.
@@ -354,24 +749,21 @@ class Queue(models.Model):
         :param end_date: The end date for the range.
         :return: The count of participants who joined within the specified date range.
         """
-        queryset = self.participant_set.all()
-        if start_date and end_date:
-            queryset = self.participant_set.filter(
-                joined_at__range=(start_date, end_date))
-        return queryset.count()
+        return self.get_statistics(start_date, end_date).total
 
     def get_number_waiting_now(self, start_date=None, end_date=None):
         """
         Return the number of participants currently waiting, optionally within a date range.
 
+        Without a date range the live counter is read instead of counting participants.
+
         :param start_date: The start date for the filter (optional).
         :param end_date: The end date for the filter (optional).
         :return: The count of participants who are currently waiting.
         """
-        queryset = self.participant_set.filter(state='waiting')
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
-        return queryset.count()
+        if start_date is None and end_date is None:
+            return self.get_live_counters()['waiting']
+        return self.get_statistics(start_date, end_date).waiting
 
     def get_number_completed_now(self):
         """
@@ -379,20 +771,21 @@ class Queue(models.Model):
 
         :return: The count of participants with the 'completed' status.
         """
-        return self.participant_set.filter(state='completed').count()
+        return self.get_statistics().served
 
     def get_number_serving_now(self, start_date=None, end_date=None):
         """
         Return the number of participants currently serving, optionally within a date range.
 
+        Without a date range the live counter is read instead of counting participants.
+
         :param start_date: The start date for the filter (optional).
         :param end_date: The end date for the filter (optional).
         :return: The count of participants with the 'serving' status.
         """
-        queryset = self.participant_set.filter(state='serving')
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
-        return queryset.count()
+        if start_date is None and end_date is None:
+            return self.get_live_counters()['serving']
+        return self.get_statistics(start_date, end_date).serving
 
     def get_number_served(self, start_date=None, end_date=None):
         """
@@ -402,10 +795,7 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The count of participants with the 'completed' status.
         """
-        queryset = self.participant_set.filter(state='completed')
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
-        return queryset.count()
+        return self.get_statistics(start_date, end_date).served
 
     def get_number_created_by_guest(self, start_date=None, end_date=None):
         """
@@ -415,10 +805,7 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The count of participants who joined as 'guest'.
         """
-        queryset = self.participant_set.filter(created_by='guest')
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
-        return queryset.count()
+        return self.get_statistics(start_date, end_date).created_by_guest
 
     def get_number_created_by_staff(self, start_date=None, end_date=None):
         """
@@ -428,10 +815,7 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The count of participants who joined as 'staff'.
         """
-        queryset = self.participant_set.filter(created_by='staff')
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
-        return queryset.count()
+        return self.get_statistics(start_date, end_date).created_by_staff
 
     def get_number_dropoff(self, start_date=None, end_date=None):
         """
@@ -441,11 +825,7 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The count of participants who dropped off.
         """
-        queryset = self.participant_set.filter(
-            state__in=['cancelled', 'no_show'])
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
-        return queryset.count()
+        return self.get_statistics(start_date, end_date).dropoff
 
     def get_number_unhandled(self, start_date=None, end_date=None):
         """
@@ -455,9 +835,7 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The total count of unhandled participants (waiting + serving).
         """
-        waiting_now = self.get_number_waiting_now(start_date, end_date)
-        serving_now = self.get_number_serving_now(start_date, end_date)
-        return waiting_now + serving_now
+        return self.get_statistics(start_date, end_date).unhandled
 
     def get_guest_percentage(self, start_date=None, end_date=None):
         """
@@ -467,11 +845,7 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The percentage of participants who joined as guests.
         """
-        num_participants = self.get_number_of_participants_by_date(start_date,
-                                                                   end_date)
-        guest_count = self.get_number_created_by_guest(start_date, end_date)
-        return round((guest_count / num_participants) * 100,
-                     2) if num_participants else 0
+        return self.get_statistics(start_date, end_date).guest_percentage
 
     def get_staff_percentage(self, start_date=None, end_date=None):
         """
@@ -481,11 +855,7 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The percentage of participants who joined as staff.
         """
-        num_participants = self.get_number_of_participants_by_date(start_date,
-                                                                   end_date)
-        staff_count = self.get_number_created_by_staff(start_date, end_date)
-        return round((staff_count / num_participants) * 100,
-                     2) if num_participants else 0
+        return self.get_statistics(start_date, end_date).staff_percentage
 
     def get_served_percentage(self, start_date=None, end_date=None):
         """
@@ -495,11 +865,7 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The percentage of participants who have been served.
         """
-        num_participants = self.get_number_of_participants_by_date(start_date,
-                                                                   end_date)
-        served_count = self.get_number_served(start_date, end_date)
-        return round((served_count / num_participants) * 100,
-                     2) if num_participants else 0
+        return self.get_statistics(start_date, end_date).served_percentage
 
     def get_dropoff_percentage(self, start_date=None, end_date=None):
         """
@@ -509,11 +875,7 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The percentage of participants who dropped off.
         """
-        num_participants = self.get_number_of_participants_by_date(start_date,
-                                                                   end_date)
-        dropoff_count = self.get_number_dropoff(start_date, end_date)
-        return round((dropoff_count / num_participants) * 100,
-                     2) if num_participants else 0
+        return self.get_statistics(start_date, end_date).dropoff_percentage
 
     def get_unhandled_percentage(self, start_date=None, end_date=None):
         """
@@ -523,11 +885,7 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The percentage of unhandled participants.
         """
-        num_participants = self.get_number_of_participants_by_date(start_date,
-                                                                   end_date)
-        unhandled_count = self.get_number_unhandled(start_date, end_date)
-        return round((unhandled_count / num_participants) * 100,
-                     2) if num_participants else 0
+        return self.get_statistics(start_date, end_date).unhandled_percentage
 
     def get_cancelled_percentage(self, start_date=None, end_date=None) -> float:
         """
@@ -537,7 +895,7 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The percentage of participants with the 'cancelled' state.
         """
-        return self._get_substate_percentage('cancelled', start_date, end_date)
+        return self.get_statistics(start_date, end_date).cancelled_percentage
 
     def get_no_show_percentage(self, start_date=None, end_date=None) -> float:
         """
@@ -547,24 +905,7 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The percentage of participants with the 'no_show' state.
         """
-        return self._get_substate_percentage('no_show', start_date, end_date)
-
-    def _get_substate_percentage(self, state: str, start_date=None, end_date=None) -> float:
-        """
-        Compute the percentage of participants in a specific state (e.g., 'cancelled', 'no_show')
-        within the given date range.
-
-        :param state: The state to filter participants by (e.g., 'cancelled', 'no_show').
-        :param start_date: The start date for the filter (optional).
-        :param end_date: The end date for the filter (optional).
-        :return: The percentage of participants in the specified state.
-        """
-        dropoff_total = self.get_number_dropoff(start_date, end_date)
-        queryset = self.participant_set.filter(state=state)
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
-        return round((queryset.count() / dropoff_total) * 100,
-                     2) if dropoff_total else 0
+        return self.get_statistics(start_date, end_date).no_show_percentage
 
     def get_average_waiting_time(self, start_date=None, end_date=None):
         """
@@ -574,17 +915,8 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The average waiting time formatted as a string.
         """
-        queryset = self.participant_set.exclude(state='waiting')
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
-
-        waiting_times = [
-            p.get_wait_time() for p in queryset if
-            p.get_wait_time() is not None
-        ]
-        average_wait_time = math.ceil(
-            sum(waiting_times) / len(waiting_times)) if waiting_times else 0
-        return format_duration(average_wait_time)
+        return format_duration(
+            self.get_statistics(start_date, end_date).average_waiting_time)
 
     def get_max_waiting_time(self, start_date=None, end_date=None):
         """
@@ -594,16 +926,8 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The maximum waiting time formatted as a string.
         """
-        queryset = self.participant_set.exclude(state='waiting')
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
-
-        waiting_times = [
-            p.get_wait_time() for p in queryset if
-            p.get_wait_time() is not None
-        ]
-        max_wait_time = max(waiting_times) if waiting_times else 0
-        return format_duration(max_wait_time)
+        return format_duration(
+            self.get_statistics(start_date, end_date).max_waiting_time)
 
     def get_average_service_duration(self, start_date=None, end_date=None):
         """
@@ -613,17 +937,8 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The average service duration formatted as a string.
         """
-        queryset = self.participant_set.filter(state='completed')
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
-
-        service_durations = [
-            p.get_service_duration() for p in queryset if
-            p.get_service_duration() is not None
-        ]
-        average_service_time = math.ceil(sum(service_durations) / len(
-            service_durations)) if service_durations else 0
-        return format_duration(average_service_time)
+        return format_duration(
+            self.get_statistics(start_date, end_date).average_service_duration)
 
     def get_max_service_duration(self, start_date=None, end_date=None):
         """
@@ -633,25 +948,22 @@ class Queue(models.Model):
         :param end_date: The end date for the filter (optional).
         :return: The maximum service duration formatted as a string.
         """
-        queryset = self.participant_set.filter(state='completed')
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
-
-        service_durations = [
-            p.get_service_duration() for p in queryset if
-            p.get_service_duration() is not None
-        ]
-        max_service_time = max(service_durations) if service_durations else 0
-        return format_duration(max_service_time)
+        return format_duration(
+            self.get_statistics(start_date, end_date).max_service_duration)
 
     def record_line_length(self):
         """
         Records the current line length when a participant joins the queue.
 
+        The sample is stored raw and added to the downsampled buckets the
+        statistics are read from.
+
         :return: None
         """
+        QueueLineLengthBucket = apps.get_model('manager', 'QueueLineLengthBucket')  # Lazy load
         line_length = self.participant_set.filter(state='waiting').count()
-        QueueLineLength.objects.create(queue=self, line_length=line_length)
+        sample = QueueLineLength.objects.create(queue=self, line_length=line_length)
+        QueueLineLengthBucket.record(self, line_length, sample.timestamp)
 
     def get_peak_line_length(self, start_date=None, end_date=None):
         """
@@ -661,12 +973,7 @@ class Queue(models.Model):
         :param end_date: The end date for filtering (optional).
         :return: The peak line length, or 0 if no records are found.
         """
-        queryset = QueueLineLength.objects.filter(queue=self)
-        if start_date and end_date:
-            queryset = queryset.filter(timestamp__range=(start_date, end_date))
-
-        peak_record = queryset.order_by('-line_length').first()
-        return peak_record.line_length if peak_record else 0
+        return self.get_statistics(start_date, end_date).peak_line_length
 
     def get_avg_line_length(self, start_date=None, end_date=None):
         """
@@ -676,15 +983,20 @@ class Queue(models.Model):
         :param end_date: The end date for filtering (optional).
         :return: The average line length, or 0 if no records are found.
         """
-        queryset = QueueLineLength.objects.filter(queue=self)
-        if start_date and end_date:
-            queryset = queryset.filter(timestamp__range=(start_date, end_date))
+        return self.get_statistics(start_date, end_date).avg_line_length
+
+    def get_time_weighted_line_length(self, start_date=None, end_date=None):
+        """
+        Calculate the line length averaged over time within a date range.
+
+        Unlike `get_avg_line_length`, each recorded length is weighted by how
+        long it lasted until the next sample.
 
-        total_records = queryset.count()
-        if total_records == 0:
-            return 0
-        total_line_length = sum(record.line_length for record in queryset)
-        return math.ceil(total_line_length / total_records)
+        :param start_date: The start date for filtering (optional).
+        :param end_date: The end date for filtering (optional).
+        :return: The time-weighted average line length, or 0 if no records are found.
+        """
+        return self.get_statistics(start_date, end_date).time_weighted_line_length
 
     def __str__(self) -> str:
         """Return a string representation of the queue."""
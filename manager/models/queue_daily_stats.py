@@ -0,0 +1,138 @@
+from collections import defaultdict
+from django.db import models
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .queue import Queue
+
+
+class QueueDailyStats(models.Model):
+    """
+    Daily rollup of the participants who joined a queue on a given local day.
+
+    Counters are kept in step with participant state transitions, so historical
+    statistics can be read per day instead of scanning every participant.
+    Durations are stored in whole minutes.
+    """
+    STATE_FIELDS = ('waiting', 'serving', 'completed', 'cancelled', 'no_show')
+    COUNTER_FIELDS = ('joined',) + STATE_FIELDS + (
+        'created_by_guest', 'created_by_staff',
+        'wait_count', 'wait_total', 'wait_max',
+        'service_count', 'service_total', 'service_max',
+    )
+    MAXIMUM_FIELDS = ('wait_max', 'service_max')
+
+    queue = models.ForeignKey(Queue, on_delete=models.CASCADE)
+    day = models.DateField()
+    joined = models.IntegerField(default=0)
+    waiting = models.IntegerField(default=0)
+    serving = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    cancelled = models.IntegerField(default=0)
+    no_show = models.IntegerField(default=0)
+    created_by_guest = models.IntegerField(default=0)
+    created_by_staff = models.IntegerField(default=0)
+    wait_count = models.IntegerField(default=0)
+    wait_total = models.IntegerField(default=0)
+    wait_max = models.IntegerField(default=0)
+    service_count = models.IntegerField(default=0)
+    service_total = models.IntegerField(default=0)
+    service_max = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('queue', 'day')
+
+    @staticmethod
+    def snapshot(participant):
+        """
+        Capture the parts of a participant that contribute to the daily rollup.
+
+        :param participant: The participant to capture.
+        :return: A dictionary describing the participant's contribution.
+        """
+        wait = None
+        if participant.state != 'waiting' and participant.service_started_at:
+            wait = int((participant.service_started_at - participant.joined_at).total_seconds() / 60)
+        service = None
+        if participant.state == 'completed':
+            service = 0
+            if participant.service_started_at and participant.service_completed_at:
+                service = int((participant.service_completed_at - participant.service_started_at).total_seconds() / 60)
+        return {
+            'queue_id': participant.queue_id,
+            'day': timezone.localdate(participant.joined_at),
+            'state': participant.state,
+            'created_by': participant.created_by,
+            'wait': wait,
+            'service': service,
+        }
+
+    @classmethod
+    def _contribution(cls, snapshot):
+        """Return the counter values a participant snapshot adds to its day."""
+        counters = {'joined': 1}
+        if snapshot['state'] in cls.STATE_FIELDS:
+            counters[snapshot['state']] = 1
+        if snapshot['created_by'] in ('guest', 'staff'):
+            counters[f"created_by_{snapshot['created_by']}"] = 1
+        if snapshot['wait'] is not None:
+            counters['wait_count'] = 1
+            counters['wait_total'] = snapshot['wait']
+        if snapshot['service'] is not None:
+            counters['service_count'] = 1
+            counters['service_total'] = snapshot['service']
+        return counters
+
+    @classmethod
+    def record_change(cls, previous, current, count=1):
+        """
+        Apply the difference between two participant snapshots to the rollups.
+
+        :param previous: The snapshot before the change, or None for a new participant.
+        :param current: The snapshot after the change, or None for a deleted participant.
+        :param count: How many participants made the same change (default is 1).
+        """
+        cls.record_changes([(previous, current, count)])
+
+    @classmethod
+    def record_changes(cls, changes):
+        """
+        Apply the differences of many participant changes to the rollups, one update per day.
+
+        Counters are updated with `F()` expressions so concurrent transitions do
+        not overwrite each other. Maxima only grow; a rebuild tightens them again.
+
+        :param changes: (previous, current, count) triples of snapshots before and
+                        after a change, previous being None for a new participant
+                        and current None for a deleted one, and how many
+                        participants made that change.
+        """
+        deltas = defaultdict(lambda: defaultdict(int))
+        maxima = defaultdict(dict)
+        for previous, current, count in changes:
+            if previous == current:
+                continue
+            if previous is not None:
+                key = (previous['queue_id'], previous['day'])
+                for field, value in cls._contribution(previous).items():
+                    deltas[key][field] -= value * count
+            if current is None:
+                continue
+            key = (current['queue_id'], current['day'])
+            for field, value in cls._contribution(current).items():
+                deltas[key][field] += value * count
+            for field in cls.MAXIMUM_FIELDS:
+                value = current[field.removesuffix('_max')]
+                if value is not None:
+                    maxima[key][field] = max(maxima[key].get(field, value), value)
+
+        for key in {**deltas, **maxima}:
+            updates = {field: F(field) + value for field, value in deltas[key].items() if value}
+            updates.update({field: Greatest(F(field), value) for field, value in maxima[key].items()})
+            if not updates:
+                continue
+            stats, _ = cls.objects.get_or_create(queue_id=key[0], day=key[1])
+            cls.objects.filter(pk=stats.pk).update(**updates)
+
+    def __str__(self):
+        return f"{self.queue.name} on {self.day}: {self.joined} joined"
@@ -0,0 +1,152 @@
+from django.db import models, transaction
+from django.utils import timezone
+from manager.utils.quantile_sketch import QuantileSketch
+from .queue import Queue
+
+
+class QueueDurationSketch(models.Model):
+    """
+    Daily quantile sketch of the wait or service durations of a queue, in seconds.
+
+    Participants are counted on their local join day when their service is
+    completed. Sketches of any range of days merge into one, so percentiles of
+    long windows are read without scanning participants.
+    """
+    WAIT = 'wait'
+    SERVICE = 'service'
+    METRIC_CHOICES = [
+        (WAIT, 'Wait'),
+        (SERVICE, 'Service'),
+    ]
+    PERCENTILES = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+
+    queue = models.ForeignKey(Queue, on_delete=models.CASCADE)
+    day = models.DateField()
+    metric = models.CharField(max_length=7, choices=METRIC_CHOICES)
+    zero_count = models.PositiveIntegerField(default=0)
+    bins = models.JSONField(default=dict)
+
+    class Meta:
+        unique_together = ('queue', 'day', 'metric')
+
+    def get_sketch(self) -> QuantileSketch:
+        """Return the stored counts as a sketch."""
+        return QuantileSketch(bins=self.bins, zero_count=self.zero_count)
+
+    @staticmethod
+    def durations(participant) -> dict:
+        """
+        Return the wait and service durations of a served participant, in seconds.
+
+        :param participant: The participant whose service was completed.
+        :return: A dictionary keyed by metric; empty if service never started.
+        """
+        if not participant.service_started_at or not participant.service_completed_at:
+            return {}
+        return {
+            QueueDurationSketch.WAIT:
+                (participant.service_started_at - participant.joined_at).total_seconds(),
+            QueueDurationSketch.SERVICE:
+                (participant.service_completed_at - participant.service_started_at).total_seconds(),
+        }
+
+    @classmethod
+    def record(cls, participant) -> None:
+        """
+        Add a completed participant's wait and service durations to its day's sketches.
+
+        :param participant: The participant whose service was completed.
+        """
+        cls.record_many([participant])
+
+    @classmethod
+    def record_many(cls, participants) -> None:
+        """
+        Add the wait and service durations of completed participants to their days' sketches.
+
+        Each sketch is read, merged and written once. Rows are locked while they
+        are merged so concurrent completions are not lost.
+
+        :param participants: The participants whose service was completed.
+        """
+        durations = {}
+        for participant in participants:
+            day = timezone.localdate(participant.joined_at)
+            for metric, seconds in cls.durations(participant).items():
+                durations.setdefault((participant.queue_id, day, metric), []).append(seconds)
+        with transaction.atomic():
+            for (queue_id, day, metric), values in durations.items():
+                row, _ = cls.objects.get_or_create(queue_id=queue_id, day=day, metric=metric)
+                row = cls.objects.select_for_update().get(pk=row.pk)
+                sketch = row.get_sketch()
+                for seconds in values:
+                    sketch.add(seconds)
+                row.bins = sketch.to_dict()
+                row.zero_count = sketch.zero_count
+                row.save(update_fields=['bins', 'zero_count'])
+
+    @classmethod
+    def rebuild(cls, participants) -> int:
+        """
+        Create the sketches of the given completed participants from scratch.
+
+        Existing sketches of the same days must be deleted by the caller.
+
+        :param participants: A queryset of participants to sketch.
+        :return: The number of sketches created.
+        """
+        sketches = {}
+        rows = participants.filter(state='completed').only(
+            'queue_id', 'joined_at', 'service_started_at', 'service_completed_at')
+        for participant in rows.iterator():
+            day = timezone.localdate(participant.joined_at)
+            for metric, seconds in cls.durations(participant).items():
+                key = (participant.queue_id, day, metric)
+                sketches.setdefault(key, QuantileSketch()).add(seconds)
+        return len(cls.objects.bulk_create([
+            cls(queue_id=queue_id, day=day, metric=metric,
+                bins=sketch.to_dict(), zero_count=sketch.zero_count)
+            for (queue_id, day, metric), sketch in sketches.items()
+        ], batch_size=500))
+
+    @classmethod
+    def merged(cls, queue, metric, start_date=None, end_date=None) -> QuantileSketch:
+        """
+        Merge the daily sketches of a queue within a date window.
+
+        The window is widened to whole local days.
+
+        :param queue: The queue to read.
+        :param metric: WAIT or SERVICE.
+        :param start_date: The start date for filtering (optional).
+        :param end_date: The end date for filtering (optional).
+        :return: The merged sketch.
+        """
+        rows = cls.objects.filter(queue=queue, metric=metric)
+        if start_date and end_date:
+            rows = rows.filter(day__range=(timezone.localdate(start_date),
+                                           timezone.localdate(end_date)))
+        sketch = QuantileSketch()
+        for row in rows.only('bins', 'zero_count'):
+            sketch.merge(row.get_sketch())
+        return sketch
+
+    @classmethod
+    def percentiles(cls, queue, metric, start_date=None, end_date=None) -> dict:
+        """
+        Estimate the p50/p90/p99 durations of a queue within a date window.
+
+        :param queue: The queue to read.
+        :param metric: WAIT or SERVICE.
+        :param start_date: The start date for filtering (optional).
+        :param end_date: The end date for filtering (optional).
+        :return: A dictionary of minutes keyed by percentile name, 0 without data.
+        """
+        sketch = cls.merged(queue, metric, start_date, end_date)
+        return {
+            name: round((sketch.quantile(q) or 0) / 60)
+            for name, q in cls.PERCENTILES.items()
+        }
+
+    def __str__(self):
+        return f"{self.queue.name} {self.metric} durations on {self.day}"
@@ -0,0 +1,248 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, F, Max, Sum, Value, When
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+from .queue import Queue, QueueLineLength
+
+# Default number of days the raw samples and the per-minute buckets are kept.
+DEFAULT_RAW_RETENTION_DAYS = 7
+DEFAULT_MINUTE_RETENTION_DAYS = 2
+
+
+class QueueLineLengthBucket(models.Model):
+    """
+    Downsampled line length time-series of a queue, per minute and per hour.
+
+    The line length is a step function: a recorded value holds until the next
+    sample. Each bucket keeps the event statistics of the samples recorded in it
+    and the area under the step function (length x seconds) from the previous
+    sample up to its last sample, so time-weighted averages can be summed from
+    buckets without reading the raw `QueueLineLength` rows.
+    """
+    MINUTE = 'minute'
+    HOUR = 'hour'
+    RESOLUTION_CHOICES = [
+        (MINUTE, 'Minute'),
+        (HOUR, 'Hour'),
+    ]
+    RESOLUTIONS = {
+        MINUTE: timedelta(minutes=1),
+        HOUR: timedelta(hours=1),
+    }
+
+    queue = models.ForeignKey(Queue, on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=6, choices=RESOLUTION_CHOICES)
+    start = models.DateTimeField()
+    samples = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    peak = models.PositiveIntegerField(default=0)
+    area = models.FloatField(default=0)
+    opened_from = models.DateTimeField(null=True, blank=True)
+    opening_length = models.PositiveIntegerField(default=0)
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+    last_length = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('queue', 'resolution', 'start')
+
+    @classmethod
+    def bucket_start(cls, resolution, timestamp):
+        """
+        Return the start of the bucket that contains a timestamp.
+
+        :param resolution: The bucket resolution, MINUTE or HOUR.
+        :param timestamp: An aware datetime.
+        :return: The timestamp truncated to the resolution.
+        """
+        start = timestamp.replace(second=0, microsecond=0)
+        if resolution == cls.HOUR:
+            start = start.replace(minute=0)
+        return start
+
+    @staticmethod
+    def raw_retention():
+        """Return how long raw `QueueLineLength` samples are kept."""
+        return timedelta(days=getattr(settings, 'QUEUE_LINE_LENGTH_RAW_RETENTION_DAYS',
+                                      DEFAULT_RAW_RETENTION_DAYS))
+
+    @staticmethod
+    def minute_retention():
+        """Return how long per-minute buckets are kept; hourly buckets are kept forever."""
+        return timedelta(days=getattr(settings, 'QUEUE_LINE_LENGTH_MINUTE_RETENTION_DAYS',
+                                      DEFAULT_MINUTE_RETENTION_DAYS))
+
+    @classmethod
+    def record(cls, queue, line_length, timestamp):
+        """
+        Add a line length sample to the minute and hour buckets of a queue.
+
+        The counters are updated with `F()` expressions, and the queue's row is
+        locked while the previous sample is read, so concurrent samples neither
+        overwrite each other nor count the same stretch of area twice. A sample
+        older than a bucket's last one does not replace its last length.
+
+        :param queue: The queue the sample belongs to.
+        :param line_length: The recorded line length.
+        :param timestamp: When the sample was recorded.
+        """
+        with transaction.atomic():
+            Queue.objects.select_for_update().filter(pk=queue.pk).values('pk').first()
+            previous = cls.objects.filter(queue=queue, resolution=cls.HOUR) \
+                .order_by('-start').values('last_at', 'last_length').first()
+            area = 0
+            if previous and previous['last_at'] <= timestamp:
+                area = previous['last_length'] * (timestamp - previous['last_at']).total_seconds()
+            for resolution in cls.RESOLUTIONS:
+                bucket, _ = cls.objects.get_or_create(
+                    queue=queue, resolution=resolution,
+                    start=cls.bucket_start(resolution, timestamp),
+                    defaults={
+                        'opened_from': previous['last_at'] if previous else None,
+                        'opening_length': previous['last_length'] if previous else 0,
+                        'first_at': timestamp,
+                        'last_at': timestamp,
+                    },
+                )
+                cls.objects.filter(pk=bucket.pk).update(
+                    samples=F('samples') + 1,
+                    total=F('total') + line_length,
+                    peak=Greatest(F('peak'), line_length),
+                    area=F('area') + area,
+                    first_at=Least(F('first_at'), timestamp),
+                    last_at=Greatest(F('last_at'), timestamp),
+                    last_length=Case(When(last_at__lte=timestamp, then=Value(line_length)),
+                                     default=F('last_length'), output_field=models.PositiveIntegerField()),
+                )
+
+    @classmethod
+    def rebuild(cls, queue_id=None):
+        """
+        Recreate the buckets from the raw samples that are still retained.
+
+        :param queue_id: Only rebuild this queue (optional).
+        :return: The number of buckets created.
+        """
+        samples = QueueLineLength.objects.order_by('queue_id', 'timestamp', 'id')
+        buckets = cls.objects.all()
+        if queue_id:
+            samples = samples.filter(queue_id=queue_id)
+            buckets = buckets.filter(queue_id=queue_id)
+
+        rebuilt = {}
+        previous = None
+        for sample in samples.iterator():
+            if previous is not None and previous.queue_id != sample.queue_id:
+                previous = None
+            area = 0
+            if previous is not None:
+                area = previous.line_length * (sample.timestamp - previous.timestamp).total_seconds()
+            for resolution in cls.RESOLUTIONS:
+                start = cls.bucket_start(resolution, sample.timestamp)
+                bucket = rebuilt.get((sample.queue_id, resolution, start))
+                if bucket is None:
+                    bucket = rebuilt[(sample.queue_id, resolution, start)] = cls(
+                        queue_id=sample.queue_id, resolution=resolution, start=start,
+                        opened_from=previous.timestamp if previous else None,
+                        opening_length=previous.line_length if previous else 0,
+                        first_at=sample.timestamp,
+                    )
+                bucket.samples += 1
+                bucket.total += sample.line_length
+                bucket.peak = max(bucket.peak, sample.line_length)
+                bucket.area += area
+                bucket.last_at = sample.timestamp
+                bucket.last_length = sample.line_length
+            previous = sample
+
+        buckets.delete()
+        return len(cls.objects.bulk_create(rebuilt.values(), batch_size=500))
+
+    @classmethod
+    def prune(cls, now=None, chunk_size=1000):
+        """
+        Delete raw samples and minute buckets older than their retention, in chunks.
+
+        :param now: The reference time (defaults to the current time).
+        :param chunk_size: The maximum number of rows deleted per statement.
+        :return: A tuple of the number of raw samples and minute buckets deleted.
+        """
+        now = now or timezone.now()
+        deleted = []
+        for queryset in (
+            QueueLineLength.objects.filter(timestamp__lt=now - cls.raw_retention()),
+            cls.objects.filter(resolution=cls.MINUTE, start__lt=now - cls.minute_retention()),
+        ):
+            count = 0
+            while True:
+                ids = list(queryset.values_list('id', flat=True)[:chunk_size])
+                if not ids:
+                    break
+                count += queryset.model.objects.filter(id__in=ids).delete()[0]
+            deleted.append(count)
+        return tuple(deleted)
+
+    @classmethod
+    def summarize(cls, queue, start_date=None, end_date=None):
+        """
+        Compute the line length metrics of a queue over a window from its buckets.
+
+        Windows starting within the minute retention are read from the minute
+        buckets, longer ones from the hour buckets; the window start is rounded
+        down to the bucket boundary.
+
+        :param queue: The queue to summarize.
+        :param start_date: The start of the window (optional).
+        :param end_date: The end of the window (optional, defaults to now).
+        :return: A dictionary with the peak, the event average (`avg`) and the
+                 time-weighted average (`time_weighted`) line length.
+        """
+        end_date = end_date or timezone.now()
+        resolution = cls.HOUR
+        if start_date and start_date >= timezone.now() - cls.minute_retention():
+            resolution = cls.MINUTE
+        buckets = cls.objects.filter(queue=queue, resolution=resolution,
+                                     start__lte=end_date)
+        window_start = None
+        if start_date:
+            window_start = cls.bucket_start(resolution, start_date)
+            buckets = buckets.filter(start__gte=window_start)
+
+        totals = buckets.aggregate(peak=Max('peak'), total=Sum('total'),
+                                   samples=Sum('samples'), area=Sum('area'))
+        if not totals['samples']:
+            return {'peak': None, 'avg': None,
+                    'time_weighted': cls._carried_length(queue, resolution, window_start)}
+
+        first = buckets.order_by('start').values(
+            'opened_from', 'opening_length', 'first_at').first()
+        last = buckets.order_by('-start').values('last_at', 'last_length').first()
+        area = totals['area'] + last['last_length'] * max(
+            (end_date - last['last_at']).total_seconds(), 0)
+        if first['opened_from'] is None:
+            begin = first['first_at']
+        else:
+            begin = first['opened_from']
+            if window_start and window_start > begin:
+                area -= first['opening_length'] * (window_start - begin).total_seconds()
+                begin = window_start
+        duration = (end_date - begin).total_seconds()
+        return {
+            'peak': totals['peak'],
+            'avg': totals['total'] / totals['samples'],
+            'time_weighted': area / duration if duration > 0 else last['last_length'],
+        }
+
+    @classmethod
+    def _carried_length(cls, queue, resolution, before):
+        """Return the line length carried into a window without samples, or None."""
+        if before is None:
+            return None
+        previous = cls.objects.filter(queue=queue, resolution=resolution,
+                                      start__lt=before).order_by('-start').first()
+        return previous.last_length if previous else None
+
+    def __str__(self):
+        return f"{self.queue.name} {self.resolution} from {self.start}: peak {self.peak}"
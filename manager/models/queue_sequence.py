@@ -0,0 +1,88 @@
+import math
+from django.apps import apps
+from django.db import connection, models
+from django.db.models import Max
+from .queue import Queue
+
+
+def increment_counter(model, field, amount=1, **filters):
+    """
+    Increment a counter column and read the new value back in one atomic statement.
+
+    :param model: The model holding the counter.
+    :param field: The name of the counter column.
+    :param amount: How much to add (default is 1).
+    :param filters: Column values selecting the single row to increment.
+    :return: The new value, or None if no row matched.
+    """
+    quote = connection.ops.quote_name
+    column = quote(field)
+    conditions = ' AND '.join(f"{quote(name)} = %s" for name in filters)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {quote(model._meta.db_table)} SET {column} = {column} + %s "
+            f"WHERE {conditions} RETURNING {column}",
+            [amount, *filters.values()])
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+class QueueSequence(models.Model):
+    """
+    Per-queue counter handing out the ordering keys of participants joining the waiting list.
+
+    The counter is advanced and read back by one atomic UPDATE ... RETURNING
+    statement, so joining a queue costs the same whatever the size of its history
+    and concurrent joins never wait on each other's participant rows.
+    """
+    # Gap between the ordering keys of consecutive joins.
+    SORT_KEY_GAP = 1024.0
+
+    queue = models.OneToOneField(Queue, on_delete=models.CASCADE, primary_key=True)
+    last_position = models.BigIntegerField(default=0)
+
+    @classmethod
+    def seed(cls, queue_id) -> 'QueueSequence':
+        """
+        Create the counter of a queue, or advance it, so it continues after the queue's existing participants.
+
+        :param queue_id: The ID of the queue.
+        :return: The counter of the queue.
+        """
+        Participant = apps.get_model('participant', 'Participant')  # Lazy load
+        max_sort_key = Participant.objects.filter(queue_id=queue_id).aggregate(
+            Max('sort_key'))['sort_key__max'] or 0
+        last_position = max(math.ceil(max_sort_key / cls.SORT_KEY_GAP), 0)
+        sequence, created = cls.objects.get_or_create(queue_id=queue_id, defaults={'last_position': last_position})
+        if not created and sequence.last_position < last_position:
+            cls.objects.filter(pk=queue_id, last_position__lt=last_position).update(last_position=last_position)
+            sequence.last_position = last_position
+        return sequence
+
+    @classmethod
+    def reserve(cls, queue_id, count=1) -> list:
+        """
+        Hand out consecutive ordering keys behind every participant of a queue.
+
+        :param queue_id: The ID of the queue.
+        :param count: How many keys to hand out (default is 1).
+        :return: The ordering keys, in joining order.
+        """
+        position = increment_counter(cls, 'last_position', count, queue_id=queue_id)
+        if position is None:
+            cls.seed(queue_id)
+            return cls.reserve(queue_id, count)
+        return [index * cls.SORT_KEY_GAP for index in range(position - count + 1, position + 1)]
+
+    @classmethod
+    def next_sort_key(cls, queue_id) -> float:
+        """
+        Hand out an ordering key behind every participant of a queue.
+
+        :param queue_id: The ID of the queue.
+        :return: The ordering key.
+        """
+        return cls.reserve(queue_id)[0]
+
+    def __str__(self):
+        return f"Sequence of queue {self.queue_id}"
@@ -0,0 +1,122 @@
+from django.apps import apps
+from django.conf import settings
+from django.db import models
+from manager.utils.block_allocator import BlockAllocator
+from manager.utils.code_generator import format_ticket_number, parse_ticket_number
+from .queue import Queue
+from .queue_sequence import increment_counter
+
+
+class QueueTicketSequence(models.Model):
+    """
+    Counter of the ticket numbers handed out in one series of a queue.
+
+    A queue has one series per ticket prefix and numbering period; resetting
+    numbers daily or per shift simply starts a new period. Numbers are taken
+    with one atomic increment, and each process can reserve them in blocks of
+    `TICKET_BLOCK_SIZE` so busy kiosks rarely touch the counter at all.
+    """
+    queue = models.ForeignKey(Queue, on_delete=models.CASCADE)
+    series = models.CharField(max_length=3, blank=True)
+    period = models.CharField(max_length=20, blank=True)
+    last_number = models.BigIntegerField(default=0)
+
+    # Numbers reserved by this process, keyed by (queue ID, series, period).
+    _allocator = BlockAllocator()
+
+    class Meta:
+        unique_together = ('queue', 'series', 'period')
+
+    @staticmethod
+    def block_size() -> int:
+        """Return how many numbers a process reserves at a time."""
+        return max(getattr(settings, 'TICKET_BLOCK_SIZE', 1), 1)
+
+    @classmethod
+    def seed(cls, queue_id, series, period) -> 'QueueTicketSequence':
+        """
+        Create the counter of a series, continuing the queue's unprefixed numbering if it never resets.
+
+        :param queue_id: The ID of the queue.
+        :param series: The ticket prefix of the series.
+        :param period: The numbering period of the series.
+        :return: The counter of the series.
+        """
+        last_number = 0
+        if not series and not period:
+            Participant = apps.get_model('participant', 'Participant')  # Lazy load
+            last = Participant.objects.filter(queue_id=queue_id, ticket_period='').exclude(
+                number='').order_by('-joined_at').values_list('number', flat=True).first()
+            last_number = parse_ticket_number(last) if last else 0
+        sequence, _ = cls.objects.get_or_create(queue_id=queue_id, series=series, period=period,
+                                                defaults={'last_number': last_number})
+        return sequence
+
+    @classmethod
+    def reserve(cls, queue_id, series='', period='', count=1) -> range:
+        """
+        Take consecutive numbers from a series with one atomic increment.
+
+        :param queue_id: The ID of the queue.
+        :param series: The ticket prefix of the series.
+        :param period: The numbering period of the series.
+        :param count: How many numbers to take (default is 1).
+        :return: The range of numbers taken.
+        """
+        last = increment_counter(cls, 'last_number', count, queue_id=queue_id,
+                                 series=series, period=period)
+        if last is None:
+            cls.seed(queue_id, series, period)
+            return cls.reserve(queue_id, series, period, count)
+        return range(last - count + 1, last + 1)
+
+    @classmethod
+    def next_number(cls, queue_id, series='', period='') -> int:
+        """
+        Hand out the next number of a series, from this process's block when possible.
+
+        :param queue_id: The ID of the queue.
+        :param series: The ticket prefix of the series.
+        :param period: The numbering period of the series.
+        :return: The ticket number index.
+        """
+        key = (queue_id, series, period)
+        cls._allocator.discard(lambda other: other[:2] == key[:2] and other[2] != period)
+        return cls._allocator.take(key, cls.block_size(),
+                                   lambda count: cls.reserve(queue_id, series, period, count))
+
+    @classmethod
+    def allocate(cls, queue, service_type=None, at=None):
+        """
+        Hand out a ticket number for a participant joining a queue.
+
+        :param queue: The queue being joined.
+        :param service_type: The participant's service type, used by the per-service-type scheme (optional).
+        :param at: When the participant joins (default is now).
+        :return: A tuple of the numbering period and the formatted ticket number.
+        """
+        series = queue.get_ticket_prefix(service_type)
+        period = queue.get_ticket_period(at)
+        index = cls.next_number(queue.pk, series, period)
+        return period, format_ticket_number(index, series)
+
+    @classmethod
+    def allocate_many(cls, queue, service_types, at=None):
+        """
+        Hand out ticket numbers for many participants joining a queue at once.
+
+        Each series takes all of its numbers with a single increment.
+
+        :param queue: The queue being joined.
+        :param service_types: The service type of each participant, in joining order.
+        :param at: When the participants join (default is now).
+        :return: A tuple of the numbering period and the formatted ticket numbers, in joining order.
+        """
+        period = queue.get_ticket_period(at)
+        series = [queue.get_ticket_prefix(service_type) for service_type in service_types]
+        indexes = {prefix: iter(cls.reserve(queue.pk, prefix, period, series.count(prefix)))
+                   for prefix in dict.fromkeys(series)}
+        return period, [format_ticket_number(next(indexes[prefix]), prefix) for prefix in series]
+
+    def __str__(self):
+        return f"{self.queue.name} tickets {self.series or '-'} {self.period or ''}".strip()
@@ -1,7 +1,10 @@
 import math
-from django.db import models
-from django.apps import apps
+from django.db import models, transaction
+from django.db.models import Avg, F
+from manager.utils.concurrency import TransitionConflict
 from manager.utils.helpers import format_duration
+from manager.utils.live_updates import publish_queue_change
+from manager.utils.queue_statistics import wait_minutes, service_minutes
 from manager.models import Queue
 
 
@@ -29,14 +32,25 @@ class Resource(models.Model):
     class Meta:
         unique_together = ('name', 'queue')
 
+    def save(self, *args, **kwargs):
+        """Save the resource and tell the live views of its queue once committed."""
+        super().save(*args, **kwargs)
+        publish_queue_change(self.queue_id)
+
     def assign_to_participant(self, participant, capacity=1) -> None:
         """
         Assigns this resource to the given participant if it is available
         and the capacity matches the participant's needs.
 
+        The resource is claimed with a conditional update, so when two terminals
+        assign it at the same time exactly one of them succeeds. The claim and
+        the participant's conditional save share a transaction, so a participant
+        served elsewhere in the meantime leaves the resource available.
+
         :param participant: The participant to be assigned the resource.
         :param capacity: The required capacity (default is 1).
         :raises ValueError: If the resource is not available or the capacity is insufficient.
+        :raises TransitionConflict: If the resource was assigned elsewhere since it was read.
         """
         if self.status != 'available':
             raise ValueError("This resource is not available.")
@@ -44,28 +58,40 @@ class Resource(models.Model):
             raise ValueError(
                 "This resource cannot accommodate the party size.")
 
+        with transaction.atomic():
+            claimed = Resource.objects.filter(pk=self.pk, status='available').update(
+                status='busy', count=F('count') + 1, assigned_to=participant)
+            if not claimed:
+                raise TransitionConflict(f"{self.name} has just been assigned to someone else.")
+            participant.resource = self
+            participant.save()
         self.status = 'busy'
         self.count += 1
         self.assigned_to = participant
-        self.save()
-        participant.resource = self
-        participant.save()
 
     def free(self) -> None:
         """
         Frees the resource, making it available for new assignments.
 
         If the resource is assigned to a participant, the participant is
-        disassociated from the resource.
-        """
-        if self.assigned_to:
-            participant = self.assigned_to
-            participant.resource = None
-            participant.save()
+        disassociated from the resource. The resource is only freed if it is
+        still assigned to the participant it was read with.
+
+        :raises TransitionConflict: If the resource was freed or reassigned since it was read.
+        """
+        with transaction.atomic():
+            freed = Resource.objects.filter(pk=self.pk, assigned_to=self.assigned_to_id).update(
+                status='available', assigned_to=None)
+            if not freed:
+                raise TransitionConflict(f"{self.name} has just been freed or reassigned elsewhere.")
+            publish_queue_change(self.queue_id)
+            if self.assigned_to:
+                participant = self.assigned_to
+                participant.resource = None
+                participant.save()
 
         self.status = 'available'
         self.assigned_to = None
-        self.save()
 
     def is_assigned(self) -> bool:
         """
@@ -76,6 +102,19 @@ class Resource(models.Model):
         """
         return self.assigned_to is not None
 
+    def _served_participants(self, start_date=None, end_date=None):
+        """
+        Return the participants served by this resource, optionally within a date range.
+
+        :param start_date: The start date for filtering participants (optional).
+        :param end_date: The end date for filtering participants (optional).
+        :return: A queryset of the participants whose `resource_served` is this resource.
+        """
+        queryset = self.served_participants.all()
+        if start_date and end_date:
+            queryset = queryset.filter(joined_at__range=(start_date, end_date))
+        return queryset
+
     def total(self, start_date=None, end_date=None):
         """
         Return the total number of participants assigned to this resource within a date range.
@@ -84,11 +123,7 @@ class Resource(models.Model):
         :param end_date: The end date for filtering participants (optional).
         :return: The total number of participants assigned to this resource within the specified date range.
         """
-        Participant = apps.get_model('participant', 'Participant')
-        queryset = Participant.objects.filter(resource_assigned=self.name)
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
-        return queryset.count()
+        return self._served_participants(start_date, end_date).count()
 
     def served(self, start_date=None, end_date=None):
         """
@@ -98,12 +133,8 @@ class Resource(models.Model):
         :param end_date: Optional end date for the date range filter.
         :return: The count of participants being served or completed service within the specified date range.
         """
-        Participant = apps.get_model('participant', 'Participant')
-        queryset = Participant.objects.filter(resource_assigned=self.name,
-                                              state__in=['serving',
-                                                         'completed'])
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
+        queryset = self._served_participants(start_date, end_date).filter(
+            state__in=['serving', 'completed'])
         return queryset.count()
 
     def dropoff(self, start_date=None, end_date=None):
@@ -114,12 +145,8 @@ class Resource(models.Model):
         :param end_date: Optional end date for the date range filter.
         :return: The count of participants who have been removed or cancelled within the specified date range.
         """
-        Participant = apps.get_model('participant', 'Participant')
-        queryset = Participant.objects.filter(resource_assigned=self.name,
-                                              state__in=['removed',
-                                                         'cancelled'])
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
+        queryset = self._served_participants(start_date, end_date).filter(
+            state__in=['removed', 'cancelled'])
         return queryset.count()
 
     def completed(self, start_date=None, end_date=None):
@@ -130,11 +157,8 @@ class Resource(models.Model):
         :param end_date: Optional end date for the date range filter.
         :return: The count of participants who have completed service within the specified date range.
         """
-        Participant = apps.get_model('participant', 'Participant')
-        queryset = Participant.objects.filter(resource_assigned=self.name,
-                                              state='completed')
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
+        queryset = self._served_participants(start_date, end_date).filter(
+            state='completed')
         return queryset.count()
 
     def avg_wait_time(self, start_date=None, end_date=None):
@@ -145,17 +169,11 @@ class Resource(models.Model):
         :param end_date: Optional end date for the date range filter.
         :return: The formatted average wait time for participants within the specified date range.
         """
-        Participant = apps.get_model('participant', 'Participant')
-        queryset = Participant.objects.filter(resource_assigned=self.name,
-                                              state__in=['serving',
-                                                         'completed'])
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
+        queryset = self._served_participants(start_date, end_date).filter(
+            state__in=['serving', 'completed'])
 
-        wait_times = [p.get_wait_time() for p in queryset if
-                      p.get_wait_time() is not None]
-        average_wait_time = math.ceil(
-            sum(wait_times) / len(wait_times)) if wait_times else 0
+        average = queryset.aggregate(minutes=Avg(wait_minutes()))['minutes']
+        average_wait_time = math.ceil(average) if average is not None else 0
         return format_duration(average_wait_time)
 
     def avg_serve_time(self, start_date=None, end_date=None):
@@ -166,16 +184,11 @@ class Resource(models.Model):
         :param end_date: Optional end date for the date range filter.
         :return: The formatted average service duration for participants within the specified date range.
         """
-        Participant = apps.get_model('participant', 'Participant')
-        queryset = Participant.objects.filter(resource_assigned=self.name,
-                                              state='completed')
-        if start_date and end_date:
-            queryset = queryset.filter(joined_at__range=(start_date, end_date))
+        queryset = self._served_participants(start_date, end_date).filter(
+            state='completed')
 
-        serve_times = [p.get_service_duration() for p in queryset if
-                       p.get_service_duration() is not None]
-        average_serve_time = math.ceil(
-            sum(serve_times) / len(serve_times)) if serve_times else 0
+        average = queryset.aggregate(minutes=Avg(service_minutes()))['minutes']
+        average_serve_time = math.ceil(average) if average is not None else 0
         return format_duration(average_serve_time)
 
     def __str__(self):
@@ -1,6 +1,10 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipIf
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from unittest.mock import patch
-from manager.models import BankQueue, Counter
+from manager.models import BankQueue, Counter, QueueDailyStats
 from participant.models import BankParticipant
 from manager.utils.category_handler import BankQueueHandler
 from django.utils import timezone
@@ -169,3 +173,96 @@ class TestBankQueueHandler(TestCase):
         self.assertEqual(updated_counter.status, "occupied")
 
 
+
+    def test_import_participants(self):
+        """Test that a bulk import numbers, orders and counts the participants with a fixed number of queries."""
+        self.queue.ticket_scheme = 'service_type'
+        self.queue.ticket_prefixes = {'loan_services': 'LN'}
+        self.queue.save()
+        BankParticipant.objects.create(name="Walk-in", queue=self.queue, service_type='loan_services')
+        rows = [{"name": f"Client {i}", "email": "", "participant_category": "business",
+                 "service_type": "loan_services" if i % 2 else "account_services"} for i in range(8)]
+
+        self.handler.import_participants(self.queue, rows[:2])
+        with CaptureQueriesContext(connection) as small:
+            self.handler.import_participants(self.queue, rows[2:4])
+        with CaptureQueriesContext(connection) as large:
+            participants = self.handler.import_participants(self.queue, rows[4:])
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+        self.assertEqual([p.number for p in participants], ["ACC003", "LN004", "ACC004", "LN005"])
+        imported = BankParticipant.with_positions(BankParticipant.objects.filter(queue=self.queue))
+        self.assertEqual([p.name for p in imported], ["Walk-in"] + [row["name"] for row in rows])
+        self.assertEqual([p.position for p in imported], list(range(1, 10)))
+        self.assertTrue(all(p.participant_category == "business" and p.email is None for p in imported[1:]))
+        self.assertEqual(len({p.code for p in imported}), 9)
+        self.assertEqual(self.queue.get_live_counters()['waiting'], 9)
+        stats = QueueDailyStats.objects.get(queue=self.queue)
+        self.assertEqual((stats.joined, stats.waiting, stats.created_by_staff), (9, 9, 8))
+
+    def test_import_participants_rejects_invalid_row(self):
+        """Test that an invalid row aborts the whole import."""
+        rows = [{"name": "Client", "service_type": "loan_services"},
+                {"name": "Client", "service_type": "withdrawal"}]
+        with self.assertRaisesMessage(ValueError, "Row 2: service_type"):
+            self.handler.import_participants(self.queue, rows)
+        self.assertFalse(BankParticipant.objects.exists())
+
+    def test_call_next(self):
+        """Test that a counter calls the client needing its service type first, then the longest waiting."""
+        self.counter.service_type = 'loan_services'
+        self.counter.save()
+        second = Counter.objects.create(name="Counter 2", status="available", queue=self.queue,
+                                        service_type='customer_support')
+        first, loan = (BankParticipant.objects.create(name=name, queue=self.queue, service_type=service_type)
+                       for name, service_type in (("First", 'account_services'), ("Loan", 'loan_services')))
+
+        called = self.handler.call_next(self.queue, self.counter)
+        self.assertEqual(called.pk, loan.pk)
+        loan.refresh_from_db()
+        self.counter.refresh_from_db()
+        self.assertEqual((loan.state, loan.resource_id, loan.resource_assigned), ('serving', self.counter.pk, "Counter 1"))
+        self.assertEqual((self.counter.status, self.counter.assigned_to_id), ('busy', loan.pk))
+
+        self.assertEqual(self.handler.call_next(self.queue, second).pk, first.pk)
+        third = Counter.objects.create(name="Counter 3", status="available", queue=self.queue)
+        self.assertIsNone(self.handler.call_next(self.queue, third))
+        with self.assertRaisesMessage(ValueError, "This resource is not available."):
+            self.handler.call_next(self.queue, self.counter)
+
+    def test_call_next_skips_participant_taken_concurrently(self):
+        """Test that a participant served by another counter since being read is skipped."""
+        first, second = (BankParticipant.objects.create(name=name, queue=self.queue) for name in ("First", "Second"))
+        stale = BankParticipant.objects.get(pk=first.pk)
+        first.start_service()
+        with patch('participant.models.Participant.claim_next', side_effect=[stale, second]):
+            called = self.handler.call_next(self.queue, self.counter)
+        self.assertEqual(called.pk, second.pk)
+        self.assertEqual(BankParticipant.objects.get(pk=second.pk).resource_id, self.counter.pk)
+
+
+@skipIf(connection.vendor == 'sqlite',
+        "In-memory SQLite test databases lock tables instead of queueing concurrent writers; "
+        "set DATABASE_URL to run this on PostgreSQL.")
+class BankCallNextConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.handler = BankQueueHandler()
+        self.queue = BankQueue.objects.create(name="Branch", category="bank", created_by=self.user,
+                                              latitude=0, longitude=0)
+        self.counters = [Counter.objects.create(name=f"Counter {i}", queue=self.queue) for i in range(10)]
+        for i in range(10):
+            BankParticipant.objects.create(name=f"Client {i}", queue=self.queue)
+
+    def call_next(self, counter):
+        try:
+            return self.handler.call_next(self.queue, counter).pk
+        finally:
+            connection.close()
+
+    def test_parallel_counters_call_different_participants(self):
+        """Test that 10 counters pressing "next" together each serve a different participant."""
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            called = list(executor.map(self.call_next, self.counters))
+        self.assertEqual(len(set(called)), 10)
+        self.assertFalse(BankParticipant.objects.filter(state='waiting').exists())
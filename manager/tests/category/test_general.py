@@ -1,3 +1,8 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 from unittest.mock import patch, MagicMock
 from django.contrib.auth.models import User
@@ -98,3 +103,35 @@ class TestGeneralQueueHandler(TestCase):
         data = {"key": "value"}
         result = self.handler.edit_resource(resource_mock, data)
         self.assertIsNone(result)  # Assuming no resource editing logic.
+
+    def test_import_participants_command(self):
+        """Test that the import command reads CSV and JSON files in order and defers the QR code emails."""
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, 'appointments.csv')
+            with open(csv_path, 'w', newline='') as file:
+                file.write("name,email,phone\nAnn,ann@example.com,111\nBob,,222\n")
+            json_path = os.path.join(directory, 'appointments.json')
+            with open(json_path, 'w') as file:
+                json.dump([{"name": "Cid", "note": "Follow-up"}], file)
+            call_command('import_participants', self.queue.pk, csv_path, stdout=StringIO())
+            call_command('import_participants', self.queue.pk, json_path, stdout=StringIO())
+            with self.assertRaisesMessage(CommandError, "Could not read"):
+                call_command('import_participants', self.queue.pk, csv_path, '--format', 'json')
+            with open(json_path, 'w') as file:
+                json.dump([{"phone": "333"}], file)
+            with self.assertRaisesMessage(CommandError, "Row 1: name"):
+                call_command('import_participants', self.queue.pk, json_path)
+
+        participants = Participant.with_positions(Participant.objects.filter(queue=self.queue))
+        self.assertEqual([(p.name, p.number, p.position) for p in participants],
+                         [("Ann", "A001", 1), ("Bob", "A002", 2), ("Cid", "A003", 3)])
+        self.assertFalse(Participant.objects.filter(qrcode_email_sent=True).exists())
+
+        with patch('manager.utils.send_email.generate_participant_qr_code_url', return_value='https://qr/ann.png'), \
+                patch('manager.utils.send_email.send_email_with_qr') as send:
+            out = StringIO()
+            call_command('send_pending_qr_emails', stdout=out)
+        send.assert_called_once()
+        self.assertIn("Sent 1 QR code email(s), 0 failed.", out.getvalue())
+        ann = Participant.objects.get(name="Ann")
+        self.assertEqual((ann.qrcode_url, ann.qrcode_email_sent), ('https://qr/ann.png', True))
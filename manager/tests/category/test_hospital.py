@@ -181,3 +181,14 @@ class TestHospitalQueueHandler(TestCase):
 
 
 
+
+    def test_call_next(self):
+        """Test that a doctor calls the most urgent patient of their specialty."""
+        self.doctor.queue = self.queue
+        self.doctor.save()
+        for name, medical_field, priority in (("Low", 'cardiology', 'low'), ("Other field", 'neurology', 'urgent'),
+                                              ("Normal", 'cardiology', 'normal'), ("Urgent", 'cardiology', 'urgent')):
+            HospitalParticipant.objects.create(name=name, queue=self.queue, medical_field=medical_field,
+                                               priority=priority)
+        called = self.handler.call_next(self.queue, self.doctor)
+        self.assertEqual((called.name, called.state, called.resource_id), ("Urgent", 'serving', self.doctor.pk))
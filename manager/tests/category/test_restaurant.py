@@ -151,3 +151,12 @@ class TestRestaurantQueueHandler(TestCase):
         self.assertEqual(self.table.name, "Updated Table")
         self.assertEqual(self.table.capacity, 8)
         self.assertEqual(self.table.status, "occupied")
+
+    def test_call_next(self):
+        """Test that a table calls the longest waiting party that fits."""
+        RestaurantParticipant.objects.create(name="Large party", queue=self.queue, party_size=6)
+        RestaurantParticipant.objects.create(name="Couple", queue=self.queue, party_size=2)
+        called = self.handler.call_next(self.queue, self.table)
+        self.assertEqual((called.name, called.state, called.resource_assigned), ("Couple", 'serving', "Table 1"))
+        self.table.refresh_from_db()
+        self.assertEqual(self.table.status, 'busy')
@@ -0,0 +1,58 @@
+"""
+One server process of the multi-process channel layer tests, using the
+database channel layer on a shared SQLite file or a PostgreSQL database URL.
+
+    python channel_layer_process.py <database> setup  (SQLite only)
+    python channel_layer_process.py <database> receive <queue id>
+    python channel_layer_process.py <database> send <queue id>
+"""
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import dj_database_url
+import django
+from django.conf import settings
+
+
+def main(database, mode, queue_id=None):
+    if '://' in database:
+        settings.DATABASES = {'default': dj_database_url.parse(database)}
+    else:
+        settings.DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': database}}
+    settings.CHANNEL_LAYERS = {'default': {
+        'BACKEND': 'manager.utils.channel_layer.DatabaseChannelLayer',
+        'CONFIG': {'poll_interval': 0.05},
+    }}
+    django.setup()
+    from django.apps import apps
+    from django.db import connection
+    from channels.layers import get_channel_layer
+    from manager.utils import live_updates
+
+    if mode == 'setup':
+        with connection.schema_editor() as editor:
+            editor.create_model(apps.get_model('manager', 'ChannelMessage'))
+            editor.create_model(apps.get_model('manager', 'ChannelGroupMembership'))
+    elif mode == 'send':
+        live_updates._send(int(queue_id))
+    elif mode == 'receive':
+        async def receive():
+            channel_layer = get_channel_layer()
+            channel = await channel_layer.new_channel()
+            await channel_layer.group_add(live_updates.queue_group(int(queue_id)), channel)
+            print('ready', flush=True)
+            message = await asyncio.wait_for(channel_layer.receive(channel), 20)
+            print(json.dumps(message), flush=True)
+            await channel_layer.close()
+
+        asyncio.run(receive())
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -1,9 +1,13 @@
 from datetime import timedelta
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
 from django.contrib.auth.models import User
 from datetime import time
 from django.utils import timezone
-from manager.models import Queue, QueueLineLength
+from manager.models import Queue, QueueLineLength, Table
+from manager.utils.geo import geo_cell
 from participant.models import Participant
 from django.core.exceptions import ValidationError
 
@@ -119,6 +123,60 @@ class QueueModelTests(TestCase):
         self.queue.update_estimated_wait_time_per_turn(15)
         self.assertEqual(self.queue.estimated_wait_time_per_turn, 15)
 
+    def test_wait_time_updates_do_not_touch_service_average(self):
+        """Test that wait time observations no longer share the completed participants count."""
+        self.queue.update_estimated_wait_time_per_turn(15)
+        self.queue.update_estimated_wait_time_per_turn(5)
+        self.queue.refresh_from_db()
+        self.assertEqual(self.queue.completed_participants_count, 0)
+        self.queue.calculate_average_service_duration(20)
+        self.assertEqual(self.queue.average_service_duration, 20)
+        self.assertEqual(self.queue.estimated_wait_time_per_turn, 10)  # The cumulative mean by default
+
+    def test_wait_estimator_state_survives_stale_saves(self):
+        """Test that saving a stale queue instance keeps the learned estimator state."""
+        stale = Queue.objects.get(pk=self.queue.pk)
+        self.queue.update_estimated_wait_time_per_turn(15)
+        stale.name = "Renamed"
+        stale.save()
+        self.queue.refresh_from_db()
+        self.assertEqual(self.queue.wait_estimator_state['cumulative'], {'n': 1, 'mean': 15})
+
+    def test_selected_estimator_feeds_wait_estimates(self):
+        """Test that participant and new-joiner estimates use the selected estimator."""
+        for minutes in (10, 20, 30):
+            self.queue.update_estimated_wait_time_per_turn(minutes)
+        self.queue.wait_estimator = 'cumulative'
+        self.queue.save()
+        self.participant.refresh_from_db()
+        self.assertEqual(self.queue.get_estimated_wait_time_per_turn(), 20)
+        self.assertEqual(self.participant.calculate_estimated_wait_time(), 20)
+        self.assertEqual(self.queue.get_average_wait_time_of_new_participant(), 40)
+
+    def test_parallelism_estimator_uses_available_resources(self):
+        """Test that the parallelism estimator shares service time between resources."""
+        Table.objects.create(name="T1", capacity=2, queue=self.queue)
+        Table.objects.create(name="T2", capacity=2, queue=self.queue)
+        Table.objects.create(name="T3", capacity=2, queue=self.queue, status='unavailable')
+        self.queue.wait_estimator = 'parallelism'
+        self.queue.save()
+        self.queue.observe_service_duration(30)
+        self.assertEqual(self.queue.get_parallel_servers(), 2)
+        self.assertEqual(self.queue.get_estimated_wait_time_per_turn(), 15)
+
+    def test_wait_time_estimator_report(self):
+        """Test that the offline report replays served participants through every estimator."""
+        now = timezone.localtime()
+        participant = Participant.objects.create(queue=self.queue, state="completed",
+                                                 created_by="guest")
+        Participant.objects.filter(pk=participant.pk).update(
+            joined_at=now - timedelta(minutes=30), service_started_at=now - timedelta(minutes=20),
+            service_completed_at=now - timedelta(minutes=10))
+        out = StringIO()
+        call_command('wait_time_estimator_report', queue_id=self.queue.pk, stdout=out)
+        self.assertIn("ewma: no predictions", out.getvalue())
+        self.assertIn("Replayed 1 queue(s).", out.getvalue())
+
     def test_calculate_average_service_duration(self):
         """Test updating the average service duration based on recent serve times."""
         # Set up initial queue state
@@ -179,6 +237,64 @@ class QueueModelTests(TestCase):
         self.participant.refresh_from_db()
         self.assertEqual(self.participant.position, 1)
 
+    def test_update_participants_positions_rebalances_keys(self):
+        """Test that rebalancing spreads the ordering keys without changing the order."""
+        others = [Participant.objects.create(queue=self.queue, state="waiting", created_by="guest")
+                  for _ in range(3)]
+        others[2].move_to(1)
+        self.assertEqual(self.queue.update_participants_positions(), 4)
+        waiting = Participant.with_positions(Participant.objects.filter(queue=self.queue))
+        self.assertEqual([p.pk for p in waiting], [others[2].pk, self.participant.pk,
+                                                   others[0].pk, others[1].pk])
+        self.assertEqual([p.sort_key for p in waiting], [1024, 2048, 3072, 4096])
+        self.assertEqual(self.queue.update_participants_positions(), 0)
+
+    def test_positions_are_ranks_of_the_waiting_list(self):
+        """Test that joins, leaves and serves write one row and positions follow."""
+        second = Participant.objects.create(queue=self.queue, state="waiting", created_by="guest")
+        third = Participant.objects.create(queue=self.queue, state="waiting", created_by="guest")
+        self.assertEqual(third.position, 3)
+        self.participant.refresh_from_db()
+        self.participant.state = 'cancelled'
+        with self.assertNumQueries(4):  # The participant, its daily rollup and the live counters
+            self.participant.save()
+        self.assertIsNone(self.participant.position)
+        self.assertEqual(second.position, 1)
+        self.assertEqual(third.position, 2)
+        waiting = Participant.with_positions(Participant.objects.filter(queue=self.queue, state='waiting'))
+        self.assertEqual([(p.pk, p.position) for p in waiting.filter(pk=third.pk)], [(third.pk, 2)])
+
+    def test_move_to_writes_one_row(self):
+        """Test that drag-reordering only rewrites the moved participant."""
+        others = [Participant.objects.create(queue=self.queue, state="waiting", created_by="guest")
+                  for _ in range(3)]
+        keys = dict(Participant.objects.values_list('pk', 'sort_key'))
+        others[2].move_to(2)
+        self.assertEqual(others[2].position, 2)
+        moved_keys = dict(Participant.objects.values_list('pk', 'sort_key'))
+        self.assertEqual({pk for pk in keys if keys[pk] != moved_keys[pk]}, {others[2].pk})
+        self.assertEqual([p.pk for p in Participant.with_positions(Participant.objects.filter(queue=self.queue))],
+                         [self.participant.pk, others[2].pk, others[0].pk, others[1].pk])
+
+    def test_move_to_returns_clamped_position(self):
+        """Test that moves return the position reached, clamped to the end of the list."""
+        second = Participant.objects.create(queue=self.queue, state="waiting", created_by="guest")
+        self.assertEqual(self.participant.move_to(10), 2)
+        self.assertEqual(self.participant.position, 2)
+        self.assertEqual(self.participant.move_to(1), 1)
+        second.refresh_from_db()
+        self.assertEqual(second.position, 2)
+
+    def test_move_to_rebalances_exhausted_gaps(self):
+        """Test that moves between neighbouring keys with no room left rebalance the queue."""
+        second = Participant.objects.create(queue=self.queue, state="waiting", created_by="guest")
+        third = Participant.objects.create(queue=self.queue, state="waiting", created_by="guest")
+        Participant.objects.filter(pk=self.participant.pk).update(sort_key=1.0)
+        Participant.objects.filter(pk=second.pk).update(sort_key=1.0)
+        third.move_to(2)
+        self.assertEqual([p.pk for p in Participant.with_positions(Participant.objects.filter(queue=self.queue))],
+                         [self.participant.pk, third.pk, second.pk])
+
     def test_get_number_of_participants(self):
         """Test counting total participants."""
         self.assertEqual(self.queue.get_number_of_participants(), 1)
@@ -513,6 +629,36 @@ class QueueModelEdgeCasesTests(TestCase):
             places=2,
         )
 
+    def test_get_top_featured_queues_ranking(self):
+        """Test that the leaderboard is ranked by ratio in one query and cut at the limit."""
+        self.queue.resource_set.create(name="Big", capacity=10)
+        busy = Queue.objects.create(name="Busy Queue", created_by=self.user, category="general",
+                                    latitude=40.7128, longitude=-74.0060)
+        busy.resource_set.create(name="Small", capacity=1)
+        for queue in (self.queue, busy):
+            Participant.objects.create(queue=queue)
+
+        with self.assertNumQueries(1):
+            top_queues = Queue.get_top_featured_queues()
+        self.assertEqual(top_queues, [busy, self.queue])
+        self.assertEqual(top_queues[0].ratio, 100)
+        self.assertEqual(top_queues[1].ratio, 10)
+        self.assertEqual(Queue.get_top_featured_queues(limit=1), [busy])
+
+    def test_cached_featured_queues(self):
+        """Test that the cached leaderboard is reused, even across waiting count changes, until it expires."""
+        cache.clear()
+        self.assertEqual(Queue.get_cached_featured_queues(), [])
+        Participant.objects.create(queue=self.queue)
+        with self.assertNumQueries(0):
+            self.assertEqual(Queue.get_cached_featured_queues(), [])
+
+        cache.clear()  # Expired
+        self.assertEqual(Queue.get_cached_featured_queues(), [self.queue])
+
+        self.queue.delete()  # Deleted queues leave the leaderboard at once
+        self.assertEqual(Queue.get_cached_featured_queues(), [])
+
     def test_get_nearby_queues_exact_radius(self):
         """Test a queue at exactly the edge of the radius."""
         nearby_queue = Queue.objects.create(
@@ -536,6 +682,37 @@ class QueueModelEdgeCasesTests(TestCase):
         nearby_queues = Queue.get_nearby_queues(user_lat=40.7128, user_lon=-74.0060, radius_km=50)
         self.assertEqual(len(nearby_queues), 2)
 
+    def test_get_nearby_queues_sorted_without_writes(self):
+        """Test that nearby queues are read in one query, sorted by distance and limited."""
+        closer = Queue.objects.create(name="Closer Queue", latitude=40.7128, longitude=-74.0061,
+                                      category="restaurant")
+        Queue.objects.create(name="Far Queue", latitude=41.0000, longitude=-74.0000,
+                             category="restaurant")
+        with self.assertNumQueries(1):
+            nearby_queues = Queue.get_nearby_queues(user_lat=40.7128, user_lon=-74.0062, radius_km=5)
+        self.assertEqual(nearby_queues, [closer, self.queue])
+        self.assertLess(nearby_queues[0].distance_from_user, nearby_queues[1].distance_from_user)
+        self.queue.refresh_from_db()
+        self.assertIsNone(self.queue.distance_from_user)
+        self.assertEqual(Queue.get_nearby_queues(40.7128, -74.0062, radius_km=5, limit=1), [closer])
+
+    def test_get_nearby_queues_across_antimeridian(self):
+        """Test that the bounding box wraps around the antimeridian."""
+        east = Queue.objects.create(name="East Queue", latitude=0, longitude=179.99,
+                                    category="restaurant")
+        west = Queue.objects.create(name="West Queue", latitude=0, longitude=-179.99,
+                                    category="restaurant")
+        self.assertEqual(set(Queue.get_nearby_queues(0, 179.999, radius_km=5)), {east, west})
+
+    def test_index_queue_locations_command(self):
+        """Test that queues without a grid cell are still found, and that the command restores it."""
+        Queue.objects.filter(pk=self.queue.pk).update(geo_cell='')
+        self.assertIn(self.queue, Queue.get_nearby_queues(40.7128, -74.0060))
+        call_command('index_queue_locations', stdout=StringIO())
+        self.queue.refresh_from_db()
+        self.assertEqual(self.queue.geo_cell, geo_cell(self.queue.latitude, self.queue.longitude))
+        self.assertIn(self.queue, Queue.get_nearby_queues(40.7128, -74.0060))
+
     def test_lat_lon_validation(self):
         """Test latitude and longitude ranges."""
         invalid_queue = Queue(
@@ -0,0 +1,113 @@
+from datetime import timedelta
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+from manager.models import Queue, QueueDailyStats
+from participant.models import Participant
+
+
+class QueueDailyStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.queue = Queue.objects.create(
+            name="Test Queue",
+            created_by=self.user,
+            category="general",
+            latitude=40.7128,
+            longitude=-74.0060,
+        )
+
+    def get_stats(self):
+        return QueueDailyStats.objects.get(queue=self.queue, day=timezone.localdate())
+
+    def test_join_creates_rollup(self):
+        """Test that a new participant is counted on its join day."""
+        Participant.objects.create(queue=self.queue, created_by="staff")
+        stats = self.get_stats()
+        self.assertEqual(stats.joined, 1)
+        self.assertEqual(stats.waiting, 1)
+        self.assertEqual(stats.created_by_staff, 1)
+
+    def test_transitions_move_counters(self):
+        """Test that serving and completing a participant moves it between counters."""
+        participant = Participant.objects.create(queue=self.queue)
+        participant.start_service()
+        stats = self.get_stats()
+        self.assertEqual(stats.waiting, 0)
+        self.assertEqual(stats.serving, 1)
+        self.assertEqual(stats.wait_count, 1)
+
+        participant.state = 'completed'
+        participant.service_completed_at = participant.service_started_at + timedelta(minutes=12)
+        participant.save()
+        stats = self.get_stats()
+        self.assertEqual(stats.joined, 1)
+        self.assertEqual(stats.serving, 0)
+        self.assertEqual(stats.completed, 1)
+        self.assertEqual(stats.service_count, 1)
+        self.assertEqual(stats.service_total, 12)
+        self.assertEqual(stats.service_max, 12)
+
+    def test_cancel_and_no_show(self):
+        """Test that drop-offs are counted."""
+        cancelled = Participant.objects.create(queue=self.queue)
+        no_show = Participant.objects.create(queue=self.queue)
+        cancelled.state = 'cancelled'
+        cancelled.save()
+        no_show.state = 'no_show'
+        no_show.save()
+        stats = self.get_stats()
+        self.assertEqual(stats.waiting, 0)
+        self.assertEqual(stats.cancelled, 1)
+        self.assertEqual(stats.no_show, 1)
+
+    def test_delete_removes_participant(self):
+        """Test that deleting a participant removes its contribution from its day."""
+        participant = Participant.objects.create(queue=self.queue, created_by="staff")
+        Participant.objects.get(pk=participant.pk).delete()
+        stats = self.get_stats()
+        self.assertEqual((stats.joined, stats.waiting, stats.created_by_staff), (0, 0, 0))
+        self.queue.refresh_from_db()
+        self.assertEqual(self.queue.waiting_count, 0)
+
+    def test_ordering_only_save_skips_rollup(self):
+        """Test that saves which do not change the contribution issue no rollup queries."""
+        participant = Participant.objects.create(queue=self.queue)
+        participant = Participant.objects.get(pk=participant.pk)
+        with self.assertNumQueries(1):
+            participant.save(update_fields=['sort_key'])
+
+    def test_rebuild_command(self):
+        """Test that the rebuild command recomputes the rollups from participants."""
+        Participant.objects.create(queue=self.queue, state='completed')
+        Participant.objects.create(queue=self.queue)
+        QueueDailyStats.objects.all().delete()
+        Participant.objects.filter(state='completed').update(
+            joined_at=timezone.now() - timedelta(days=3))
+
+        call_command('rebuild_queue_daily_stats', stdout=StringIO())
+
+        self.assertEqual(self.get_stats().joined, 1)
+        past = QueueDailyStats.objects.get(queue=self.queue,
+                                           day=timezone.localdate() - timedelta(days=3))
+        self.assertEqual(past.joined, 1)
+        self.assertEqual(past.completed, 1)
+        self.assertEqual(past.service_count, 1)
+
+    def test_rebuild_keeps_days_beyond_retention(self):
+        """Test that the rebuild leaves the rollups of days retention may have thinned alone."""
+        old_day = timezone.localdate() - timedelta(days=40)
+        QueueDailyStats.objects.create(queue=self.queue, day=old_day, joined=5, completed=5)
+
+        out = StringIO()
+        call_command('rebuild_queue_daily_stats', '--days', '60', stdout=out)
+
+        self.assertEqual(QueueDailyStats.objects.get(queue=self.queue, day=old_day).joined, 5)
+        self.assertIn("Keeping the rollups before", out.getvalue())
+
+    def test_rebuild_unknown_queue(self):
+        """Test that rebuilding a queue that does not exist is a command error."""
+        with self.assertRaises(CommandError):
+            call_command('rebuild_queue_daily_stats', '--queue', str(self.queue.pk + 1000), stdout=StringIO())
@@ -0,0 +1,73 @@
+from datetime import timedelta
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from manager.models import Queue, QueueDurationSketch
+from manager.utils.category_handler import GeneralQueueHandler
+from participant.models import Participant
+
+
+class QueueDurationSketchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.queue = Queue.objects.create(
+            name="Test Queue",
+            created_by=self.user,
+            category="general",
+            latitude=40.7128,
+            longitude=-74.0060,
+        )
+        self.handler = GeneralQueueHandler()
+
+    def complete(self, wait_minutes):
+        """Serve a participant who waited `wait_minutes` and complete the service."""
+        participant = Participant.objects.create(queue=self.queue)
+        participant.state = 'serving'
+        participant.service_started_at = participant.joined_at + timedelta(minutes=wait_minutes)
+        participant.save()
+        self.handler.complete_service(participant)
+        return participant
+
+    def test_complete_service_records_durations(self):
+        """Test that completing a service adds to the wait and service sketches."""
+        self.complete(10)
+        wait = QueueDurationSketch.objects.get(queue=self.queue, metric=QueueDurationSketch.WAIT)
+        service = QueueDurationSketch.objects.get(queue=self.queue,
+                                                  metric=QueueDurationSketch.SERVICE)
+        self.assertEqual(wait.day, timezone.localdate())
+        self.assertEqual(wait.get_sketch().count, 1)
+        self.assertEqual(service.get_sketch().count, 1)
+
+    def test_waiting_participant_is_not_recorded(self):
+        """Test that completing a participant who was never served records nothing."""
+        participant = Participant.objects.create(queue=self.queue)
+        self.handler.complete_service(participant)
+        self.assertFalse(QueueDurationSketch.objects.exists())
+
+    def test_percentiles(self):
+        """Test the percentiles merged from the daily sketches."""
+        for minutes in range(1, 101):
+            self.complete(minutes)
+        percentiles = self.queue.get_statistics().wait_percentiles
+        self.assertAlmostEqual(percentiles['p50'], 50, delta=1)
+        self.assertAlmostEqual(percentiles['p90'], 90, delta=1)
+        self.assertAlmostEqual(percentiles['p99'], 99, delta=1)
+        self.assertEqual(self.queue.get_statistics().service_percentiles['p99'], 0)
+
+    def test_percentiles_window(self):
+        """Test that sketches outside the window are not merged."""
+        self.complete(30)
+        end_date = timezone.now() - timedelta(days=2)
+        statistics = self.queue.get_statistics(end_date - timedelta(days=1), end_date)
+        self.assertEqual(statistics.wait_percentiles, {'p50': 0, 'p90': 0, 'p99': 0})
+
+    def test_rebuild_matches_recorded_sketches(self):
+        """Test that the rebuild command recreates the incrementally recorded sketches."""
+        for minutes in (5, 12, 40):
+            self.complete(minutes)
+        recorded = {row.metric: row.bins for row in QueueDurationSketch.objects.all()}
+        call_command('rebuild_queue_daily_stats', stdout=StringIO())
+        rebuilt = {row.metric: row.bins for row in QueueDurationSketch.objects.all()}
+        self.assertEqual(rebuilt, recorded)
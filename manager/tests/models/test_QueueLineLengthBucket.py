@@ -0,0 +1,106 @@
+from datetime import timedelta
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import TestCase
+from django.utils import timezone
+from manager.models import Queue, QueueLineLength, QueueLineLengthBucket
+
+
+class QueueLineLengthBucketTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.queue = Queue.objects.create(
+            name="Test Queue",
+            created_by=self.user,
+            category="general",
+            latitude=40.7128,
+            longitude=-74.0060,
+        )
+        self.start = QueueLineLengthBucket.bucket_start(
+            QueueLineLengthBucket.MINUTE, timezone.now()) - timedelta(hours=1)
+        self.end = self.start + timedelta(hours=1)
+        # 10 people for the first 10 minutes, then 0 for the remaining 50.
+        QueueLineLengthBucket.record(self.queue, 10, self.start)
+        QueueLineLengthBucket.record(self.queue, 0, self.start + timedelta(minutes=10))
+
+    def test_record_fills_minute_and_hour_buckets(self):
+        """Test that a sample is added to both resolutions."""
+        QueueLineLengthBucket.record(self.queue, 4, self.start + timedelta(minutes=10, seconds=30))
+        minute = QueueLineLengthBucket.objects.get(
+            queue=self.queue, resolution=QueueLineLengthBucket.MINUTE,
+            start=self.start + timedelta(minutes=10))
+        self.assertEqual(minute.samples, 2)
+        self.assertEqual(minute.peak, 4)
+        self.assertEqual(minute.area, 10 * 600)
+        self.assertEqual(minute.last_length, 4)
+        hours = {QueueLineLengthBucket.bucket_start(QueueLineLengthBucket.HOUR, self.start),
+                 QueueLineLengthBucket.bucket_start(QueueLineLengthBucket.HOUR, minute.start)}
+        self.assertEqual(QueueLineLengthBucket.objects.filter(
+            queue=self.queue, resolution=QueueLineLengthBucket.HOUR).count(), len(hours))
+
+    def test_record_ignores_stale_timestamps(self):
+        """Test that a sample older than the last one adds no area and keeps the last length."""
+        QueueLineLengthBucket.record(self.queue, 7, self.start + timedelta(minutes=5))
+        hour = QueueLineLengthBucket.objects.get(
+            queue=self.queue, resolution=QueueLineLengthBucket.HOUR,
+            start=QueueLineLengthBucket.bucket_start(QueueLineLengthBucket.HOUR, self.start + timedelta(minutes=10)))
+        self.assertEqual(hour.last_length, 0)
+        self.assertEqual(hour.last_at, self.start + timedelta(minutes=10))
+        self.assertEqual(QueueLineLengthBucket.objects.filter(
+            queue=self.queue, resolution=QueueLineLengthBucket.HOUR).aggregate(Sum('area'))['area__sum'], 10 * 600)
+
+    def test_summarize(self):
+        """Test the peak, the event average and the time-weighted average."""
+        metrics = QueueLineLengthBucket.summarize(self.queue, self.start, self.end)
+        self.assertEqual(metrics['peak'], 10)
+        self.assertEqual(metrics['avg'], 5)
+        self.assertAlmostEqual(metrics['time_weighted'], 10 * 600 / 3600)
+
+    def test_summarize_clips_the_window_start(self):
+        """Test that the length carried into the window only counts from the window start."""
+        metrics = QueueLineLengthBucket.summarize(
+            self.queue, self.start + timedelta(minutes=5), self.end)
+        self.assertEqual(metrics['peak'], 0)
+        self.assertAlmostEqual(metrics['time_weighted'], 10 * 300 / 3300)
+
+    def test_summarize_without_samples_in_window(self):
+        """Test that a window without samples reports the length carried into it."""
+        metrics = QueueLineLengthBucket.summarize(
+            self.queue, self.end - timedelta(minutes=5), self.end)
+        self.assertIsNone(metrics['peak'])
+        self.assertEqual(metrics['time_weighted'], 0)
+
+    def test_queue_statistics(self):
+        """Test that the queue reads the line length metrics from the buckets."""
+        self.assertEqual(self.queue.get_peak_line_length(self.start, self.end), 10)
+        self.assertEqual(self.queue.get_avg_line_length(self.start, self.end), 5)
+        self.assertEqual(self.queue.get_time_weighted_line_length(self.start, self.end), 1.7)
+
+    def test_rebuild_matches_recorded_buckets(self):
+        """Test that rebuilding from raw samples gives the incrementally recorded buckets."""
+        QueueLineLengthBucket.objects.all().delete()
+        for _ in range(3):
+            self.queue.record_line_length()
+        fields = ('resolution', 'start', 'samples', 'total', 'peak', 'area',
+                  'opened_from', 'opening_length', 'first_at', 'last_at', 'last_length')
+        recorded = list(QueueLineLengthBucket.objects.order_by('resolution', 'start').values(*fields))
+        QueueLineLengthBucket.rebuild(self.queue.id)
+        rebuilt = list(QueueLineLengthBucket.objects.order_by('resolution', 'start').values(*fields))
+        self.assertEqual(rebuilt, recorded)
+
+    def test_prune(self):
+        """Test that raw samples and minute buckets past their retention are deleted."""
+        self.queue.record_line_length()
+        later = timezone.now() + timedelta(days=30)
+        call_command('prune_queue_line_length', '--chunk-size', '1', stdout=StringIO())
+        self.assertEqual(QueueLineLength.objects.count(), 1)
+        samples, buckets = QueueLineLengthBucket.prune(now=later, chunk_size=1)
+        self.assertEqual(samples, 1)
+        self.assertEqual(QueueLineLength.objects.count(), 0)
+        self.assertFalse(QueueLineLengthBucket.objects.filter(
+            resolution=QueueLineLengthBucket.MINUTE).exists())
+        self.assertTrue(QueueLineLengthBucket.objects.filter(
+            resolution=QueueLineLengthBucket.HOUR).exists())
+        self.assertEqual(buckets, 3)
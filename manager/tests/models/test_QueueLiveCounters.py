@@ -0,0 +1,81 @@
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+from manager.models import Queue
+from manager.utils.category_handler import GeneralQueueHandler
+from participant.models import Participant
+
+
+class QueueLiveCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.queue = Queue.objects.create(
+            name="Test Queue",
+            created_by=self.user,
+            category="general",
+            latitude=40.7128,
+            longitude=-74.0060,
+        )
+        self.handler = GeneralQueueHandler()
+
+    def assertCounters(self, waiting, serving, completed_today):
+        self.assertEqual(self.queue.get_live_counters(), {
+            'waiting': waiting, 'serving': serving, 'completed_today': completed_today})
+        self.assertEqual(Queue.check_live_counters(), {})
+
+    def test_transitions_update_counters(self):
+        """Test that joining, serving, completing and deleting keep the counters exact."""
+        first = Participant.objects.create(queue=self.queue)
+        second = Participant.objects.create(queue=self.queue)
+        self.assertCounters(2, 0, 0)
+
+        first.start_service()
+        self.assertCounters(1, 1, 0)
+
+        first = Participant.objects.get(pk=first.pk)
+        self.handler.complete_service(first)
+        self.assertCounters(1, 0, 1)
+
+        second.state = 'cancelled'
+        second.save()
+        self.assertCounters(0, 0, 1)
+
+        first.delete()
+        self.assertCounters(0, 0, 0)
+
+    def test_stale_queue_save_keeps_counters(self):
+        """Test that saving a queue loaded before a transition does not overwrite the counters."""
+        stale = Queue.objects.get(pk=self.queue.pk)
+        Participant.objects.create(queue=self.queue)
+        stale.edit(name="Renamed")
+        self.assertCounters(1, 0, 0)
+
+    def test_completed_today_resets_daily(self):
+        """Test that completions of a previous day are not reported as today's."""
+        Participant.objects.create(queue=self.queue, state='completed',
+                                   service_completed_at=timezone.now())
+        Queue.objects.filter(pk=self.queue.pk).update(
+            completed_today_date=timezone.localdate() - timezone.timedelta(days=1))
+        self.assertEqual(self.queue.get_live_counters()['completed_today'], 0)
+
+    def test_waiting_count_is_a_primary_key_lookup(self):
+        """Test that the hot-path read does not count participants."""
+        Participant.objects.create(queue=self.queue)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.queue.get_number_waiting_now(), 1)
+
+    def test_reconcile_command(self):
+        """Test that the command reports and repairs drift."""
+        Participant.objects.create(queue=self.queue)
+        Queue.objects.filter(pk=self.queue.pk).update(waiting_count=5, serving_count=-1)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_queue_counters', '--check', stdout=StringIO())
+
+        out = StringIO()
+        call_command('reconcile_queue_counters', stdout=out)
+        self.assertIn("waiting_count 5 != 1", out.getvalue())
+        self.assertCounters(1, 0, 0)
+        call_command('reconcile_queue_counters', '--check', stdout=StringIO())
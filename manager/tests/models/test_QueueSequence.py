@@ -0,0 +1,89 @@
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from manager.models import Queue, QueueSequence
+from manager.utils.category_handler import CategoryHandlerFactory
+from participant.models import Participant
+
+
+class QueueSequenceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.queue = Queue.objects.create(
+            name="Test Queue",
+            created_by=self.user,
+            category="general",
+            latitude=40.7128,
+            longitude=-74.0060,
+        )
+
+    def test_next_sort_key_is_one_statement(self):
+        """Test that ordering keys come from one update per join."""
+        QueueSequence.seed(self.queue.pk)
+        with self.assertNumQueries(1):
+            first = QueueSequence.next_sort_key(self.queue.pk)
+        self.assertEqual(first, QueueSequence.SORT_KEY_GAP)
+        self.assertEqual(QueueSequence.next_sort_key(self.queue.pk), 2 * QueueSequence.SORT_KEY_GAP)
+
+    def test_sequences_are_per_queue(self):
+        """Test that each queue numbers its own participants."""
+        other = Queue.objects.create(name="Other Queue", created_by=self.user,
+                                     category="general", latitude=0, longitude=0)
+        Participant.objects.create(queue=self.queue)
+        participant = Participant.objects.create(queue=other)
+        self.assertEqual(participant.number, "A001")
+        self.assertEqual(participant.position, 1)
+
+    def test_seed_continues_existing_participants(self):
+        """Test that a missing sequence continues after the queue's existing ordering keys."""
+        for _ in range(3):
+            Participant.objects.create(queue=self.queue)
+        Participant.objects.filter(queue=self.queue, number="A003").update(sort_key=10000.5)
+        QueueSequence.objects.filter(queue=self.queue).delete()
+        participant = Participant.objects.create(queue=self.queue)
+        self.assertEqual(participant.sort_key, 11 * QueueSequence.SORT_KEY_GAP)
+        self.assertEqual(participant.position, 4)
+
+    def test_move_to_end_takes_a_fresh_key(self):
+        """Test that moving to the end keeps later joins behind the moved participant."""
+        first = Participant.objects.create(queue=self.queue)
+        Participant.objects.create(queue=self.queue)
+        first.move_to(2)
+        third = Participant.objects.create(queue=self.queue)
+        self.assertEqual(first.position, 2)
+        self.assertEqual(third.position, 3)
+
+    def test_unkeyed_participants_stay_ahead(self):
+        """Test that participants waiting from before ordering keys keep their place until backfilled."""
+        legacy = [Participant.objects.create(queue=self.queue) for _ in range(2)]
+        Participant.objects.filter(pk__in=[p.pk for p in legacy]).update(sort_key=None)
+        QueueSequence.objects.filter(queue=self.queue).update(last_position=0)
+        joiner = Participant.objects.create(queue=self.queue)
+        self.assertEqual(joiner.position, 3)
+        legacy[1].refresh_from_db()
+        self.assertEqual(legacy[1].position, 2)
+        waiting = Participant.with_positions(Participant.objects.filter(queue=self.queue))
+        self.assertEqual([(p.pk, p.position) for p in waiting],
+                         [(legacy[0].pk, 1), (legacy[1].pk, 2), (joiner.pk, 3)])
+        handler = CategoryHandlerFactory.get_handler('general')
+        self.assertEqual(handler.get_next_candidates(self.queue, None).first(), legacy[0])
+
+        call_command('backfill_sort_keys', stdout=StringIO())
+        self.assertFalse(Participant.objects.filter(sort_key__isnull=True).exists())
+        self.assertEqual([p.pk for p in Participant.with_positions(Participant.objects.filter(queue=self.queue))],
+                         [legacy[0].pk, legacy[1].pk, joiner.pk])
+        later = Participant.objects.create(queue=self.queue)
+        self.assertEqual(later.position, 4)
+
+    def test_saving_unkeyed_participant_keeps_its_place(self):
+        """Test that saving a participant waiting from before ordering keys keys the queue in order."""
+        legacy = Participant.objects.create(queue=self.queue)
+        Participant.objects.filter(pk=legacy.pk).update(sort_key=None)
+        joiner = Participant.objects.create(queue=self.queue)
+        legacy.refresh_from_db()
+        legacy.note = "Regular"
+        legacy.save()
+        self.assertIsNotNone(legacy.sort_key)
+        self.assertEqual(legacy.position, 1)
+        self.assertEqual(joiner.position, 2)
@@ -0,0 +1,166 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from datetime import datetime, time
+from unittest import skipIf
+from unittest.mock import patch
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from manager.models import BankQueue, Queue, QueueTicketSequence
+from manager.utils.code_generator import format_ticket_number, parse_ticket_number
+from participant.models import BankParticipant, Participant
+
+
+class QueueTicketSequenceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.queue = Queue.objects.create(
+            name="Test Queue",
+            created_by=self.user,
+            category="general",
+            open_time=time(8, 0),
+            latitude=40.7128,
+            longitude=-74.0060,
+        )
+        QueueTicketSequence._allocator.clear()
+
+    def test_ticket_number_format(self):
+        """Test that unprefixed numbers advance the letter every 999 tickets and never repeat."""
+        self.assertEqual(format_ticket_number(1), "A001")
+        self.assertEqual(format_ticket_number(999), "A999")
+        self.assertEqual(format_ticket_number(1000), "B001")
+        self.assertEqual(format_ticket_number(26 * 999), "Z999")
+        self.assertEqual(format_ticket_number(26 * 999 + 1), "Z1000")
+        self.assertEqual(format_ticket_number(12, "LOA"), "LOA012")
+        for index in (1, 999, 1000, 26 * 999 + 1):
+            self.assertEqual(parse_ticket_number(format_ticket_number(index)), index)
+        self.assertEqual(parse_ticket_number("??"), 0)
+
+    def test_reserve_is_one_statement(self):
+        """Test that numbers are taken with one atomic increment once the series exists."""
+        QueueTicketSequence.seed(self.queue.pk, '', '')
+        with self.assertNumQueries(1):
+            self.assertEqual(QueueTicketSequence.reserve(self.queue.pk), range(1, 2))
+        self.assertEqual(QueueTicketSequence.reserve(self.queue.pk, count=5), range(2, 7))
+
+    def test_seed_continues_existing_numbers(self):
+        """Test that a queue without a sequence continues after its last ticket."""
+        for _ in range(3):
+            Participant.objects.create(queue=self.queue)
+        QueueTicketSequence.objects.all().delete()
+        self.assertEqual(Participant.objects.create(queue=self.queue).number, "A004")
+
+    def test_daily_reset(self):
+        """Test that daily numbering restarts every local day."""
+        self.queue.ticket_reset = 'daily'
+        monday = timezone.make_aware(datetime(2024, 11, 4, 9, 0))
+        tuesday = timezone.make_aware(datetime(2024, 11, 5, 9, 0))
+        self.assertEqual(QueueTicketSequence.allocate(self.queue, at=monday), ("2024-11-04", "A001"))
+        self.assertEqual(QueueTicketSequence.allocate(self.queue, at=monday), ("2024-11-04", "A002"))
+        self.assertEqual(QueueTicketSequence.allocate(self.queue, at=tuesday), ("2024-11-05", "A001"))
+
+    def test_shift_reset(self):
+        """Test that shift numbering restarts at the opening time, including after midnight."""
+        self.queue.ticket_reset = 'shift'
+        late = timezone.make_aware(datetime(2024, 11, 4, 23, 0))
+        after_midnight = timezone.make_aware(datetime(2024, 11, 5, 2, 0))
+        next_shift = timezone.make_aware(datetime(2024, 11, 5, 8, 0))
+        self.assertEqual(self.queue.get_ticket_period(late), "2024-11-04T08:00")
+        self.assertEqual(self.queue.get_ticket_period(after_midnight), "2024-11-04T08:00")
+        self.assertEqual(self.queue.get_ticket_period(next_shift), "2024-11-05T08:00")
+
+    def test_reset_numbers_do_not_clash(self):
+        """Test that participants of different periods may share a number."""
+        self.queue.ticket_reset = 'daily'
+        self.queue.save()
+        first = Participant.objects.create(queue=self.queue)
+        # Pretend the first participant joined on an earlier day.
+        QueueTicketSequence.objects.filter(queue=self.queue).update(period='2000-01-01')
+        Participant.objects.filter(pk=first.pk).update(ticket_period='2000-01-01')
+        second = Participant.objects.create(queue=self.queue)
+        self.assertEqual(first.number, second.number)
+
+    def test_prefix_per_service_type(self):
+        """Test that each service type numbers its own prefixed series."""
+        queue = BankQueue.objects.create(name="Bank", created_by=self.user, category="bank",
+                                         latitude=0, longitude=0, ticket_scheme='service_type',
+                                         ticket_prefixes={'customer_support': 'CS'})
+        loans = [BankParticipant.objects.create(queue=queue, service_type='loan_services')
+                 for _ in range(2)]
+        support = BankParticipant.objects.create(queue=queue, service_type='customer_support')
+        self.assertEqual([p.number for p in loans], ["LOA001", "LOA002"])
+        self.assertEqual(support.number, "CS001")
+
+    def test_prefixes_cannot_collide(self):
+        """Test that prefixes which could repeat another series' numbers are rejected and never used."""
+        queue = BankQueue(name="Bank", created_by=self.user, category="bank", latitude=0, longitude=0,
+                          ticket_scheme='service_type', ticket_prefixes={'loan_services': 'A'})
+        with self.assertRaises(ValidationError):
+            queue.clean()
+        queue.ticket_prefixes = {'loan_services': 'LOANS'}
+        with self.assertRaises(ValidationError):
+            queue.clean()
+        queue.save()
+        loan = BankParticipant.objects.create(queue=queue, service_type='loan_services')
+        untyped = Participant.objects.create(queue=queue)
+        self.assertEqual((loan.number, untyped.number), ("LOA001", "GEN001"))
+
+    @override_settings(TICKET_BLOCK_SIZE=10)
+    def test_block_preallocation(self):
+        """Test that a process reserves numbers in blocks and hands them out locally."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(QueueTicketSequence.next_number(self.queue.pk), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(QueueTicketSequence.next_number(self.queue.pk), 2)
+        self.assertEqual(QueueTicketSequence.objects.get(queue=self.queue).last_number, 10)
+
+    @override_settings(TICKET_BLOCK_SIZE=10)
+    def test_block_discarded_on_rollback(self):
+        """Test that a block reserved by a rolled back transaction is never handed out."""
+        with self.captureOnCommitCallbacks(execute=False):
+            QueueTicketSequence.next_number(self.queue.pk)
+        self.assertEqual(QueueTicketSequence._allocator._blocks, {})
+
+
+    def test_dedupe_ticket_numbers(self):
+        """Test that repeated numbers from older versions are renumbered, keeping the earliest."""
+        out = StringIO()
+        call_command('dedupe_ticket_numbers', '--check', stdout=out)
+        self.assertIn("No duplicate ticket numbers.", out.getvalue())
+
+        first, second, third = (Participant.objects.create(queue=self.queue) for _ in range(3))
+        Participant.objects.filter(pk=third.pk).update(number="A001-2")
+        # The unique constraint keeps the test database from holding real duplicates.
+        with patch('manager.management.commands.dedupe_ticket_numbers.duplicate_ticket_numbers',
+                   return_value=[(second.pk, self.queue.pk, "A001")]):
+            with self.assertRaises(CommandError):
+                call_command('dedupe_ticket_numbers', '--check', stdout=StringIO())
+            call_command('dedupe_ticket_numbers', stdout=StringIO())
+        second.refresh_from_db()
+        self.assertEqual(second.number, "A001-3")
+
+
+@skipIf(connection.vendor == 'sqlite',
+        "In-memory SQLite test databases lock tables instead of queueing concurrent writers; "
+        "set DATABASE_URL to run this on PostgreSQL.")
+class QueueTicketSequenceConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.queue = Queue.objects.create(name="Kiosk Queue", created_by=self.user,
+                                          category="general", latitude=0, longitude=0)
+
+    def join(self, index):
+        try:
+            return Participant.objects.create(name=f"Guest {index}", queue_id=self.queue.pk).number
+        finally:
+            connection.close()
+
+    def test_parallel_joins_get_unique_numbers(self):
+        """Test that 50 parallel joins never share a ticket number."""
+        with ThreadPoolExecutor(max_workers=50) as executor:
+            numbers = list(executor.map(self.join, range(50)))
+        self.assertEqual(len(set(numbers)), 50)
+        self.assertEqual(sorted(numbers), [format_ticket_number(i) for i in range(1, 51)])
@@ -1,7 +1,10 @@
+from io import StringIO
+from django.core.management import call_command
 from django.test import TestCase
 from manager.models import Resource, Queue
 from participant.models import Participant
 from django.utils.timezone import now
+from manager.utils.concurrency import TransitionConflict
 
 class ResourceModelTests(TestCase):
 
@@ -53,6 +56,60 @@ class ResourceModelTests(TestCase):
         self.assertIsNone(self.resource.assigned_to)
         self.assertIsNone(self.participant.resource)
 
+    def test_concurrent_assignment_conflicts(self):
+        """Test that only one of two terminals assigning the same resource succeeds."""
+        other_terminal = Resource.objects.get(pk=self.resource.pk)
+        second = Participant.objects.create(queue=self.queue)
+        self.resource.assign_to_participant(self.participant)
+        with self.assertRaises(TransitionConflict):
+            other_terminal.assign_to_participant(second)
+        self.resource.refresh_from_db()
+        self.assertEqual((self.resource.assigned_to, self.resource.count), (self.participant, 1))
+        second.refresh_from_db()
+        self.assertIsNone(second.resource)
+
+    def test_concurrent_assignment_of_one_participant_to_two_resources(self):
+        """Test that a participant served at one resource leaves the other terminal's resource available."""
+        other_resource = Resource.objects.create(name="Resource 2", queue=self.queue)
+        other_terminal = Participant.objects.get(pk=self.participant.pk)
+        self.resource.assign_to_participant(self.participant)
+        self.participant.start_service()
+        with self.assertRaises(TransitionConflict):
+            other_resource.assign_to_participant(other_terminal)
+        other_resource.refresh_from_db()
+        self.assertEqual((other_resource.status, other_resource.assigned_to, other_resource.count),
+                         ("available", None, 0))
+
+    def test_concurrent_free_conflicts(self):
+        """Test that a resource reassigned since it was read is not freed."""
+        self.resource.assign_to_participant(self.participant)
+        stale = Resource.objects.get(pk=self.resource.pk)
+        self.resource.free()
+        second = Participant.objects.create(queue=self.queue)
+        self.resource.assign_to_participant(second)
+        with self.assertRaises(TransitionConflict):
+            stale.free()
+        self.resource.refresh_from_db()
+        self.assertEqual((self.resource.status, self.resource.assigned_to), ("busy", second))
+
+    def test_backfill_resource_served(self):
+        """Test that participants served before resource_served existed are linked to their resource."""
+        other_queue = Queue.objects.create(name="Other Queue", category="general", latitude=0.0, longitude=0.0)
+        Resource.objects.create(name="Resource 1", queue=other_queue)
+        by_name = Participant.objects.create(queue=self.queue, state="completed")
+        by_fk = Participant.objects.create(queue=self.queue, state="serving")
+        unknown = Participant.objects.create(queue=self.queue, state="completed")
+        Participant.objects.filter(pk=by_name.pk).update(resource_assigned="Resource 1")
+        Participant.objects.filter(pk=by_fk.pk).update(resource=self.resource)
+        Participant.objects.filter(pk=unknown.pk).update(resource_assigned="Gone")
+        self.assertEqual(self.resource.total(), 0)
+
+        call_command('backfill_resource_served', '--chunk-size', '1', stdout=StringIO())
+        self.assertEqual(self.resource.total(), 2)
+        self.assertEqual(set(self.resource.served_participants.values_list('pk', flat=True)), {by_name.pk, by_fk.pk})
+        unknown.refresh_from_db()
+        self.assertIsNone(unknown.resource_served)
+
     def test_is_assigned(self):
         """Test checking if a resource is assigned."""
         self.assertFalse(self.resource.is_assigned())
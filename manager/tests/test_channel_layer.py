@@ -0,0 +1,171 @@
+import asyncio
+import json
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from channels.exceptions import ChannelFull
+from unittest import skipUnless
+from urllib.parse import quote
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from manager.models import ChannelGroupMembership, ChannelMessage
+from manager.utils.channel_layer import DatabaseChannelLayer
+from manager.utils.live_updates import queue_group
+
+
+class DatabaseChannelLayerTests(TestCase):
+    """Two layers on the same database stand for two server processes."""
+
+    def setUp(self):
+        self.sender = DatabaseChannelLayer(poll_interval=0.05)
+        self.receiver = DatabaseChannelLayer(poll_interval=0.05, capacity=2)
+
+    async def asyncTearDown(self):
+        await self.receiver.close()
+
+    async def test_send_reaches_another_process(self):
+        channel = await self.receiver.new_channel()
+        await self.sender.send(channel, {'type': 'queue.changed', 'queue_id': 1})
+        message = await asyncio.wait_for(self.receiver.receive(channel), 5)
+        self.assertEqual(message, {'type': 'queue.changed', 'queue_id': 1})
+        self.assertFalse(await ChannelMessage.objects.aexists())
+
+    async def test_messages_are_received_in_order_per_channel(self):
+        first, second = await self.receiver.new_channel(), await self.receiver.new_channel()
+        await self.sender.send(second, {'type': 'test', 'n': 1})
+        await self.sender.send(first, {'type': 'test', 'n': 2})
+        await self.sender.send(second, {'type': 'test', 'n': 3})
+        self.assertEqual((await asyncio.wait_for(self.receiver.receive(first), 5))['n'], 2)
+        self.assertEqual((await asyncio.wait_for(self.receiver.receive(second), 5))['n'], 1)
+        self.assertEqual((await asyncio.wait_for(self.receiver.receive(second), 5))['n'], 3)
+
+    async def test_group_send_reaches_members_only(self):
+        member, other = await self.receiver.new_channel(), await self.receiver.new_channel()
+        await self.receiver.group_add(queue_group(1), member)
+        await self.receiver.group_add(queue_group(2), other)
+        await self.sender.group_send(queue_group(1), {'type': 'queue.changed', 'queue_id': 1})
+        self.assertEqual((await asyncio.wait_for(self.receiver.receive(member), 5))['queue_id'], 1)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.receiver.receive(other), 0.3)
+
+        await self.receiver.group_discard(queue_group(1), member)
+        await self.sender.group_send(queue_group(1), {'type': 'queue.changed', 'queue_id': 1})
+        self.assertFalse(await ChannelMessage.objects.aexists())
+
+    async def test_capacity(self):
+        # A channel of a process that stopped receiving
+        channel = 'specific.stopped!socket'
+        await self.receiver.group_add('group', channel)
+        for _ in range(2):
+            await self.receiver.send(channel, {'type': 'test'})
+        with self.assertRaises(ChannelFull):
+            await self.receiver.send(channel, {'type': 'test'})
+        # Group members that are full are skipped, in every insert batch
+        self.receiver.INSERT_BATCH = 1
+        await self.receiver.group_add('group', 'specific.stopped!other')
+        await self.receiver.group_send('group', {'type': 'test'})
+        self.assertEqual(await ChannelMessage.objects.acount(), 3)
+        self.assertEqual(await ChannelMessage.objects.filter(channel=channel).acount(), 2)
+
+    async def test_expired_messages_and_memberships_are_ignored(self):
+        channel = await self.receiver.new_channel()
+        await self.receiver.group_add('group', channel)
+        await ChannelGroupMembership.objects.aupdate(expires_at=timezone.now() - timedelta(seconds=1))
+        await self.sender.group_send('group', {'type': 'test'})
+        self.assertFalse(await ChannelMessage.objects.aexists())
+
+        await DatabaseChannelLayer(expiry=0).send(channel, {'type': 'test'})
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.receiver.receive(channel), 0.3)
+
+    async def test_flush(self):
+        channel = await self.receiver.new_channel()
+        await self.receiver.group_add('group', channel)
+        await self.sender.send(channel, {'type': 'test'})
+        await self.receiver.flush()
+        self.assertFalse(await ChannelMessage.objects.aexists())
+        self.assertFalse(await ChannelGroupMembership.objects.aexists())
+
+    def test_prune(self):
+        now = timezone.now()
+        ChannelMessage.objects.create(channel='a', inbox='a', message={}, expires_at=now - timedelta(seconds=1))
+        ChannelMessage.objects.create(channel='b', inbox='b', message={}, expires_at=now + timedelta(seconds=60))
+        ChannelGroupMembership.objects.create(group='g', channel='a', expires_at=now - timedelta(seconds=1))
+        self.assertEqual(ChannelMessage.prune(now=now, chunk_size=1), (1, 1))
+        self.assertEqual(list(ChannelMessage.objects.values_list('channel', flat=True)), ['b'])
+
+
+class MultiProcessMixin:
+    """Runs server processes sharing the database `self.database` with `channel_layer_process.py`."""
+    script = Path(__file__).with_name('channel_layer_process.py')
+
+    def run_process(self, *args):
+        return subprocess.Popen([sys.executable, str(self.script), self.database, *args],
+                                stdout=subprocess.PIPE, text=True)
+
+    def assertQueueChangeReachesAnotherProcess(self):
+        receiver = self.run_process('receive', '7')
+        try:
+            self.assertEqual(receiver.stdout.readline().strip(), 'ready')
+            self.assertEqual(self.run_process('send', '7').wait(timeout=60), 0)
+            output, _ = receiver.communicate(timeout=60)
+        finally:
+            receiver.kill()
+            receiver.stdout.close()
+        self.assertEqual(receiver.returncode, 0)
+        self.assertEqual(json.loads(output), {'type': 'queue.changed', 'queue_id': 7})
+
+
+class MultiProcessChannelLayerTests(MultiProcessMixin, SimpleTestCase):
+    """Queue change events published by one process reach the sockets of another."""
+
+    def test_queue_change_reaches_another_process(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.database = str(Path(directory) / 'channel_layer.sqlite3')
+            self.assertEqual(self.run_process('setup').wait(timeout=60), 0)
+            self.assertQueueChangeReachesAnotherProcess()
+
+
+@skipUnless(connection.vendor == 'postgresql', "LISTEN/NOTIFY needs the test database on PostgreSQL (DATABASE_URL).")
+class PostgresChannelLayerTests(MultiProcessMixin, TransactionTestCase):
+    """Receivers are woken up by notifications rather than polling."""
+
+    def setUp(self):
+        # Polling alone would not deliver within the tests' timeouts
+        self.receiver = DatabaseChannelLayer(poll_interval=60)
+        self.receiver.LISTEN_POLL_INTERVAL = 60
+        database = connection.settings_dict
+        self.database = (f"postgres://{quote(database['USER'])}:{quote(database['PASSWORD'])}"
+                         f"@{database['HOST'] or 'localhost'}:{database['PORT'] or 5432}/{database['NAME']}")
+
+    async def asyncTearDown(self):
+        await self.receiver.close()
+
+    async def wait_until_listening(self):
+        inbox = self.receiver._inboxes[asyncio.get_running_loop()]
+        for _ in range(100):
+            if inbox.listening:
+                return
+            await asyncio.sleep(0.05)
+        self.fail("The receiver never started listening.")
+
+    async def test_notification_wakes_receiver(self):
+        channel = await self.receiver.new_channel()
+        await self.wait_until_listening()
+        await DatabaseChannelLayer().send(channel, {'type': 'queue.changed', 'queue_id': 1})
+        message = await asyncio.wait_for(self.receiver.receive(channel), 5)
+        self.assertEqual(message, {'type': 'queue.changed', 'queue_id': 1})
+
+    async def test_notifications_of_other_inboxes_are_ignored(self):
+        channel = await self.receiver.new_channel()
+        await self.wait_until_listening()
+        await DatabaseChannelLayer().send('specific.other!socket', {'type': 'test'})
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.receiver.receive(channel), 0.5)
+        self.assertTrue(await ChannelMessage.objects.filter(channel='specific.other!socket').aexists())
+
+    def test_queue_change_reaches_another_process(self):
+        self.assertQueueChangeReachesAnotherProcess()
@@ -0,0 +1,48 @@
+from django.test import TestCase, override_settings
+from manager.models import Queue
+from manager.utils import code_generator
+from manager.utils.code_generator import (CODE_ALPHABET, CODE_HALF, CODE_LENGTH, decode_code,
+                                          encode_code, generate_many, generate_unique_code)
+from participant.models import Participant
+
+
+class CodeGeneratorTests(TestCase):
+    def setUp(self):
+        code_generator._code_allocator.clear()
+
+    def test_encoding_is_a_permutation(self):
+        """Test that codes have the expected shape and decode back to their IDs."""
+        ids = list(range(1000)) + [CODE_HALF ** 2 - 1]
+        codes = [encode_code(sequence_id, 'test') for sequence_id in ids]
+        self.assertEqual(len(set(codes)), len(ids))
+        for sequence_id, code in zip(ids, codes):
+            self.assertEqual(len(code), CODE_LENGTH)
+            self.assertTrue(set(code) <= set(CODE_ALPHABET))
+            self.assertEqual(decode_code(code, 'test'), sequence_id)
+        self.assertNotEqual(encode_code(1, 'test'), encode_code(1, 'other'))
+        with self.assertRaises(ValueError):
+            encode_code(CODE_HALF ** 2, 'test')
+
+    def test_generate_unique_code_needs_no_lookups(self):
+        """Test that a code costs at most one increment and never an existence check."""
+        code = generate_unique_code(Participant)
+        with self.assertNumQueries(1):
+            self.assertNotEqual(generate_unique_code(Participant), code)
+
+    @override_settings(CODE_BLOCK_SIZE=10)
+    def test_generate_unique_code_uses_blocks(self):
+        """Test that codes come from the process's block once its reservation commits."""
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_unique_code(Queue)
+        with self.assertNumQueries(0):
+            codes = {generate_unique_code(Queue) for _ in range(9)}
+        self.assertEqual(len(codes), 9)
+
+    def test_generate_many(self):
+        """Test that many codes are generated with one query."""
+        generate_unique_code(Participant)
+        with self.assertNumQueries(1):
+            codes = generate_many(Participant, 50)
+        self.assertEqual(len(set(codes)), 50)
+        self.assertNotIn(generate_unique_code(Participant), codes)
+        self.assertEqual(generate_many(Participant, 0), [])
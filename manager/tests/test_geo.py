@@ -0,0 +1,30 @@
+from django.test import TestCase
+from manager.utils.geo import bounding_box, cells_in_box, geo_cell, haversine_km, MAX_GEO_CELLS
+
+
+class GeoTests(TestCase):
+    def test_haversine(self):
+        """Test the great-circle distance against a known value."""
+        self.assertAlmostEqual(haversine_km(0, 0, 0, 1), 111.19, places=2)
+        self.assertEqual(haversine_km(13.75, 100.5, 13.75, 100.5), 0)
+
+    def test_bounding_box_contains_circle(self):
+        """Test that every cell within the radius is covered by the box."""
+        latitude_range, longitude_ranges = bounding_box(13.75, 100.5, 10)
+        cells = cells_in_box(latitude_range, longitude_ranges)
+        self.assertIn(geo_cell(13.75 + 0.089, 100.5), cells)
+        self.assertIn(geo_cell(13.75, 100.5 - 0.092), cells)
+
+    def test_bounding_box_edges(self):
+        """Test the antimeridian split and the pole fallback."""
+        _, longitude_ranges = bounding_box(0, 179.99, 5)
+        self.assertEqual(len(longitude_ranges), 2)
+        _, longitude_ranges = bounding_box(89.99, 0, 5)
+        self.assertEqual(longitude_ranges, [(-180, 180)])
+
+    def test_too_many_cells(self):
+        """Test that large boxes skip the cell filter."""
+        latitude_range, longitude_ranges = bounding_box(0, 0, 1000)
+        self.assertIsNone(cells_in_box(latitude_range, longitude_ranges))
+        latitude_range, longitude_ranges = bounding_box(0, 0, 2)
+        self.assertLessEqual(len(cells_in_box(latitude_range, longitude_ranges)), MAX_GEO_CELLS)
@@ -0,0 +1,207 @@
+import asyncio
+import json
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from unittest.mock import patch
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from manager.models import Queue
+from manager.routing import websocket_urlpatterns as manager_websocket_urlpatterns
+from manager.utils import live_updates
+from manager.utils.live_updates import build_display_state, build_status_states, queue_group
+from manager.utils.state_patch import apply_patch
+from participant.models import Notification, Participant
+from participant.routing import websocket_urlpatterns as participant_websocket_urlpatterns
+
+application = URLRouter(manager_websocket_urlpatterns + participant_websocket_urlpatterns)
+
+
+@override_settings(LIVE_UPDATE_RESYNC_SECONDS=0)
+class LiveUpdateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.queue = Queue.objects.create(name='General Queue', created_by=self.user,
+                                          estimated_wait_time_per_turn=5, latitude=13.7285, longitude=100.5163)
+        self.participant = Participant.objects.create(name='John Doe', queue=self.queue)
+        self.others = [Participant.objects.create(name=f"Guest {index}", queue=self.queue)
+                       for index in range(8)]
+
+    def add_participant(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Participant.objects.create(name=name, queue=self.queue)
+
+    def serve(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.participant.state = 'serving'
+            self.participant.save()
+
+    def notify(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(queue=self.queue, participant=self.participant,
+                                        message="Your turn")
+
+    def test_changes_publish_after_commit(self):
+        """Test that saving a participant publishes to the queue's groups only once committed."""
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(queue_group(self.queue.pk), channel)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.participant.state = 'serving'
+            self.participant.save()
+        self.assertEqual(len(callbacks), 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(async_to_sync(channel_layer.receive)(channel),
+                         {'type': 'queue.changed', 'queue_id': self.queue.pk})
+        async_to_sync(channel_layer.flush)()
+
+    @staticmethod
+    def apply(snapshot, message):
+        """Return the state after a message following a snapshot, which is a patch or a smaller snapshot."""
+        if message['type'] == 'snapshot':
+            return message['state']
+        return apply_patch(snapshot['state'], message['ops'], snapshot['keys'])
+
+    async def connect(self, path):
+        communicator = WebsocketCommunicator(application, path)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_display_pushes_on_events_only(self):
+        """Test that the manager display is sent a snapshot on connect and a patch on each change, without polling."""
+        communicator = await self.connect(f"/ws/queue/display/{self.queue.pk}/")
+        snapshot = json.loads(await communicator.receive_from())
+        self.assertEqual((snapshot['type'], snapshot['version']), ('snapshot', 1))
+        self.assertEqual(len(snapshot['state']['participants']), 9)
+        self.assertTrue(await communicator.receive_nothing(0.2))
+
+        other = await sync_to_async(self.add_participant)('Jane Doe')
+        patch_message = json.loads(await communicator.receive_from())
+        self.assertEqual((patch_message['type'], patch_message['base'], patch_message['version']),
+                         ('patch', 1, 2))
+        self.assertEqual([(op['op'], op['value']['number']) for op in patch_message['ops']],
+                         [('insert', other.number)])
+        state = apply_patch(snapshot['state'], patch_message['ops'], snapshot['keys'])
+        self.assertEqual(len(state['participants']), 10)
+        await communicator.disconnect()
+
+    async def test_group_membership_is_renewed(self):
+        """Test that the hub keeps receiving events after its group membership expired, without resyncing."""
+        with patch.object(live_updates, 'group_renew_interval', return_value=0.05):
+            communicator = await self.connect(f"/ws/queue/display/{self.queue.pk}/")
+        await communicator.receive_from()
+        hub = live_updates.QueueSnapshotHub.get()
+        # The channel layer expired the membership
+        await get_channel_layer().group_discard(queue_group(self.queue.pk), hub.channel_name)
+        await asyncio.sleep(0.2)
+
+        await sync_to_async(self.add_participant)('Jane Doe')
+        self.assertEqual(json.loads(await communicator.receive_from())['type'], 'patch')
+        await communicator.disconnect()
+
+    async def test_status_page_pushes_notifications(self):
+        """Test that a participant's status page is sent a new notification as one appended item."""
+        communicator = await self.connect(f"/ws/status/{self.participant.code}/")
+        snapshot = json.loads(await communicator.receive_from())
+        self.assertEqual(snapshot['state']['notification_set'], [])
+
+        await sync_to_async(self.notify)()
+        patch_message = json.loads(await communicator.receive_from())
+        inserts = [op for op in patch_message['ops'] if op['op'] == 'insert']
+        self.assertEqual([(op['path'], op['value']['message']) for op in inserts],
+                         [('notification_set', "Your turn")])
+        await communicator.disconnect()
+
+    async def test_notifications_are_played_once_acknowledged(self):
+        """Test that reading a status does not mark notifications as played, the page's acknowledgement does."""
+        communicator = await self.connect(f"/ws/status/{self.participant.code}/")
+        await communicator.receive_from()
+        await sync_to_async(self.notify)()
+        await communicator.receive_from()
+        notification = await Notification.objects.aget(participant=self.participant)
+        self.assertFalse(notification.played_sound)
+
+        await communicator.send_to(text_data=json.dumps({'type': 'played', 'ids': [notification.id]}))
+        patch_message = json.loads(await communicator.receive_from())
+        self.assertIn({'op': 'update', 'path': 'notification_set', 'key': notification.id,
+                       'value': {'played_sound': True}}, patch_message['ops'])
+        await notification.arefresh_from_db()
+        self.assertTrue(notification.played_sound)
+        await communicator.disconnect()
+
+    async def test_sockets_share_one_read(self):
+        """Test that a change is read once per queue and the same message is fanned out to every socket of a view."""
+        other = self.others[0]
+        communicators = [await self.connect(path) for path in (
+            f"/ws/queue/display/{self.queue.pk}/", f"/ws/queue/display/{self.queue.pk}/",
+            f"/ws/status/{self.participant.code}/", f"/ws/status/{other.code}/")]
+        snapshots = [json.loads(await communicator.receive_from()) for communicator in communicators]
+
+        with patch.object(live_updates, 'build_states', wraps=live_updates.build_states) as build:
+            await sync_to_async(self.serve)()
+            patches = [await communicator.receive_from() for communicator in communicators]
+        build.assert_called_once_with(self.queue.pk, True, sorted([self.participant.code, other.code]))
+        self.assertEqual(patches[0], patches[1])
+        states = [self.apply(snapshot, json.loads(text)) for snapshot, text in zip(snapshots, patches)]
+        self.assertEqual(states[0]['next_in_line'], other.number)
+        self.assertEqual([(state['state'], state['position']) for state in states[2:]],
+                         [('serving', None), ('waiting', 1)])
+        for communicator in communicators:
+            await communicator.disconnect()
+
+    async def test_resume_from_version(self):
+        """Test that a client reconnecting or resyncing from a kept version is only sent the missed patches."""
+        watcher = await self.connect(f"/ws/queue/display/{self.queue.pk}/")
+        await watcher.receive_from()
+        client = await self.connect(f"/ws/queue/display/{self.queue.pk}/")
+        snapshot = json.loads(await client.receive_from())
+        await client.disconnect()
+
+        for name in ('Jane Doe', 'Jim Doe'):
+            await sync_to_async(self.add_participant)(name)
+            await watcher.receive_from()
+
+        client = await self.connect(
+            f"/ws/queue/display/{self.queue.pk}/?stream={snapshot['stream']}&version={snapshot['version']}")
+        missed = [json.loads(await client.receive_from()) for _ in range(2)]
+        self.assertEqual([(message['type'], message['version']) for message in missed],
+                         [('patch', 2), ('patch', 3)])
+        state = snapshot['state']
+        for message in missed:
+            state = apply_patch(state, message['ops'], snapshot['keys'])
+        self.assertEqual(len(state['participants']), 11)
+
+        await client.send_to(text_data=json.dumps({'type': 'resync', 'stream': snapshot['stream'], 'version': 2}))
+        self.assertEqual(json.loads(await client.receive_from())['version'], 3)
+        await client.send_to(text_data=json.dumps({'type': 'resync', 'stream': 'other', 'version': 2}))
+        self.assertEqual(json.loads(await client.receive_from())['type'], 'snapshot')
+        await client.disconnect()
+        await watcher.disconnect()
+
+    def test_status_states_query_count(self):
+        """Test that reading the status of more participants takes no more queries."""
+        codes = [self.participant.code]
+        with self.assertNumQueries(3):
+            build_status_states(self.queue.pk, codes)
+        codes += [participant.code for participant in self.others]
+        with self.assertNumQueries(3):
+            states = build_status_states(self.queue.pk, codes)
+        self.assertEqual(sorted(states), sorted(codes))
+
+    def test_display_state_estimates_once_per_queue(self):
+        """Test that the display does not count the queue's servers for every waiting participant."""
+        self.queue.wait_estimator = 'parallelism'
+        self.queue.save()
+        Participant.objects.filter(pk__in=[participant.pk for participant in self.others]).delete()
+        with CaptureQueriesContext(connection) as few:
+            build_display_state(self.queue.pk)
+        self.others = [Participant.objects.create(name=f"Guest {index}", queue=self.queue) for index in range(8)]
+        with self.assertNumQueries(len(few.captured_queries)):
+            state = build_display_state(self.queue.pk)
+        self.assertEqual(len(state['participants']), 9)
@@ -0,0 +1,53 @@
+import random
+from django.test import TestCase
+from manager.utils.quantile_sketch import QuantileSketch
+
+
+class QuantileSketchTests(TestCase):
+    def setUp(self):
+        generator = random.Random(42)
+        self.values = [generator.lognormvariate(6, 1) for _ in range(5000)]
+
+    def exact_quantile(self, values, q):
+        ordered = sorted(values)
+        return ordered[int(q * (len(ordered) - 1))]
+
+    def test_quantiles_within_relative_accuracy(self):
+        """Test that the estimates stay within the relative accuracy of the exact quantiles."""
+        sketch = QuantileSketch()
+        for value in self.values:
+            sketch.add(value)
+        self.assertEqual(sketch.count, len(self.values))
+        for q in (0, 0.5, 0.9, 0.99, 1):
+            exact = self.exact_quantile(self.values, q)
+            self.assertLessEqual(abs(sketch.quantile(q) - exact),
+                                 exact * sketch.relative_accuracy + 1e-9)
+
+    def test_merge_equals_single_sketch(self):
+        """Test that merging partial sketches gives the sketch of all values."""
+        whole = QuantileSketch()
+        parts = [QuantileSketch(), QuantileSketch()]
+        for i, value in enumerate(self.values):
+            whole.add(value)
+            parts[i % 2].add(value)
+        parts[0].merge(parts[1])
+        self.assertEqual(parts[0].bins, whole.bins)
+        self.assertEqual(parts[0].quantile(0.9), whole.quantile(0.9))
+
+    def test_round_trip(self):
+        """Test that a sketch survives serialization to JSON-compatible bins."""
+        sketch = QuantileSketch()
+        sketch.add(0)
+        sketch.add(120)
+        restored = QuantileSketch(bins=sketch.to_dict(), zero_count=sketch.zero_count)
+        self.assertEqual(restored.quantile(0), 0)
+        self.assertEqual(restored.quantile(1), sketch.quantile(1))
+
+    def test_empty_and_invalid(self):
+        """Test the empty sketch and out-of-range quantiles."""
+        sketch = QuantileSketch()
+        self.assertIsNone(sketch.quantile(0.5))
+        with self.assertRaises(ValueError):
+            sketch.quantile(1.5)
+        with self.assertRaises(ValueError):
+            sketch.merge(QuantileSketch(relative_accuracy=0.05))
@@ -0,0 +1,295 @@
+import math
+from datetime import timedelta
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from manager.models import Queue, Resource
+from manager.utils.helpers import format_duration
+from manager.utils.queue_statistics import QueueStatistics
+from participant.models import Participant
+
+
+class QueueStatisticsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.queue = Queue.objects.create(
+            name="Test Queue",
+            created_by=self.user,
+            category="general",
+            latitude=40.7128,
+            longitude=-74.0060,
+        )
+        now = timezone.now()
+        Participant.objects.create(queue=self.queue, state="waiting", created_by="guest")
+        Participant.objects.create(
+            queue=self.queue,
+            state="serving",
+            created_by="staff",
+            service_started_at=now + timedelta(minutes=10, seconds=30),
+        )
+        Participant.objects.create(
+            queue=self.queue,
+            state="completed",
+            created_by="guest",
+            service_started_at=now + timedelta(minutes=5, seconds=30),
+            service_completed_at=now + timedelta(minutes=25, seconds=59),
+        )
+        Participant.objects.create(queue=self.queue, state="cancelled", created_by="guest")
+        Participant.objects.create(queue=self.queue, state="no_show", created_by="staff")
+
+    def test_counts(self):
+        """Test that every count is aggregated from the queue's participants."""
+        statistics = QueueStatistics(self.queue)
+        self.assertEqual(statistics.total, 5)
+        self.assertEqual(statistics.active, 4)
+        self.assertEqual(statistics.waiting, 1)
+        self.assertEqual(statistics.serving, 1)
+        self.assertEqual(statistics.served, 1)
+        self.assertEqual(statistics.dropoff, 2)
+        self.assertEqual(statistics.unhandled, 2)
+        self.assertEqual(statistics.created_by_guest, 3)
+        self.assertEqual(statistics.created_by_staff, 2)
+
+    def test_percentages(self):
+        """Test that percentages are derived from the aggregated counts."""
+        statistics = QueueStatistics(self.queue)
+        self.assertEqual(statistics.served_percentage, 20.0)
+        self.assertEqual(statistics.dropoff_percentage, 40.0)
+        self.assertEqual(statistics.unhandled_percentage, 40.0)
+        self.assertEqual(statistics.guest_percentage, 60.0)
+        self.assertEqual(statistics.cancelled_percentage, 50.0)
+        self.assertEqual(statistics.no_show_percentage, 50.0)
+
+    def test_durations(self):
+        """Test that wait and service durations are truncated to whole minutes."""
+        statistics = QueueStatistics(self.queue)
+        self.assertEqual(statistics.max_waiting_time, 10)
+        self.assertEqual(statistics.average_waiting_time, 8)
+        self.assertEqual(statistics.average_service_duration, 20)
+        self.assertEqual(statistics.max_service_duration, 20)
+
+    def test_participant_metrics_use_a_single_query(self):
+        """Test that reading every participant metric costs one query."""
+        statistics = QueueStatistics(self.queue)
+        with self.assertNumQueries(1):
+            statistics.total
+            statistics.served_percentage
+            statistics.no_show_percentage
+            statistics.average_waiting_time
+            statistics.max_service_duration
+
+    def test_date_window(self):
+        """Test that participants outside the date window are ignored."""
+        Participant.objects.filter(state="waiting").update(
+            joined_at=timezone.now() - timedelta(days=10))
+        end_date = timezone.now() + timedelta(hours=1)
+        statistics = QueueStatistics(self.queue, end_date - timedelta(days=7), end_date)
+        self.assertEqual(statistics.total, 4)
+        self.assertEqual(statistics.waiting, 0)
+
+    def test_empty_queue(self):
+        """Test that an empty queue reports zeros."""
+        self.queue.participant_set.all().delete()
+        statistics = QueueStatistics(self.queue)
+        self.assertEqual(statistics.total, 0)
+        self.assertEqual(statistics.served_percentage, 0)
+        self.assertEqual(statistics.average_waiting_time, 0)
+        self.assertEqual(statistics.max_service_duration, 0)
+        self.assertEqual(statistics.peak_line_length, 0)
+        self.assertEqual(statistics.avg_line_length, 0)
+
+
+# The history reaches past the default retention, which the rebuild would leave alone
+@override_settings(PARTICIPANT_RETENTION_DAYS=60)
+class QueueStatisticsRollupTests(TestCase):
+    def setUp(self):
+        self.queue = Queue.objects.create(
+            name="Test Queue",
+            category="general",
+            latitude=40.7128,
+            longitude=-74.0060,
+        )
+        now = timezone.now()
+        history = [(0, 'waiting'), (2, 'completed'), (5, 'cancelled'), (40, 'completed')]
+        participants = [Participant.objects.create(queue=self.queue, state=state)
+                        for _, state in history]
+        for participant, (days_ago, _) in zip(participants, history):
+            joined_at = now - timedelta(days=days_ago)
+            Participant.objects.filter(pk=participant.pk).update(
+                joined_at=joined_at,
+                service_started_at=joined_at + timedelta(minutes=days_ago + 1),
+                service_completed_at=joined_at + timedelta(minutes=days_ago + 30),
+            )
+        call_command('rebuild_queue_daily_stats', stdout=StringIO())
+
+    def assertSameMetrics(self, start_date, end_date):
+        live = QueueStatistics(self.queue, start_date, end_date)
+        rollup = QueueStatistics(self.queue, start_date, end_date, use_rollups=True)
+        self.assertEqual(rollup.participant_metrics, live.participant_metrics)
+
+    def test_rollups_match_live_statistics(self):
+        """Test that reading whole days from the rollups gives the live results."""
+        end_date = timezone.now()
+        self.assertSameMetrics(end_date - timedelta(days=7), end_date)
+        self.assertSameMetrics(end_date - timedelta(days=30), end_date)
+        self.assertSameMetrics(None, end_date)
+
+    def test_rollups_read_past_days_without_scanning(self):
+        """Test that past days come from the rollups rather than the participants."""
+        Participant.objects.filter(state='cancelled').delete()
+        statistics = QueueStatistics(self.queue, None, timezone.now(), use_rollups=True)
+        self.assertEqual(statistics.total, 4)
+        self.assertEqual(statistics.cancelled, 1)
+        with self.assertNumQueries(0):
+            statistics.average_service_duration
+
+
+class DurationCompatibilityTests(TestCase):
+    """
+    Check the database-side duration aggregates against the Python implementation.
+
+    The offsets include sub-minute remainders and exact minute boundaries so that
+    truncation differences between backends would show up.
+    """
+    OFFSETS = [
+        (timedelta(seconds=59), timedelta(minutes=1)),
+        (timedelta(minutes=3, seconds=1), timedelta(minutes=7, seconds=59, microseconds=999999)),
+        (timedelta(minutes=12), timedelta(minutes=2, microseconds=1)),
+        (timedelta(hours=2, minutes=5, seconds=30), timedelta(seconds=30)),
+        (timedelta(days=1, minutes=1), timedelta(hours=1, seconds=1)),
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.queue = Queue.objects.create(
+            name="Test Queue",
+            created_by=self.user,
+            category="general",
+            latitude=40.7128,
+            longitude=-74.0060,
+        )
+        self.resource = Resource.objects.create(name="Counter 1", queue=self.queue)
+        participants = [Participant.objects.create(queue=self.queue, resource_served=self.resource)
+                        for _ in self.OFFSETS]
+        participants.append(Participant.objects.create(queue=self.queue, state="serving",
+                                                       resource_served=self.resource))
+        joined_at = timezone.now() - timedelta(days=2)
+        for participant, (wait, service) in zip(participants, self.OFFSETS):
+            Participant.objects.filter(pk=participant.pk).update(
+                state="completed",
+                joined_at=joined_at,
+                service_started_at=joined_at + wait,
+                service_completed_at=joined_at + wait + service,
+            )
+        Participant.objects.filter(pk=participants[-1].pk).update(
+            joined_at=joined_at, service_started_at=joined_at + timedelta(minutes=4, seconds=59))
+        Participant.objects.create(queue=self.queue, state="completed", resource_served=self.resource)
+        self.participants = list(Participant.objects.filter(queue=self.queue))
+
+    def python_wait_times(self):
+        return [p.get_wait_time() for p in self.participants
+                if p.state in ('serving', 'completed') and p.get_wait_time() is not None]
+
+    def python_service_durations(self):
+        return [p.get_service_duration() for p in self.participants if p.state == 'completed']
+
+    def test_queue_durations_match_python(self):
+        """Test that the queue aggregates equal the per-participant Python computations."""
+        wait_times = self.python_wait_times()
+        service_durations = self.python_service_durations()
+        statistics = QueueStatistics(self.queue)
+        self.assertEqual(statistics.max_waiting_time, max(wait_times))
+        self.assertEqual(statistics.average_waiting_time,
+                         math.ceil(sum(wait_times) / len(wait_times)))
+        self.assertEqual(statistics.max_service_duration, max(service_durations))
+        self.assertEqual(statistics.average_service_duration,
+                         math.ceil(sum(service_durations) / len(service_durations)))
+
+    def test_resource_durations_match_python(self):
+        """Test that the resource averages equal the per-participant Python computations."""
+        wait_times = self.python_wait_times()
+        service_durations = self.python_service_durations()
+        with self.assertNumQueries(1):
+            avg_wait_time = self.resource.avg_wait_time()
+        with self.assertNumQueries(1):
+            avg_serve_time = self.resource.avg_serve_time()
+        self.assertEqual(avg_wait_time,
+                         format_duration(math.ceil(sum(wait_times) / len(wait_times))))
+        self.assertEqual(avg_serve_time,
+                         format_duration(math.ceil(sum(service_durations) / len(service_durations))))
+
+
+class ResourceMetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.queue = Queue.objects.create(
+            name="Test Queue",
+            created_by=self.user,
+            category="general",
+            latitude=40.7128,
+            longitude=-74.0060,
+        )
+        self.other_queue = Queue.objects.create(
+            name="Other Queue",
+            created_by=self.user,
+            category="general",
+            latitude=40.7128,
+            longitude=-74.0060,
+        )
+        self.counter = Resource.objects.create(name="Counter 1", queue=self.queue)
+        self.idle = Resource.objects.create(name="Counter 2", queue=self.queue)
+        self.same_name = Resource.objects.create(name="Counter 1", queue=self.other_queue)
+        now = timezone.now()
+        Participant.objects.create(
+            queue=self.queue,
+            state="completed",
+            resource_served=self.counter,
+            service_started_at=now + timedelta(minutes=4, seconds=30),
+            service_completed_at=now + timedelta(minutes=14, seconds=30),
+        )
+        Participant.objects.create(queue=self.queue, state="cancelled", resource_served=self.counter)
+        Participant.objects.create(queue=self.other_queue, state="completed",
+                                   resource_served=self.same_name)
+
+    def test_resource_metrics(self):
+        """Test that each resource of the queue is aggregated in a single query."""
+        with self.assertNumQueries(1):
+            metrics = QueueStatistics(self.queue).resource_metrics()
+        self.assertEqual([row['resource'] for row in metrics], [self.counter, self.idle])
+        counter, idle = metrics
+        self.assertEqual(counter['total'], 2)
+        self.assertEqual(counter['served'], 1)
+        self.assertEqual(counter['dropoff'], 1)
+        self.assertEqual(counter['completed'], 1)
+        self.assertEqual(counter['avg_wait'], 4)
+        self.assertEqual(counter['avg_serve'], 10)
+        self.assertEqual(idle['total'], 0)
+        self.assertEqual(idle['avg_wait'], 0)
+
+    def test_resource_metrics_match_resource_methods(self):
+        """Test that the grouped metrics agree with the per-resource methods."""
+        counter = QueueStatistics(self.queue).resource_metrics()[0]
+        self.assertEqual(counter['total'], self.counter.total())
+        self.assertEqual(counter['served'], self.counter.served())
+        self.assertEqual(counter['dropoff'], self.counter.dropoff())
+        self.assertEqual(counter['completed'], self.counter.completed())
+        self.assertEqual(format_duration(counter['avg_wait']), self.counter.avg_wait_time())
+        self.assertEqual(format_duration(counter['avg_serve']), self.counter.avg_serve_time())
+
+    def test_resource_metrics_date_window(self):
+        """Test that the date window keeps resources whose participants fall outside it."""
+        end_date = timezone.now() - timedelta(days=1)
+        metrics = QueueStatistics(self.queue, end_date - timedelta(days=1), end_date).resource_metrics()
+        self.assertEqual([row['total'] for row in metrics], [0, 0])
+
+    def test_freed_resource_is_remembered(self):
+        """Test that a participant keeps its served resource after the resource is freed."""
+        participant = Participant.objects.create(queue=self.queue)
+        self.idle.assign_to_participant(participant)
+        self.idle.refresh_from_db()
+        self.idle.free()
+        participant.refresh_from_db()
+        self.assertIsNone(participant.resource)
+        self.assertEqual(participant.resource_served, self.idle)
@@ -0,0 +1,62 @@
+import json
+from django.test import TestCase
+from manager.utils.live_updates import LiveStream
+from manager.utils.state_patch import apply_patch, diff_state
+
+LISTS = {'participants': 'number'}
+
+
+def waiting(*numbers):
+    return [{'number': number, 'wait_time': 0} for number in numbers]
+
+
+class StatePatchTests(TestCase):
+    def assertPatches(self, old, new):
+        ops = diff_state(old, new, LISTS)
+        self.assertEqual(apply_patch(old, ops, LISTS), new)
+        return ops
+
+    def test_list_changes(self):
+        """Test that joins, departures and moves each cost one operation."""
+        old = {'calling': 'A001', 'participants': waiting('A002', 'A003', 'A004')}
+        self.assertEqual(self.assertPatches(old, {'calling': 'A002', 'participants': waiting('A003', 'A004', 'A005')}), [
+            {'op': 'set', 'path': 'calling', 'value': 'A002'},
+            {'op': 'remove', 'path': 'participants', 'key': 'A002'},
+            {'op': 'insert', 'path': 'participants', 'index': 2, 'value': {'number': 'A005', 'wait_time': 0}},
+        ])
+        self.assertEqual(self.assertPatches(old, {'calling': 'A001', 'participants': waiting('A004', 'A002', 'A003')}), [
+            {'op': 'move', 'path': 'participants', 'key': 'A004', 'index': 0},
+        ])
+
+    def test_item_and_field_changes(self):
+        """Test that only the changed fields of an item are sent, and removed fields are unset."""
+        old = {'note': 'x', 'participants': waiting('A001', 'A002')}
+        new = {'participants': [{'number': 'A001', 'wait_time': 0}, {'number': 'A002', 'wait_time': 3}]}
+        self.assertEqual(self.assertPatches(old, new), [
+            {'op': 'update', 'path': 'participants', 'key': 'A002', 'value': {'wait_time': 3}},
+            {'op': 'unset', 'path': 'note'},
+        ])
+        self.assertPatches(new, {'participants': list(reversed(waiting('A001', 'A002', 'A003')))})
+        self.assertEqual(self.assertPatches(new, new), [])
+
+    def test_duplicate_keys(self):
+        """Test that a list with duplicate keys cannot be patched."""
+        self.assertIsNone(diff_state({'participants': waiting('A001')},
+                                     {'participants': waiting('A001', 'A001')}, LISTS))
+
+    def test_stream_catch_up(self):
+        """Test that a stream sends the missed patches while kept and smaller, and a snapshot otherwise."""
+        numbers = [f"A{index:03}" for index in range(20)]
+        stream = LiveStream(LISTS)
+        stream.update({'participants': waiting(*numbers)}, 0)
+        stream.update({'participants': waiting(*numbers, 'A100')}, 1)
+        stream.update({'participants': waiting(*numbers[1:], 'A100')}, 2)
+        stream.update({'participants': waiting(*numbers)}, 1)  # An older read is ignored
+        self.assertEqual(stream.version, 3)
+        self.assertEqual([json.loads(message)['version'] for _, message in stream.catch_up(stream.id, 1)], [2, 3])
+        self.assertEqual(stream.catch_up(stream.id, 3), [])
+        self.assertEqual(stream.catch_up('other', 1), [(stream.version, stream.snapshot())])
+        self.assertEqual(stream.catch_up(stream.id, 0), [(stream.version, stream.snapshot())])
+
+        stream.update({'participants': waiting(*(f"A{index:03}" for index in range(100, 200)))}, 3)
+        self.assertEqual(stream.catch_up(stream.id, 3), [(stream.version, stream.snapshot())])
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from django.test import TestCase
+from django.utils import timezone
+from manager.utils.wait_time_estimators import (SERVICE, WAIT, CumulativeEstimator,
+                                                EWMAEstimator, HourOfWeekEstimator,
+                                                ResourceParallelismEstimator,
+                                                WaitTimeEstimatorFactory, replay_accuracy)
+
+
+class WaitTimeEstimatorTests(TestCase):
+    def setUp(self):
+        # A Monday at 9:00.
+        self.monday = timezone.make_aware(datetime(2024, 11, 4, 9, 0))
+
+    def test_factory_reuses_estimators_and_defaults_to_cumulative(self):
+        self.assertIs(WaitTimeEstimatorFactory.get_estimator('ewma'),
+                      WaitTimeEstimatorFactory.get_estimator('ewma'))
+        self.assertIsInstance(WaitTimeEstimatorFactory.get_estimator('ewma'), EWMAEstimator)
+        self.assertIsInstance(WaitTimeEstimatorFactory.get_estimator('unknown'), CumulativeEstimator)
+
+    def test_no_estimate_without_observations(self):
+        for estimator in WaitTimeEstimatorFactory.all_estimators().values():
+            self.assertIsNone(estimator.estimate({}, self.monday))
+
+    def test_cumulative_averages_every_wait(self):
+        estimator, state = CumulativeEstimator(), {}
+        for minutes in (10, 20, 30):
+            estimator.observe(state, WAIT, minutes, self.monday)
+        estimator.observe(state, SERVICE, 100, self.monday)
+        self.assertEqual(estimator.estimate(state, self.monday), 20)
+        self.assertEqual(state['n'], 3)
+
+    def test_ewma_follows_recent_waits(self):
+        estimator, state = EWMAEstimator(), {}
+        estimator.observe(state, WAIT, 10, self.monday)
+        self.assertEqual(estimator.estimate(state, self.monday), 10)
+        for _ in range(20):
+            estimator.observe(state, WAIT, 30, self.monday)
+        self.assertAlmostEqual(estimator.estimate(state, self.monday), 30, delta=0.1)
+
+    def test_hour_of_week_separates_rush_hour(self):
+        estimator, state = HourOfWeekEstimator(), {}
+        rush_hour = self.monday + timedelta(hours=3)
+        for _ in range(HourOfWeekEstimator.MIN_SAMPLES):
+            estimator.observe(state, WAIT, 5, self.monday)
+            estimator.observe(state, WAIT, 40, rush_hour)
+        self.assertAlmostEqual(estimator.estimate(state, self.monday + timedelta(weeks=1)), 5)
+        self.assertAlmostEqual(estimator.estimate(state, rush_hour), 40)
+        # An hour never observed falls back to the moving average of all hours.
+        quiet = self.monday + timedelta(days=2)
+        self.assertEqual(estimator.estimate(state, quiet), state['all']['value'])
+
+    def test_parallelism_divides_service_time_by_servers(self):
+        estimator, state = ResourceParallelismEstimator(), {}
+        estimator.observe(state, WAIT, 7, self.monday)
+        self.assertEqual(estimator.estimate(state, self.monday, servers=3), 7)
+        estimator.observe(state, SERVICE, 12, self.monday)
+        self.assertEqual(estimator.estimate(state, self.monday, servers=3), 4)
+        self.assertEqual(estimator.estimate(state, self.monday, servers=0), 12)
+
+    def test_replay_accuracy(self):
+        participants = []
+        for index in range(6):
+            joined_at = self.monday + timedelta(minutes=10 * index)
+            participants.append(SimpleNamespace(
+                pk=index, joined_at=joined_at,
+                service_started_at=joined_at + timedelta(minutes=5),
+                service_completed_at=joined_at + timedelta(minutes=8)))
+        report = replay_accuracy(participants)
+        # The first participant joins before anything was learned.
+        self.assertEqual(report['ewma']['count'], 5)
+        self.assertEqual(report['ewma']['mae'], 0)
+        self.assertEqual(report['cumulative']['bias'], 0)
@@ -4,7 +4,7 @@ from django.contrib.auth.models import User
 import json
 from datetime import time
 from unittest.mock import patch, MagicMock
-from manager.models import Queue
+from manager.models import Queue, Resource
 from participant.models import Participant, Notification
 
 
@@ -108,6 +108,60 @@ class ParticipantViewsTest(TestCase):
         response = self.client.post(url)
         self.assertEqual(response.status_code, 405)
 
+    def test_move_participant(self):
+        second = Participant.objects.create(name='Second', queue=self.queue, state='waiting')
+        url = reverse('manager:move_participant', args=[second.id])
+
+        response = self.client.post(url, data=json.dumps({'position': 1}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['position'], 1)
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.position, 2)
+
+        # Positions past the end are clamped
+        response = self.client.post(url, data=json.dumps({'position': 5}),
+                                    content_type='application/json')
+        self.assertEqual(json.loads(response.content)['position'], 2)
+
+        # Test an invalid position
+        response = self.client.post(url, data=json.dumps({'position': 0}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        # Test unauthorized move
+        self.client.logout()
+        self.client.login(username='unauthorized', password='testpass123')
+        response = self.client.post(url, data=json.dumps({'position': 2}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_apply_participant_transitions(self):
+        self.mock_handler.apply_transitions.side_effect = Participant.apply_transitions
+        second = Participant.objects.create(name='Second', queue=self.queue, state='waiting')
+        url = reverse('manager:apply_participant_transitions', args=[self.queue.id])
+        transitions = [{'participant_id': self.participant.id, 'action': 'serve'},
+                       {'participant_id': second.id, 'action': 'cancel'}]
+
+        response = self.client.post(url, data=json.dumps({'transitions': transitions}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['applied']['serve'], [self.participant.id])
+        second.refresh_from_db()
+        self.assertEqual(second.state, 'cancelled')
+
+        # Test an unknown action
+        response = self.client.post(url, data=json.dumps({'transitions': [
+            {'participant_id': second.id, 'action': 'finish'}]}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        # Test unauthorized transitions
+        self.client.logout()
+        self.client.login(username='unauthorized', password='testpass123')
+        response = self.client.post(url, data=json.dumps({'transitions': transitions}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
     def test_serve_participant(self):
         url = reverse('manager:serve_participant', args=[self.participant.id])
         data = {'resource_id': '1'}
@@ -123,6 +177,7 @@ class ParticipantViewsTest(TestCase):
         self.assertTrue(response_data['success'])
 
         # Test invalid state transition
+        self.participant.refresh_from_db()
         self.participant.state = 'completed'
         self.participant.save()
 
@@ -145,6 +200,25 @@ class ParticipantViewsTest(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, 405)
 
+    def test_serve_participant_conflict_rolls_back_resource(self):
+        url = reverse('manager:serve_participant', args=[self.participant.id])
+        resource = Resource.objects.create(name='Table 2', queue=self.queue)
+
+        def claim_while_served_elsewhere(participant, resource_id=None):
+            Resource.objects.filter(pk=resource.pk).update(status='busy', count=1, assigned_to=participant)
+            # Another terminal serves the participant at another table meanwhile
+            Participant.objects.filter(pk=participant.pk).update(state='serving')
+
+        self.mock_handler.assign_to_resource.side_effect = claim_while_served_elsewhere
+        with patch.object(Queue, 'update_estimated_wait_time_per_turn') as update_estimate, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data=json.dumps({'resource_id': resource.id}),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        resource.refresh_from_db()
+        self.assertEqual((resource.status, resource.assigned_to, resource.count), ('available', None, 0))
+        update_estimate.assert_not_called()
+
     def test_complete_participant(self):
         url = reverse('manager:complete_participant', args=[self.participant.id])
 
@@ -2,6 +2,7 @@ from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from django.urls import reverse
 from manager.models import Queue
+from participant.models import Participant
 from unittest.mock import patch
 from datetime import time
 
@@ -154,6 +155,23 @@ class QueueViewTests(TestCase):
         messages = list(response.wsgi_request._messages)
         self.assertTrue(any("Invalid time format" in str(message) for message in messages))
 
+    def test_view_all_waiting_reads_annotated_positions(self):
+        """Test that the full waiting list does not count each participant's position."""
+        self.queue.category = 'general'
+        self.queue.save()
+        participants = [Participant.objects.create(queue=self.queue, state='waiting') for _ in range(3)]
+        handler = self.mock_get_handler.return_value
+        handler.get_participant_set.return_value = Participant.objects.filter(queue=self.queue)
+        handler.add_context_attributes.return_value = None
+        self.client.login(username='creator', password='password123')
+
+        response = self.client.get(reverse('manager:view_all_waiting', kwargs={'queue_id': self.queue.id}))
+        self.assertEqual(response.status_code, 200)
+        waiting = response.context['waiting_list']
+        self.assertEqual([p.pk for p in waiting], [p.pk for p in participants])
+        with self.assertNumQueries(0):
+            self.assertEqual([p.position for p in waiting], [1, 2, 3])
+
     # def test_edit_queue_unauthorized(self):
     #     """Test unauthorized user cannot edit queue."""
     #     self.client.login(username='otheruser', password='password123')
@@ -0,0 +1,49 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+from manager.models import RestaurantQueue, Table
+from participant.models import RestaurantParticipant
+
+
+class StatisticsViewTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='creator', password='password123')
+        self.queue = RestaurantQueue.objects.create(
+            name='Test Queue',
+            created_by=self.user,
+            category='restaurant',
+            latitude=40.7128,
+            longitude=-74.0060,
+        )
+        self.table = Table.objects.create(name='Table 1', capacity=4, queue=self.queue)
+        RestaurantParticipant.objects.create(name='Waiting', queue=self.queue)
+        RestaurantParticipant.objects.create(
+            name='Completed',
+            queue=self.queue,
+            state='completed',
+            resource_assigned='Table 1',
+            resource_served=self.table,
+            service_started_at=timezone.now(),
+            service_completed_at=timezone.now(),
+        )
+        self.client.login(username='creator', password='password123')
+
+    def test_statistics_page(self):
+        """Test that the statistics page renders the aggregated metrics for every date filter."""
+        for date_filter in ['today', 'last_7_days', 'last_30_days', 'all_time']:
+            response = self.client.get(
+                reverse('manager:statistics', kwargs={'queue_id': self.queue.id}),
+                {'date_filter': date_filter}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['waitlisted'], 2)
+            self.assertEqual(response.context['currently_waiting'], 1)
+            self.assertEqual(response.context['served_percentage'], 50.0)
+            self.assertEqual(response.context['average_service_duration'], '0 mins')
+            self.assertEqual(set(response.context['wait_percentiles']), {'p50', 'p90', 'p99'})
+            self.assertEqual(response.context['all_time_statistics'].served, 1)
+            resource_totals = response.context['resource_totals']
+            self.assertEqual(resource_totals[0]['name'], 'Table 1')
+            self.assertEqual(resource_totals[0]['completed'], 1)
@@ -10,7 +10,8 @@ from manager.views import (
     ResourceSettings, edit_resource, add_resource, delete_resource, WaitingFull, edit_queue,
     EditProfileView,
     CreateQueueView, mark_no_show, ViewAllWaiting, ViewAllServing, ViewAllCompleted,
-    serve_participant_no_resource, set_location, create_queue, delete_audio_file, QueueDisplay)
+    serve_participant_no_resource, move_participant, apply_participant_transitions, call_next_participant,
+    set_location, create_queue, delete_audio_file, QueueDisplay)
 
 
 app_name = 'manager'
@@ -20,8 +21,11 @@ urlpatterns = [
     path('notify/<int:participant_id>/', notify_participant, name='notify_participant'),
     path('manage/<int:queue_id>/', ManageWaitlist.as_view(), name='manage_waitlist'),
     path('serve/<int:participant_id>/', serve_participant, name='serve_participant'),
+    path('move/<int:participant_id>/', move_participant, name='move_participant'),
     path('serve_no_resource/<int:participant_id>/', serve_participant_no_resource, name='serve_participant_no_resource'),
     path('complete/<int:participant_id>/', complete_participant, name='complete_participant'),
+    path('call_next/<int:queue_id>/', call_next_participant, name='call_next_participant'),
+    path('transitions/<int:queue_id>/', apply_participant_transitions, name='apply_participant_transitions'),
     path('unique-category-updates/<int:queue_id>/', get_unique_queue_category_data, name='get_unique_queue_category_data'),
     path('general-updates/<int:queue_id>/', get_general_queue_data, name='get_general_queue_data'),
     path('edit_participant/<int:participant_id>/', edit_participant, name='edit_participant'),
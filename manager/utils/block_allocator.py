@@ -0,0 +1,56 @@
+import threading
+from django.db import transaction
+
+
+class BlockAllocator:
+    """
+    Hands out numbers from blocks reserved in advance by this process.
+
+    A block is only kept once the transaction reserving it commits, so the
+    numbers of a rolled back reservation are never handed out while another
+    process may reserve them again.
+    """
+
+    def __init__(self):
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, size, reserve) -> int:
+        """
+        Hand out the next number of a counter.
+
+        :param key: The key of the counter.
+        :param size: How many numbers to reserve when the block runs out.
+        :param reserve: A callable taking a count and returning the range of numbers it reserved.
+        :return: The number.
+        """
+        if size <= 1:
+            return reserve(1)[0]
+        with self._lock:
+            block = self._blocks.get(key)
+            if block and block[0] < block[1]:
+                block[0] += 1
+                return block[0] - 1
+        numbers = reserve(size)
+
+        def keep_block():
+            with self._lock:
+                self._blocks[key] = [numbers.start + 1, numbers.stop]
+
+        transaction.on_commit(keep_block)
+        return numbers.start
+
+    def discard(self, predicate) -> None:
+        """
+        Drop the blocks whose key matches a predicate.
+
+        :param predicate: A callable taking a key and returning True to drop its block.
+        """
+        with self._lock:
+            for key in [key for key in self._blocks if predicate(key)]:
+                del self._blocks[key]
+
+    def clear(self) -> None:
+        """Drop every block."""
+        with self._lock:
+            self._blocks.clear()
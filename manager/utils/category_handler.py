@@ -1,6 +1,10 @@
 from abc import ABC, abstractmethod
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, When
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from manager.utils.concurrency import TransitionConflict
 from manager.utils.helpers import extract_data_variables
 from django.apps import apps
 
@@ -50,6 +54,13 @@ class CategoryHandler(ABC):
     This class defines the interface for handling various queue operations, such as
     creating queues, managing participants, and assigning resources.
     """
+    # The category's participant model and the fields of it a bulk import may set.
+    participant_model = 'Participant'
+    import_fields = ('name', 'email', 'phone', 'note')
+    # The category's resource model, None if its queues have no resources.
+    resource_model = None
+    # How many participants taken by concurrent calls `call_next` skips before giving up.
+    CALL_NEXT_ATTEMPTS = 5
 
     @abstractmethod
     def create_queue(self, data):
@@ -108,6 +119,106 @@ class CategoryHandler(ABC):
         """
         pass
 
+    def import_participants(self, queue, rows):
+        """
+        Creates many participants at once, such as the appointments of an event or a clinic.
+
+        Every row is validated before anything is written, then the participants
+        are inserted together with `Participant.bulk_import`.
+
+        :param queue: The queue the participants join.
+        :param rows: One dictionary per participant, keyed by the handler's `import_fields`, in joining order.
+        :return: The created participants.
+        :raises ValueError: If a row is invalid.
+        """
+        model = apps.get_model('participant', self.participant_model)  # Lazy load
+        unchecked = [field.name for field in model._meta.fields if field.name not in self.import_fields]
+        participants = []
+        for line, row in enumerate(rows, start=1):
+            values = {field: row[field] for field in self.import_fields if row.get(field) not in (None, '')}
+            participant = model(queue=queue, created_by='staff', **values)
+            try:
+                participant.clean_fields(exclude=unchecked)
+            except ValidationError as e:
+                errors = "; ".join(f"{field}: {' '.join(messages)}" for field, messages in e.message_dict.items())
+                raise ValueError(f"Row {line}: {errors}")
+            participants.append(participant)
+        return model.bulk_import(participants)
+
+    def apply_transitions(self, queue, transitions):
+        """
+        Applies a batch of serve, complete, no-show and cancel transitions in one transaction.
+
+        :param queue: The queue of the participants.
+        :param transitions: (participant ID, action) pairs, each action being one of
+                            'serve', 'complete', 'no_show' or 'cancel'.
+        :return: The IDs of the participants changed by each action and of those skipped.
+        :raises ValueError: If an action is unknown.
+        """
+        Participant = apps.get_model('participant', 'Participant')  # Lazy load
+        return Participant.apply_transitions(queue, transitions)
+
+    def get_next_candidates(self, queue, resource):
+        """
+        Returns the waiting participants a resource may call, best first.
+
+        :param queue: The queue object.
+        :param resource: The resource calling the next participant.
+        :return: An ordered queryset of waiting participants.
+        """
+        Participant = apps.get_model('participant', 'Participant')  # Lazy load
+        return self.get_participant_set(queue.pk).filter(state='waiting').order_by(*Participant.WAITING_ORDER)
+
+    def call_next(self, queue, resource):
+        """
+        Claims the best eligible waiting participant for a resource, assigns the resource and starts their service.
+
+        Everything happens in one short transaction. Resources calling at the same
+        time are handed different participants, see `Participant.claim_next`; a
+        participant taken by a concurrent call anyway is skipped for the next one.
+        The queue's wait time estimators learn the wait once the transaction commits.
+
+        :param queue: The queue object.
+        :param resource: The available resource calling the next participant.
+        :return: The participant now being served, or None if no eligible participant is waiting.
+        :raises ValueError: If the resource is not available.
+        :raises TransitionConflict: If the resource was assigned elsewhere in the meantime.
+        """
+        Participant = apps.get_model('participant', 'Participant')  # Lazy load
+        if resource.status != 'available':
+            raise ValueError("This resource is not available.")
+        taken = []
+        for _ in range(self.CALL_NEXT_ATTEMPTS):
+            with transaction.atomic():
+                candidates = self.get_next_candidates(queue, resource).exclude(pk__in=taken)
+                participant = Participant.claim_next(candidates)
+                if participant is None:
+                    return None
+                try:
+                    with transaction.atomic():
+                        participant.start_service()
+                except TransitionConflict:
+                    taken.append(participant.pk)
+                    continue
+                participant.resource_assigned = resource.name
+                resource.assign_to_participant(participant)
+                wait = participant.get_wait_time()
+                transaction.on_commit(lambda: queue.update_estimated_wait_time_per_turn(wait))
+                return participant
+        return None
+
+    def record_service_durations(self, participant):
+        """
+        Adds a completed participant's wait and service durations to the daily quantile
+        sketches, and teaches the queue's wait time estimators the service duration.
+
+        :param participant: The participant whose service was completed.
+        """
+        QueueDurationSketch = apps.get_model('manager', 'QueueDurationSketch')  # Lazy load
+        QueueDurationSketch.record(participant)
+        if participant.service_started_at:
+            participant.queue.observe_service_duration(participant.get_service_duration())
+
     @abstractmethod
     def add_context_attributes(self, queue):
         """
@@ -200,14 +311,12 @@ class GeneralQueueHandler(CategoryHandler):
     def create_participant(self, data):
         Participant = apps.get_model('participant', 'Participant')  # Lazy load
         participant_info = extract_data_variables(data)
-        queue_length = participant_info['queue'].participant_set.filter(state='waiting').count()
         return Participant.objects.create(
             name=participant_info['name'],
             email=participant_info['email'],
             phone=participant_info['phone'],
             note=participant_info['note'],
             queue=participant_info['queue'],
-            position=queue_length + 1,
             created_by='staff'
         )
 
@@ -230,6 +339,7 @@ class GeneralQueueHandler(CategoryHandler):
             participant.state = 'completed'
             participant.service_completed_at = timezone.localtime()
             participant.save()
+            self.record_service_durations(participant)
 
     def get_template_name(self):
         return 'manager/manage_queue/manage_general.html'
@@ -282,6 +392,9 @@ class RestaurantQueueHandler(CategoryHandler):
     This class provides the implementation for operations related to the 'restaurant' queue category,
     including managing tables, party sizes, and other restaurant-specific tasks.
     """
+    participant_model = 'RestaurantParticipant'
+    import_fields = CategoryHandler.import_fields + ('party_size', 'service_type')
+    resource_model = 'Table'
 
     def create_queue(self, data):
         RestaurantQueue = apps.get_model('manager', 'RestaurantQueue')  # Lazy load
@@ -298,7 +411,6 @@ class RestaurantQueueHandler(CategoryHandler):
     def create_participant(self, data):
         RestaurantParticipant = apps.get_model('participant', 'RestaurantParticipant')  # Lazy load
         participant_info = extract_data_variables(data)
-        queue_length = participant_info['queue'].participant_set.filter(state='waiting').count()
         participant = RestaurantParticipant.objects.create(
             name=participant_info['name'],
             email=participant_info['email'],
@@ -307,7 +419,6 @@ class RestaurantQueueHandler(CategoryHandler):
             queue=participant_info['queue'],
             party_size=participant_info['special_1'],
             service_type=participant_info['special_2'],
-            position=queue_length + 1,
             created_by='staff'
         )
         if participant_info['resource']:
@@ -336,11 +447,18 @@ class RestaurantQueueHandler(CategoryHandler):
         RestaurantQueue = apps.get_model('manager', 'RestaurantQueue')
         return get_object_or_404(RestaurantQueue, id=queue_id)
 
+    def get_next_candidates(self, queue, resource):
+        """
+        Returns the waiting parties fitting at a table, in waiting list order.
+        """
+        return super().get_next_candidates(queue, resource).filter(party_size__lte=resource.capacity)
+
     def get_template_name(self):
         return 'manager/manage_queue/manage_unique_category.html'
 
     def complete_service(self, participant):
-        if participant.state == 'serving':
+        was_serving = participant.state == 'serving'
+        if was_serving:
             if participant.service_started_at:
                 wait_duration = int((participant.service_started_at - participant.joined_at).total_seconds() / 60)
                 participant.waited = wait_duration
@@ -356,6 +474,8 @@ class RestaurantQueueHandler(CategoryHandler):
         else:
             participant.state = 'completed'
         participant.save()
+        if was_serving:
+            self.record_service_durations(participant)
 
     def add_context_attributes(self, queue):
         """
@@ -480,6 +600,10 @@ class HospitalQueueHandler(CategoryHandler):
     This class provides the implementation for operations related to the 'hospital' queue category,
     including managing doctors, patients, and other hospital-specific tasks.
     """
+    participant_model = 'HospitalParticipant'
+    import_fields = CategoryHandler.import_fields + ('medical_field', 'priority')
+    resource_model = 'Doctor'
+
     def create_queue(self, data):
         HospitalQueue = apps.get_model('manager', 'HospitalQueue')  # Lazy load
         User = apps.get_model('auth', 'User')  # Lazy load
@@ -495,7 +619,6 @@ class HospitalQueueHandler(CategoryHandler):
     def create_participant(self, data):
         HospitalParticipant = apps.get_model('participant', 'HospitalParticipant')  # Lazy load
         participant_info = extract_data_variables(data)
-        queue_length = participant_info['queue'].participant_set.filter(state='waiting').count()
         participant = HospitalParticipant.objects.create(
             name=participant_info['name'],
             email=participant_info['email'],
@@ -504,7 +627,6 @@ class HospitalQueueHandler(CategoryHandler):
             queue=participant_info['queue'],
             medical_field=participant_info['special_1'],
             priority=participant_info['special_2'],
-            position=queue_length + 1,
             created_by='staff'
         )
         if participant_info['resource']:
@@ -525,6 +647,15 @@ class HospitalQueueHandler(CategoryHandler):
         HospitalQueue = apps.get_model('manager', 'HospitalQueue')  # Lazy load
         return get_object_or_404(HospitalQueue, id=queue_id)
 
+    def get_next_candidates(self, queue, resource):
+        """
+        Returns the waiting patients of a doctor's specialty, the most urgent first.
+        """
+        return super().get_next_candidates(queue, resource).filter(
+            medical_field=resource.specialty).order_by(
+            Case(When(priority='urgent', then=0), When(priority='normal', then=1), default=2),
+            *apps.get_model('participant', 'Participant').WAITING_ORDER)
+
     def assign_to_resource(self, participant, resource_id=None):
         """
         Assigns a doctor to a hospital participant based on their medical field and priority.
@@ -551,7 +682,8 @@ class HospitalQueueHandler(CategoryHandler):
         """
         Completes the service for the hospital participant.
         """
-        if participant.state == 'serving':
+        was_serving = participant.state == 'serving'
+        if was_serving:
             if participant.service_started_at:
                 wait_duration = int((participant.service_started_at - participant.joined_at).total_seconds() / 60)
                 participant.waited = wait_duration
@@ -566,6 +698,8 @@ class HospitalQueueHandler(CategoryHandler):
         else:
             participant.state = 'completed'
         participant.save()
+        if was_serving:
+            self.record_service_durations(participant)
 
     def add_context_attributes(self, queue):
         """
@@ -702,6 +836,9 @@ class BankQueueHandler(CategoryHandler):
     This class provides the implementation for operations related to the 'bank' queue category,
     including managing counters, services, and other bank-specific tasks.
     """
+    participant_model = 'BankParticipant'
+    import_fields = CategoryHandler.import_fields + ('participant_category', 'service_type')
+    resource_model = 'Counter'
 
     def create_queue(self, data):
         BankQueue = apps.get_model('manager', 'BankQueue')  # Lazy load
@@ -718,7 +855,6 @@ class BankQueueHandler(CategoryHandler):
     def create_participant(self, data):
         BankParticipant = apps.get_model('participant', 'BankParticipant')  # Lazy load
         participant_info = extract_data_variables(data)
-        queue_length = participant_info['queue'].participant_set.count()
         participant = BankParticipant.objects.create(
             name=participant_info['name'],
             email=participant_info['email'],
@@ -727,7 +863,6 @@ class BankQueueHandler(CategoryHandler):
             queue=participant_info['queue'],
             participant_category=participant_info['special_1'],
             service_type=participant_info['special_2'],
-            position=queue_length + 1,
             created_by='staff'
         )
         if participant_info['resource']:
@@ -742,6 +877,14 @@ class BankQueueHandler(CategoryHandler):
         BankQueue = apps.get_model('manager', 'BankQueue')
         return get_object_or_404(BankQueue, id=queue_id)
 
+    def get_next_candidates(self, queue, resource):
+        """
+        Returns the waiting clients, those needing the counter's service type first.
+        """
+        return super().get_next_candidates(queue, resource).order_by(
+            Case(When(service_type=resource.service_type, then=0), default=1),
+            *apps.get_model('participant', 'Participant').WAITING_ORDER)
+
     def assign_to_resource(self, participant, resource_id=None):
         Counter = apps.get_model('manager', 'Counter')
         if resource_id:
@@ -757,7 +900,8 @@ class BankQueueHandler(CategoryHandler):
         participant.save()
 
     def complete_service(self, participant):
-        if participant.state == 'serving':
+        was_serving = participant.state == 'serving'
+        if was_serving:
             if participant.service_started_at:
                 wait_duration = int((participant.service_started_at - participant.joined_at).total_seconds() / 60)
                 participant.waited = wait_duration
@@ -772,6 +916,8 @@ class BankQueueHandler(CategoryHandler):
         else:
             participant.state = 'completed'
         participant.save()
+        if was_serving:
+            self.record_service_durations(participant)
 
     def get_template_name(self):
         return 'manager/manage_queue/manage_bank.html'
@@ -0,0 +1,351 @@
+import asyncio
+import logging
+import uuid
+import weakref
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+from django.apps import apps
+from django.db import connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger('queue')
+
+
+class _Inbox:
+    """
+    The messages received by one event loop of a process.
+
+    :ivar names: The inboxes claimed from the database: the process-specific
+                 prefixes of the loop's channels and the normal channels it receives on.
+    :ivar buffers: The messages claimed for each channel and not yet received, keyed by channel.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.names = set()
+        self.buffers = {}
+        self.wakeup = asyncio.Event()
+        self.listening = False
+        self.tasks = []
+
+
+class DatabaseChannelLayer(BaseChannelLayer):
+    """
+    Channel layer storing its messages and groups in the database, so they reach every server process.
+
+    Each event loop gets its own process-specific channel prefix and one task
+    claiming the messages of all of its channels with a single query, so the
+    number of queries does not grow with the number of sockets. On PostgreSQL
+    senders `NOTIFY` the receiving inbox and a dedicated `LISTEN` connection
+    wakes the task up at once; elsewhere, such as on SQLite in development, the
+    task polls every `poll_interval` seconds while something is received.
+
+    Messages must be JSON-serializable. They expire after `expiry` seconds and
+    group memberships after `group_expiry` seconds, and a channel holds at
+    most its capacity of pending messages.
+    """
+    extensions = ['groups', 'flush']
+    # How many messages are claimed at most per query.
+    CLAIM_BATCH = 100
+    # How many channels a message is stored for at most per query.
+    INSERT_BATCH = 100
+    # Seconds between polls while listening, in case a notification was missed.
+    LISTEN_POLL_INTERVAL = 5
+    # Seconds before reconnecting a lost listener.
+    LISTEN_RETRY_SECONDS = 5
+
+    def __init__(self, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None,
+                 poll_interval=0.5, database='default', notify_channel='channel_layer'):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.database = database
+        self.notify_channel = notify_channel
+        # One inbox per event loop, as its tasks and queues are bound to the loop.
+        self._inboxes = weakref.WeakKeyDictionary()
+
+    # Channels
+
+    async def new_channel(self, prefix='specific'):
+        """
+        Return a new process-specific channel received by the running event loop.
+
+        :param prefix: The prefix of the channel name.
+        :return: The channel name.
+        """
+        inbox = self._inbox()
+        channel = f"{prefix}.{inbox.id}!{uuid.uuid4().hex}"
+        inbox.names.add(self.non_local_name(channel))
+        inbox.buffers[channel] = asyncio.Queue()
+        return channel
+
+    async def send(self, channel, message):
+        """
+        Send a message to a channel.
+
+        :raises ChannelFull: If the channel holds its capacity of pending messages.
+        """
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        inboxes = await sync_to_async(self._insert)([channel], message, True)
+        self._wake(inboxes)
+
+    async def receive(self, channel):
+        """
+        Wait for and return the next message of a channel.
+
+        :param channel: A channel returned by `new_channel`, or a normal channel name.
+        :return: The message.
+        """
+        self.require_valid_channel_name(channel)
+        inbox = self._inbox()
+        if channel not in inbox.buffers:
+            inbox.buffers[channel] = asyncio.Queue()
+        buffer = inbox.buffers[channel]
+        if self.non_local_name(channel) not in inbox.names:
+            inbox.names.add(self.non_local_name(channel))
+            inbox.wakeup.set()
+        try:
+            return await buffer.get()
+        except asyncio.CancelledError:
+            # The receiver is gone, so drop what it will not read.
+            if buffer.empty() and inbox.buffers.get(channel) is buffer:
+                del inbox.buffers[channel]
+                if '!' not in channel:
+                    inbox.names.discard(channel)
+            raise
+
+    async def flush(self):
+        """Delete every message and group membership."""
+        await sync_to_async(self._flush)()
+        for inbox in list(self._inboxes.values()):
+            for buffer in inbox.buffers.values():
+                while not buffer.empty():
+                    buffer.get_nowait()
+
+    async def close(self):
+        """Stop receiving in the running event loop, dropping its unread messages."""
+        inbox = self._inboxes.pop(asyncio.get_running_loop(), None)
+        if inbox is None:
+            return
+        for task in inbox.tasks:
+            task.cancel()
+        await asyncio.gather(*inbox.tasks, return_exceptions=True)
+
+    # Groups
+
+    async def group_add(self, group, channel):
+        """Add a channel to a group, or renew its membership."""
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await sync_to_async(self._group_add)(group, channel)
+
+    async def group_discard(self, group, channel):
+        """Remove a channel from a group."""
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await sync_to_async(self._group_discard)(group, channel)
+
+    async def group_send(self, group, message):
+        """Send a message to every channel of a group, skipping those that are full."""
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_group_name(group)
+        inboxes = await sync_to_async(self._group_send)(group, message)
+        self._wake(inboxes)
+
+    # Database access
+
+    def _models(self):
+        ChannelMessage = apps.get_model('manager', 'ChannelMessage')  # Lazy load
+        ChannelGroupMembership = apps.get_model('manager', 'ChannelGroupMembership')  # Lazy load
+        return ChannelMessage.objects.db_manager(self.database), ChannelGroupMembership.objects.db_manager(
+            self.database)
+
+    def _insert(self, channels, message, raise_when_full) -> set:
+        """
+        Store a message for each channel with room for it and notify their inboxes.
+
+        The capacity check and the insert are one ``INSERT ... SELECT`` statement,
+        so a message is only stored while its channel holds fewer pending messages
+        than its capacity. Senders racing on the same channel under READ COMMITTED
+        can still each add one message past it, as neither sees the other's row.
+
+        :return: The inboxes the message was stored for.
+        :raises ChannelFull: If `raise_when_full` and a channel is full.
+        """
+        messages, _ = self._models()
+        connection = connections[self.database]
+        quote = connection.ops.quote_name
+        table, channel_column, inbox_column, message_column, expires_column = (
+            quote(name) for name in (messages.model._meta.db_table, 'channel', 'inbox', 'message', 'expires_at'))
+        expires_field = messages.model._meta.get_field('expires_at')
+        now = timezone.now()
+        values = [messages.model._meta.get_field('message').get_db_prep_save(message, connection),
+                  expires_field.get_db_prep_save(now + timedelta(seconds=self.expiry), connection)]
+        stored = []
+        with transaction.atomic(using=self.database), connection.cursor() as cursor:
+            for start in range(0, len(channels), self.INSERT_BATCH):
+                batch = channels[start:start + self.INSERT_BATCH]
+                cursor.execute(
+                    f"INSERT INTO {table} ({channel_column}, {inbox_column}, {message_column}, {expires_column}) "
+                    f"SELECT pending.column1, pending.column2, %s, %s "
+                    f"FROM (VALUES {', '.join(['(%s, %s, %s)'] * len(batch))}) AS pending "
+                    f"WHERE (SELECT COUNT(*) FROM {table} WHERE {table}.{channel_column} = pending.column1 "
+                    f"AND {table}.{expires_column} > %s) < pending.column3 "
+                    f"RETURNING {channel_column}, {inbox_column}",
+                    [*values,
+                     *(value for channel in batch
+                       for value in (channel, self.non_local_name(channel), self.get_capacity(channel))),
+                     expires_field.get_db_prep_save(now, connection)])
+                stored += cursor.fetchall()
+            if raise_when_full and len(stored) < len(channels):
+                full = set(channels) - {channel for channel, _ in stored}
+                raise ChannelFull(min(full))
+            inboxes = {inbox for _, inbox in stored}
+            if connection.vendor == 'postgresql':
+                for inbox in inboxes:
+                    cursor.execute("SELECT pg_notify(%s, %s)", [self.notify_channel, inbox])
+        return inboxes
+
+    def _group_send(self, group, message) -> set:
+        _, memberships = self._models()
+        channels = list(memberships.filter(group=group, expires_at__gt=timezone.now()).values_list(
+            'channel', flat=True))
+        return self._insert(channels, message, False) if channels else set()
+
+    def _group_add(self, group, channel):
+        _, memberships = self._models()
+        memberships.update_or_create(group=group, channel=channel, defaults={
+            'expires_at': timezone.now() + timedelta(seconds=self.group_expiry)})
+
+    def _group_discard(self, group, channel):
+        _, memberships = self._models()
+        memberships.filter(group=group, channel=channel).delete()
+
+    def _flush(self):
+        messages, memberships = self._models()
+        messages.all().delete()
+        memberships.all().delete()
+
+    def _claim(self, names) -> list:
+        """
+        Take the oldest pending messages of some inboxes out of the database.
+
+        Concurrent claims skip each other's rows where the database supports it,
+        so a message of a normal channel received by several processes is only
+        delivered once.
+
+        :param names: The inboxes to claim from.
+        :return: (channel, message) pairs, oldest first.
+        """
+        messages, _ = self._models()
+        with transaction.atomic(using=self.database):
+            claimed = messages.filter(inbox__in=names, expires_at__gt=timezone.now()).order_by('id')
+            if connections[self.database].features.has_select_for_update_skip_locked:
+                claimed = claimed.select_for_update(skip_locked=True)
+            rows = list(claimed.values_list('id', 'channel', 'message')[:self.CLAIM_BATCH])
+            if rows:
+                messages.filter(id__in=[pk for pk, _, _ in rows]).delete()
+        return [(channel, message) for _, channel, message in rows]
+
+    # Receiving
+
+    def _inbox(self) -> _Inbox:
+        """Return the inbox of the running event loop, starting its tasks if needed."""
+        loop = asyncio.get_running_loop()
+        inbox = self._inboxes.get(loop)
+        if inbox is None:
+            inbox = self._inboxes[loop] = _Inbox()
+        if not inbox.tasks:
+            inbox.tasks.append(loop.create_task(self._fetch(inbox)))
+            if connections[self.database].vendor == 'postgresql':
+                inbox.tasks.append(loop.create_task(self._listen(inbox)))
+        return inbox
+
+    def _wake(self, inboxes) -> None:
+        """Wake the inboxes of this process a message was just stored for."""
+        for loop, inbox in list(self._inboxes.items()):
+            if inbox.names & inboxes and not loop.is_closed():
+                loop.call_soon_threadsafe(inbox.wakeup.set)
+
+    async def _fetch(self, inbox):
+        """Claim the messages of an inbox into its buffers whenever woken up or polling."""
+        while True:
+            inbox.wakeup.clear()
+            messages = []
+            if inbox.names:
+                try:
+                    messages = await sync_to_async(self._claim)(sorted(inbox.names))
+                except Exception as e:
+                    logger.error(f"Error receiving from the channel layer: {e}")
+            for channel, message in messages:
+                buffer = inbox.buffers.get(channel)
+                if buffer is not None:
+                    buffer.put_nowait(message)
+            if len(messages) == self.CLAIM_BATCH:
+                continue
+            interval = self.LISTEN_POLL_INTERVAL if inbox.listening else self.poll_interval
+            try:
+                await asyncio.wait_for(inbox.wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _open_listener(self):
+        """Open a connection listening to the notifications of the layer."""
+        wrapper = connections[self.database]
+        listener = wrapper.get_new_connection(wrapper.get_connection_params())
+        listener.autocommit = True
+        with listener.cursor() as cursor:
+            cursor.execute(f"LISTEN {wrapper.ops.quote_name(self.notify_channel)}")
+        return listener
+
+    @staticmethod
+    def _read_notifications(listener) -> set:
+        """Return the payloads of the notifications received by a listening connection."""
+        if hasattr(listener, 'poll'):  # psycopg2
+            listener.poll()
+            payloads = {notify.payload for notify in listener.notifies}
+            listener.notifies.clear()
+            return payloads
+        listener.pgconn.consume_input()  # psycopg 3
+        payloads = set()
+        while (notify := listener.pgconn.notifies()) is not None:
+            payloads.add(notify.extra.decode())
+        return payloads
+
+    async def _listen(self, inbox):
+        """Wake an inbox up whenever a message is notified for it, reconnecting when the connection is lost."""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                listener = await sync_to_async(self._open_listener, thread_sensitive=False)()
+            except Exception as e:
+                logger.error(f"Error listening to the channel layer: {e}")
+                await asyncio.sleep(self.LISTEN_RETRY_SECONDS)
+                continue
+
+            lost = loop.create_future()
+
+            def readable():
+                try:
+                    payloads = self._read_notifications(listener)
+                except Exception as e:
+                    if not lost.done():
+                        lost.set_result(e)
+                    return
+                if inbox.names & payloads:
+                    inbox.wakeup.set()
+
+            loop.add_reader(listener.fileno(), readable)
+            inbox.listening = True
+            inbox.wakeup.set()  # Claim what was sent while not listening
+            try:
+                logger.error(f"Lost the channel layer listener: {await lost}")
+            finally:
+                inbox.listening = False
+                loop.remove_reader(listener.fileno())
+                listener.close()
+            await asyncio.sleep(self.LISTEN_RETRY_SECONDS)
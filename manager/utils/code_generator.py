@@ -1,47 +1,136 @@
-import random
+import hashlib
+import hmac
 import string
-from django.db import transaction
+from django.apps import apps
+from django.conf import settings
+from manager.utils.block_allocator import BlockAllocator
 
-def generate_unique_code(model_class, field_name="code", length=12, max_retries=10):
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 12
+# Codes are a pair of halves of 6 characters each, shuffled by a Feistel network.
+CODE_HALF = len(CODE_ALPHABET) ** (CODE_LENGTH // 2)
+CODE_ROUNDS = 8
+
+# Sequence IDs reserved by this process, keyed by sequence name.
+_code_allocator = BlockAllocator()
+
+
+def _code_round(value, round_index, key):
+    """Return the keyed round function of the Feistel network."""
+    digest = hmac.new(key, f"{round_index}:{value}".encode(), hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], 'big') % CODE_HALF
+
+
+def _code_key(name):
+    """Return the secret key codes of a sequence are encoded with."""
+    return hashlib.sha256(f"{settings.SECRET_KEY}:code:{name}".encode()).digest()
+
+
+def encode_code(sequence_id, name):
+    """
+    Encode a sequence ID into a code of `CODE_LENGTH` characters from `CODE_ALPHABET`.
+
+    The encoding is a keyed permutation of every possible code, so distinct IDs
+    always give distinct codes while consecutive IDs give unrelated-looking ones.
+
+    :param sequence_id: The ID to encode, from 0 to `CODE_HALF ** 2 - 1`.
+    :param name: The name of the sequence, keying the permutation.
+    :return: The code.
+    :raises ValueError: If the ID is out of range.
+    """
+    if not 0 <= sequence_id < CODE_HALF ** 2:
+        raise ValueError("Sequence ID out of range.")
+    key = _code_key(name)
+    left, right = divmod(sequence_id, CODE_HALF)
+    for round_index in range(CODE_ROUNDS):
+        left, right = right, (left + _code_round(right, round_index, key)) % CODE_HALF
+    value = left * CODE_HALF + right
+    characters = []
+    for _ in range(CODE_LENGTH):
+        value, digit = divmod(value, len(CODE_ALPHABET))
+        characters.append(CODE_ALPHABET[digit])
+    return ''.join(reversed(characters))
+
+
+def decode_code(code, name):
+    """
+    Return the sequence ID a code was encoded from.
+
+    :param code: A code made by `encode_code`.
+    :param name: The name of the sequence.
+    :return: The sequence ID.
+    """
+    value = 0
+    for character in code:
+        value = value * len(CODE_ALPHABET) + CODE_ALPHABET.index(character)
+    key = _code_key(name)
+    left, right = divmod(value, CODE_HALF)
+    for round_index in reversed(range(CODE_ROUNDS)):
+        left, right = (right - _code_round(left, round_index, key)) % CODE_HALF, left
+    return left * CODE_HALF + right
+
+
+def generate_unique_code(model_class):
     """
     Generates a unique code for a model instance.
 
-    :param model_class: The model class to check for existing codes. This should be a Django model.
-    :param field_name: The field name where the code should be checked. Default is 'code'.
-    :param length: The length of the generated code. Default is 12 characters.
-    :param max_retries: The maximum number of retries if a code collision occurs. Default is 10.
+    Codes are encoded from a per-model sequence, so no lookups are needed to
+    avoid collisions. Each process reserves sequence IDs in blocks of
+    `CODE_BLOCK_SIZE`, so most codes cost no query at all.
+
+    :param model_class: The model class the code is for. This should be a Django model.
+    :return: A unique code.
+    """
+    CodeSequence = apps.get_model('manager', 'CodeSequence')  # Lazy load
+    name = model_class._meta.label_lower
+    sequence_id = _code_allocator.take(name, getattr(settings, 'CODE_BLOCK_SIZE', 1),
+                                       lambda count: CodeSequence.reserve(name, count))
+    return encode_code(sequence_id, name)
 
-    :return: A unique code that is not already used in the specified model.
 
-    :raises ValueError: If a unique code cannot be generated after the specified number of retries.
+def generate_many(model_class, count):
     """
-    characters = string.ascii_uppercase + string.digits
-    for _ in range(max_retries):
-        code = ''.join(random.choices(characters, k=length))
-        if not model_class.objects.filter(**{field_name: code}).exists():
-            return code
-    raise ValueError(f"Could not generate a unique code after {max_retries} retries")
+    Generates unique codes for many instances of a model with one query.
 
+    :param model_class: The model class the codes are for.
+    :param count: How many codes to generate.
+    :return: A list of unique codes.
+    """
+    if count <= 0:
+        return []
+    CodeSequence = apps.get_model('manager', 'CodeSequence')  # Lazy load
+    name = model_class._meta.label_lower
+    return [encode_code(sequence_id, name) for sequence_id in CodeSequence.reserve(name, count)]
 
-def generate_unique_number(queue):
+
+# Unprefixed ticket numbers run A001..A999, B001..Z999, then Z1000 onwards.
+TICKET_NUMBERS_PER_PREFIX = 999
+TICKET_PREFIXES = string.ascii_uppercase
+
+
+def format_ticket_number(index, prefix=None):
     """
-    Generates a unique participant number for a given queue.
+    Format the n-th ticket number of a ticket series.
+
+    :param index: The 1-based index of the ticket.
+    :param prefix: The prefix of the series (optional). Without one, the letter
+                   advances every 999 tickets, e.g. 'A001' for 1 and 'B001' for 1000.
+    :return: The ticket number.
+    """
+    if prefix:
+        return f"{prefix}{index:03d}"
+    letter = min((index - 1) // TICKET_NUMBERS_PER_PREFIX, len(TICKET_PREFIXES) - 1)
+    return f"{TICKET_PREFIXES[letter]}{index - letter * TICKET_NUMBERS_PER_PREFIX:03d}"
 
-    :param queue: The queue instance for which the participant number is being generated.
 
-    :return: A unique participant number, formatted as a string.
+def parse_ticket_number(ticket_number):
+    """
+    Return the index of an unprefixed ticket number formatted by `format_ticket_number`.
 
-    :raises ValueError: If the number generation logic fails unexpectedly.
+    :param ticket_number: The ticket number, e.g. 'B001'.
+    :return: The 1-based index of the ticket, or 0 if the number is not recognised.
     """
-    with transaction.atomic():
-        last_participant = queue.participant_set.select_for_update().order_by('-joined_at').first()
-        if last_participant and last_participant.number:
-            last_prefix = last_participant.number[0]
-            last_number = int(last_participant.number[1:])
-            if last_number < 999:
-                return f"{last_prefix}{last_number + 1:03d}"
-            else:
-                next_prefix = chr(ord(last_prefix) + 1)
-                return f"{next_prefix}001"
-        else:
-            return "A001"
+    prefix, number = ticket_number[:1], ticket_number[1:]
+    if prefix not in TICKET_PREFIXES or not number.isdigit():
+        return 0
+    return TICKET_PREFIXES.index(prefix) * TICKET_NUMBERS_PER_PREFIX + int(number)
@@ -0,0 +1,8 @@
+class TransitionConflict(ValueError):
+    """
+    Raised when a participant or resource changed between being read and being written,
+    typically because staff at another terminal acted on it first.
+
+    It subclasses ValueError so callers reporting invalid operations keep working.
+    """
+    pass
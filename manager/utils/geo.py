@@ -0,0 +1,75 @@
+from math import atan2, cos, degrees, floor, radians, sin, sqrt
+
+EARTH_RADIUS_KM = 6371
+# Size of the grid cells queues are indexed by, in degrees (about 11 km of latitude).
+GEO_CELL_DEGREES = 0.1
+# Above this many cells a lookup falls back to the bounding box alone.
+MAX_GEO_CELLS = 400
+
+
+def geo_cell(latitude, longitude) -> str:
+    """
+    Return the key of the grid cell containing a location.
+
+    :param latitude: The latitude in degrees.
+    :param longitude: The longitude in degrees.
+    :return: A key of the form ``'<row>:<column>'``.
+    """
+    return f"{floor(latitude / GEO_CELL_DEGREES)}:{floor(longitude / GEO_CELL_DEGREES)}"
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Return the latitude range and longitude ranges enclosing a circle.
+
+    The longitude range is split in two when the box crosses the antimeridian,
+    and covers every longitude when the box reaches a pole.
+
+    :param latitude: The latitude of the centre in degrees.
+    :param longitude: The longitude of the centre in degrees.
+    :param radius_km: The radius of the circle in kilometers.
+    :return: A tuple of the (min, max) latitude and a list of (min, max) longitude ranges.
+    """
+    delta_lat = degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = latitude - delta_lat, latitude + delta_lat
+    if min_lat <= -90 or max_lat >= 90:
+        return (max(min_lat, -90), min(max_lat, 90)), [(-180, 180)]
+
+    delta_lon = degrees(radius_km / (EARTH_RADIUS_KM * cos(radians(latitude))))
+    min_lon, max_lon = longitude - delta_lon, longitude + delta_lon
+    if max_lon - min_lon >= 360:
+        return (min_lat, max_lat), [(-180, 180)]
+    if min_lon < -180:
+        return (min_lat, max_lat), [(min_lon + 360, 180), (-180, max_lon)]
+    if max_lon > 180:
+        return (min_lat, max_lat), [(min_lon, 180), (-180, max_lon - 360)]
+    return (min_lat, max_lat), [(min_lon, max_lon)]
+
+
+def cells_in_box(latitude_range, longitude_ranges):
+    """
+    List the grid cells overlapping a bounding box.
+
+    :param latitude_range: The (min, max) latitude of the box.
+    :param longitude_ranges: The (min, max) longitude ranges of the box.
+    :return: A list of cell keys, or None if the box spans more than `MAX_GEO_CELLS` cells.
+    """
+    rows = range(floor(latitude_range[0] / GEO_CELL_DEGREES),
+                 floor(latitude_range[1] / GEO_CELL_DEGREES) + 1)
+    columns = [column for min_lon, max_lon in longitude_ranges
+               for column in range(floor(min_lon / GEO_CELL_DEGREES),
+                                   floor(max_lon / GEO_CELL_DEGREES) + 1)]
+    if len(rows) * len(columns) > MAX_GEO_CELLS:
+        return None
+    return [f"{row}:{column}" for row in rows for column in columns]
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> float:
+    """
+    Return the great-circle distance between two locations.
+
+    :return: The distance in kilometers.
+    """
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * atan2(sqrt(a), sqrt(1 - a))
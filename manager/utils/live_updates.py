@@ -0,0 +1,540 @@
+import asyncio
+import itertools
+import json
+import logging
+import uuid
+import weakref
+from abc import ABC, abstractmethod
+from collections import deque
+from urllib.parse import parse_qs
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.layers import get_channel_layer
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from manager.utils.state_patch import diff_state
+
+logger = logging.getLogger('queue')
+
+# Type of the channel layer message telling the snapshot hubs that a queue changed.
+CHANGED_EVENT = 'queue.changed'
+# The list fields of each live view patched item by item, with the field identifying their items.
+DISPLAY_LISTS = {'participants': 'number'}
+STATUS_LISTS = {'notification_set': 'id'}
+
+
+def queue_group(queue_id) -> str:
+    """Return the group of the snapshot hubs serving the live views of a queue."""
+    return f"queue_updates_{queue_id}"
+
+
+def resync_interval() -> float:
+    """Return how many seconds the hubs wait before rebuilding a snapshot no event refreshed, 0 never."""
+    return getattr(settings, 'LIVE_UPDATE_RESYNC_SECONDS', 60)
+
+
+def group_renew_interval(channel_layer) -> float:
+    """Return how many seconds the hubs wait before renewing their group memberships, well within their expiry."""
+    return getattr(channel_layer, 'group_expiry', 86400) / 4
+
+
+def _send(queue_id) -> None:
+    """Send a change event to the hubs of a queue, logging rather than raising on failure."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(queue_group(queue_id), {
+            'type': CHANGED_EVENT, 'queue_id': queue_id})
+    except Exception as e:
+        logger.error(f"Error publishing a change of queue {queue_id}: {e}")
+
+
+def publish_queue_change(queue_id) -> None:
+    """
+    Tell the manager displays and participant status pages of a queue that it changed.
+
+    The event is sent once the current transaction commits, and never if it rolls back.
+
+    :param queue_id: The ID of the queue that changed.
+    """
+    if queue_id is None:
+        return
+    transaction.on_commit(lambda: _send(queue_id))
+
+
+def build_display_state(queue_id) -> dict:
+    """
+    Read the list of waiting participants, the participant being called and the next in line.
+
+    The queue's wait time per turn is estimated once for the whole list.
+
+    :param queue_id: The ID of the queue.
+    :return: The state sent to the manager displays of the queue.
+    """
+    Queue = apps.get_model('manager', 'Queue')  # Lazy load
+    Participant = apps.get_model('participant', 'Participant')  # Lazy load
+    queue = Queue.objects.filter(pk=queue_id).first()
+    wait_time_per_turn = queue.get_estimated_wait_time_per_turn() if queue else 0
+    calling = Participant.objects.filter(queue_id=queue_id, is_notified=True).order_by(
+        '-notification__created_at').first()
+    next_in_line = Participant.objects.filter(queue_id=queue_id, state='waiting').exclude(
+        is_notified=True).order_by(*Participant.WAITING_ORDER).first()
+    participants = Participant.with_positions(
+        Participant.objects.filter(queue_id=queue_id, state='waiting')
+        .exclude(pk=calling.pk if calling else None)
+    )
+    return {
+        'participants': [
+            {
+                'number': participant.number,
+                'wait_time': participant.get_wait_time(),
+                'estimated_wait_time': participant.calculate_estimated_wait_time(wait_time_per_turn),
+                'is_notified': participant.is_notified,
+            }
+            for participant in participants
+        ],
+        'calling': calling.number if calling else None,
+        'next_in_line': next_in_line.number if next_in_line else "-",
+    }
+
+
+def build_status_states(queue_id, codes) -> dict:
+    """
+    Read the status page data of several participants of a queue with a fixed number of queries.
+
+    Reading has no side effect: status pages mark notifications as played
+    once they actually played them, see `LiveUpdateConsumer.receive`.
+
+    :param queue_id: The ID of the queue.
+    :param codes: The codes of the participants.
+    :return: The state sent to each participant's status page, keyed by participant code.
+    """
+    from manager.utils.category_handler import CategoryHandlerFactory  # Lazy load
+    Queue = apps.get_model('manager', 'Queue')  # Lazy load
+    Participant = apps.get_model('participant', 'Participant')  # Lazy load
+    Notification = apps.get_model('participant', 'Notification')  # Lazy load
+    queue = Queue.objects.filter(pk=queue_id).first()
+    if queue is None or not codes:
+        return {}
+    handler = CategoryHandlerFactory.get_handler(queue.category)
+    participants = Participant.with_positions(
+        handler.get_participant_set(queue_id=queue_id).filter(code__in=codes)
+    ).select_related('resource').prefetch_related(
+        Prefetch('notification_set', queryset=Notification.objects.order_by('pk')))
+
+    states = {}
+    for participant in participants:
+        participant.queue = queue
+        try:
+            state = handler.get_participant_data(participant)
+        except Exception as e:
+            logger.error(f"Error reading the status of participant {participant.code}: {e}")
+            continue
+        state['notification_set'] = [
+            {
+                'id': notif.id,
+                'message': notif.message,
+                'created_at': timezone.localtime(notif.created_at).strftime("%Y-%m-%d %H:%M:%S"),
+                'is_read': notif.is_read,
+                'played_sound': notif.played_sound,
+            }
+            for notif in participant.notification_set.all()
+        ]
+        states[participant.code] = state
+    return states
+
+
+def build_states(queue_id, display, codes) -> dict:
+    """
+    Read the state of a queue for its live views.
+
+    :param queue_id: The ID of the queue.
+    :param display: Whether to read the state of the manager displays.
+    :param codes: The codes of the participants whose status pages are connected.
+    :return: The state of each view, keyed by participant code, or by None for the displays.
+    """
+    states = build_status_states(queue_id, codes)
+    if display:
+        states[None] = build_display_state(queue_id)
+    return states
+
+
+class LiveStream:
+    """
+    The versioned state of one live view of a queue: its manager display or one participant's status page.
+
+    Each change of the state gets the next version and is kept as a patch, so
+    a client can catch up from a recent version without being sent the whole
+    state again. Versions are only meaningful within the stream that issued
+    them, identified by a random ID.
+
+    :ivar id: The random ID of the stream.
+    :ivar version: The version of the current state, 0 before the first.
+    :ivar state: The current state.
+    """
+    # How many patches are kept for clients catching up.
+    HISTORY = 50
+
+    def __init__(self, lists):
+        self.id = uuid.uuid4().hex
+        self.lists = lists
+        self.version = 0
+        self.state = None
+        self.read = -1
+        self._patches = deque(maxlen=self.HISTORY)
+        self._snapshot = None
+
+    def update(self, state, read) -> None:
+        """
+        Make a state the current one, unless it is older than the current one.
+
+        :param state: The new state.
+        :param read: The number of the read the state comes from, increasing with time.
+        """
+        if read < self.read:
+            return
+        self.read = read
+        if self.state == state:
+            return
+        ops = diff_state(self.state, state, self.lists) if self.state is not None else None
+        self.version += 1
+        patch = json.dumps({'type': 'patch', 'stream': self.id, 'version': self.version,
+                            'base': self.version - 1, 'ops': ops}) if ops is not None else None
+        self._patches.append((self.version, patch))
+        self.state = state
+        self._snapshot = None
+
+    def snapshot(self) -> str:
+        """Return the JSON text of the whole current state."""
+        if self._snapshot is None:
+            self._snapshot = json.dumps({'type': 'snapshot', 'stream': self.id, 'version': self.version,
+                                         'keys': self.lists, 'state': self.state})
+        return self._snapshot
+
+    def catch_up(self, stream_id, version) -> list:
+        """
+        Return the texts taking a client from a version to the current state.
+
+        :param stream_id: The ID of the stream the client's version is from, or None.
+        :param version: The client's version, or None.
+        :return: (version, text) pairs of the patches since the client's version, or of the
+                 snapshot if it is smaller, the version is not kept or it comes from another stream.
+        """
+        if stream_id == self.id and version == self.version:
+            return []
+        if stream_id == self.id and isinstance(version, int) and 0 < version < self.version:
+            patches = [(patch_version, patch) for patch_version, patch in self._patches if patch_version > version]
+            if (self._patches[0][0] <= version + 1 and all(patch for _, patch in patches)
+                    and sum(len(patch) for _, patch in patches) < len(self.snapshot())):
+                return patches
+        return [(self.version, self.snapshot())]
+
+
+class QueueSnapshotHub:
+    """
+    Reads the state of each queue once per change and fans it out to every live view of this process.
+
+    The hub alone listens to the change events of the queues it serves, so the
+    number of queries grows with the number of queues changing rather than with
+    the number of connected sockets. Each view of a queue is a `LiveStream`
+    whose patches are serialized once for all of its sockets. Events arriving
+    while a queue is read are coalesced into one more read, and every
+    `LIVE_UPDATE_RESYNC_SECONDS` each queue is read again in case an event was missed.
+    Group memberships expire in the channel layer, so the hub renews them
+    regularly whether or not it resyncs.
+
+    :ivar subscribers: The consumers subscribed to each queue, keyed by queue ID.
+    :ivar streams: The stream of each view of each queue, keyed by queue ID then participant code,
+                   None being the manager displays.
+    """
+    # One hub per event loop, as channel layers and tasks are bound to their loop.
+    _hubs = weakref.WeakKeyDictionary()
+
+    def __init__(self, channel_layer):
+        self.channel_layer = channel_layer
+        self.channel_name = None
+        self.subscribers = {}
+        self.streams = {}
+        self._reads = itertools.count()
+        self._dirty = set()
+        self._builds = {}
+        self._tasks = []
+
+    @classmethod
+    def get(cls) -> 'QueueSnapshotHub':
+        """Return the hub of the running event loop, creating it if needed."""
+        loop = asyncio.get_running_loop()
+        if loop not in cls._hubs:
+            cls._hubs[loop] = cls(get_channel_layer())
+        return cls._hubs[loop]
+
+    async def subscribe(self, queue_id, consumer) -> None:
+        """
+        Start pushing a view of a queue to a consumer, beginning with what it is missing of the current state.
+
+        :param queue_id: The ID of the queue.
+        :param consumer: The consumer, providing `participant_code` and `push`.
+        """
+        if self.channel_name is None:
+            self.channel_name = await self.channel_layer.new_channel()
+            self._tasks = [asyncio.create_task(self.listen()),
+                           asyncio.create_task(self.renew_groups(group_renew_interval(self.channel_layer)))]
+            if resync_interval() > 0:
+                self._tasks.append(asyncio.create_task(self.resync(resync_interval())))
+        subscribers = self.subscribers.setdefault(queue_id, set())
+        if not subscribers:
+            await self.channel_layer.group_add(queue_group(queue_id), self.channel_name)
+        subscribers.add(consumer)
+
+        code = consumer.participant_code
+        streams = self.streams.setdefault(queue_id, {})
+        if code not in streams:
+            streams[code] = LiveStream(DISPLAY_LISTS if code is None else STATUS_LISTS)
+        stream = streams[code]
+        if stream.state is None:
+            read = next(self._reads)
+            states = await sync_to_async(build_states)(queue_id, code is None, [code] if code else [])
+            if code in states:
+                stream.update(states[code], read)
+        await consumer.push(stream)
+
+    async def unsubscribe(self, queue_id, consumer) -> None:
+        """
+        Stop pushing a view of a queue to a consumer.
+
+        :param queue_id: The ID of the queue.
+        :param consumer: The consumer.
+        """
+        subscribers = self.subscribers.get(queue_id)
+        if not subscribers or consumer not in subscribers:
+            return
+        subscribers.discard(consumer)
+        if not any(other.participant_code == consumer.participant_code for other in subscribers):
+            self.streams.get(queue_id, {}).pop(consumer.participant_code, None)
+        if not subscribers:
+            del self.subscribers[queue_id]
+            self.streams.pop(queue_id, None)
+            await self.channel_layer.group_discard(queue_group(queue_id), self.channel_name)
+        if not self.subscribers:
+            for task in self._tasks + list(self._builds.values()):
+                task.cancel()
+            self.channel_name, self._tasks, self._builds = None, [], {}
+
+    def stream(self, queue_id, participant_code):
+        """Return the stream of a view of a queue, or None if no one is subscribed to it."""
+        return self.streams.get(queue_id, {}).get(participant_code)
+
+    def request_build(self, queue_id) -> None:
+        """Read a queue again soon, unless a read that has not started yet is already due."""
+        if queue_id not in self.subscribers:
+            return
+        self._dirty.add(queue_id)
+        build = self._builds.get(queue_id)
+        if build is None or build.done():
+            self._builds[queue_id] = asyncio.create_task(self.build(queue_id))
+
+    async def build(self, queue_id) -> None:
+        """Read a queue and push its changes to its views until no change arrived while doing so."""
+        while queue_id in self._dirty and queue_id in self.subscribers:
+            self._dirty.discard(queue_id)
+            codes = {consumer.participant_code for consumer in self.subscribers[queue_id]}
+            read = next(self._reads)
+            try:
+                states = await sync_to_async(build_states)(queue_id, None in codes, sorted(codes - {None}))
+            except Exception as e:
+                logger.error(f"Error reading the live state of queue {queue_id}: {e}")
+                continue
+            streams = self.streams.get(queue_id, {})
+            for code, state in states.items():
+                if code in streams:
+                    streams[code].update(state, read)
+            for consumer in list(self.subscribers.get(queue_id, ())):
+                stream = streams.get(consumer.participant_code)
+                if stream is None:
+                    continue
+                try:
+                    await consumer.push(stream)
+                except Exception as e:
+                    logger.error(f"Error pushing the live state of queue {queue_id}: {e}")
+
+    async def listen(self):
+        """Read each queue a change event is received for."""
+        while True:
+            message = await self.channel_layer.receive(self.channel_name)
+            if message.get('type') == CHANGED_EVENT:
+                self.request_build(message['queue_id'])
+
+    async def renew_groups(self, interval):
+        """Add the hub to the group of every queue it serves again every few seconds, before the membership expires."""
+        while True:
+            await asyncio.sleep(interval)
+            for queue_id in list(self.subscribers):
+                try:
+                    await self.channel_layer.group_add(queue_group(queue_id), self.channel_name)
+                except Exception as e:
+                    logger.error(f"Error renewing the live updates of queue {queue_id}: {e}")
+
+    async def resync(self, interval):
+        """Read every queue every few seconds, in case an event was missed."""
+        while True:
+            await asyncio.sleep(interval)
+            for queue_id in list(self.subscribers):
+                self.request_build(queue_id)
+
+
+class LiveSubscriber(ABC):
+    """
+    Something the hub pushes one view of a queue to: a WebSocket or a Server-Sent Events stream.
+
+    :ivar queue_id: The ID of the queue.
+    :ivar participant_code: The code of the participant whose status is pushed, None for the manager display.
+    :ivar stream_id: The ID of the stream the client's state comes from, None before the first.
+    :ivar version: The version of the client's state, None before the first.
+    """
+    queue_id = None
+    participant_code = None
+    stream_id = None
+    version = None
+
+    async def push(self, stream):
+        """Deliver what takes the client from its version to the current state of a stream."""
+        if stream.state is None:
+            return
+        for version, text in stream.catch_up(self.stream_id, self.version):
+            await self.deliver(text, f"{stream.id}:{version}")
+        self.stream_id, self.version = stream.id, stream.version
+
+    def resume_from(self, event_id) -> None:
+        """
+        Start from the version of an event ID of the form ``<stream>:<version>``.
+
+        :param event_id: The ID of the last event the client applied, or None.
+        """
+        stream_id, _, version = (event_id or '').partition(':')
+        self.stream_id = stream_id or None
+        self.version = int(version) if version.isdigit() else None
+
+    @abstractmethod
+    async def deliver(self, text, event_id):
+        """
+        Send a message to the client.
+
+        :param text: The JSON text of the snapshot or patch.
+        :param event_id: The stream ID and version the message brings the client to.
+        """
+        pass
+
+
+class LiveUpdateConsumer(LiveSubscriber, AsyncWebsocketConsumer):
+    """
+    Base of the WebSocket consumers pushing a view of a queue when it changes instead of polling it.
+
+    The client is sent a snapshot of the state, then patches each taking it
+    from one version to the next. A client reconnecting with the `stream` and
+    `version` query parameters of the last state it applied, or sending
+    ``{"type": "resync", "stream": ..., "version": ...}`` when it missed a
+    patch, is sent only the patches since that version when they are still
+    kept, and a snapshot otherwise. A status page sends
+    ``{"type": "played", "ids": [...]}`` once it played the sound of new
+    notifications, so other pages of the participant do not play it again.
+
+    Subclasses set `queue_id` and, for a participant's status page,
+    `participant_code` in `get_subscription`.
+    """
+    async def connect(self):
+        """Accept the connection and subscribe to the view of the queue."""
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        self.stream_id = query.get('stream', [None])[0]
+        version = query.get('version', [''])[0]
+        self.version = int(version) if version.isdigit() else None
+        await self.accept()
+        await self.get_subscription()
+        if self.queue_id is not None:
+            await QueueSnapshotHub.get().subscribe(self.queue_id, self)
+
+    async def disconnect(self, close_code):
+        """
+        Unsubscribe from the view of the queue.
+
+        :param close_code: The code indicating why the connection was closed.
+        """
+        if self.queue_id is not None:
+            await QueueSnapshotHub.get().unsubscribe(self.queue_id, self)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        """Handle a resync request or the acknowledgement of played notifications."""
+        try:
+            message = json.loads(text_data or '')
+        except ValueError:
+            return
+        if not isinstance(message, dict):
+            return
+        if message.get('type') == 'played' and self.participant_code is not None:
+            ids = [pk for pk in message.get('ids') or [] if isinstance(pk, int)]
+            if ids:
+                Notification = apps.get_model('participant', 'Notification')  # Lazy load
+                if await sync_to_async(Notification.mark_played)(self.participant_code, ids):
+                    QueueSnapshotHub.get().request_build(self.queue_id)
+            return
+        if message.get('type') != 'resync':
+            return
+        stream = QueueSnapshotHub.get().stream(self.queue_id, self.participant_code)
+        if stream is not None:
+            self.stream_id, self.version = message.get('stream'), message.get('version')
+            await self.push(stream)
+
+    async def deliver(self, text, event_id):
+        """Send a message over the WebSocket."""
+        await self.send(text)
+
+    @abstractmethod
+    async def get_subscription(self):
+        """Set the `queue_id` and, for a participant's status page, the `participant_code` to subscribe to."""
+        pass
+
+
+class LiveEventStream(LiveSubscriber):
+    """
+    A participant's status page as a stream of Server-Sent Events, fed by the hub without a thread.
+
+    Each event carries a snapshot or patch of the WebSocket protocol and has the
+    ID ``<stream>:<version>``, so a reconnecting `EventSource` resumes from its
+    `Last-Event-ID`. A comment is sent every `SSE_HEARTBEAT_SECONDS` without
+    events to keep proxies from closing the connection.
+    """
+
+    def __init__(self, queue_id, participant_code, last_event_id=None):
+        self.queue_id = queue_id
+        self.participant_code = participant_code
+        self.resume_from(last_event_id)
+        self._events = asyncio.Queue()
+
+    @staticmethod
+    def heartbeat_interval() -> float:
+        """Return how many seconds without events pass before a heartbeat is sent."""
+        return getattr(settings, 'SSE_HEARTBEAT_SECONDS', 15)
+
+    async def deliver(self, text, event_id):
+        """Queue an event for the response."""
+        self._events.put_nowait(f"id: {event_id}\ndata: {text}\n\n")
+
+    async def events(self):
+        """
+        Yield the events of the stream until the client disconnects.
+
+        The hub subscription is released when the response is closed or cancelled.
+        """
+        hub = QueueSnapshotHub.get()
+        await hub.subscribe(self.queue_id, self)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(self._events.get(), self.heartbeat_interval())
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+        finally:
+            await hub.unsubscribe(self.queue_id, self)
@@ -0,0 +1,93 @@
+import logging
+import threading
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger('queue')
+
+
+def run_maintenance(chunk_size=1000) -> dict:
+    """
+    Apply the retention of completed participants and line length history, and
+    delete expired channel layer messages.
+
+    :param chunk_size: The maximum number of rows deleted per statement.
+    :return: The number of rows deleted, keyed by what they were.
+    """
+    Participant = apps.get_model('participant', 'Participant')  # Lazy load
+    QueueLineLengthBucket = apps.get_model('manager', 'QueueLineLengthBucket')  # Lazy load
+    ChannelMessage = apps.get_model('manager', 'ChannelMessage')  # Lazy load
+    participants = Participant.remove_old_completed_participants(chunk_size=chunk_size)
+    samples, buckets = QueueLineLengthBucket.prune(chunk_size=chunk_size)
+    messages, memberships = ChannelMessage.prune(chunk_size=chunk_size)
+    return {'participants': participants, 'line_length_samples': samples, 'line_length_buckets': buckets,
+            'channel_messages': messages, 'channel_group_memberships': memberships}
+
+
+class PeriodicRunner:
+    """
+    Runs a function every few seconds on a daemon thread.
+
+    Each run gets fresh database connections, and a failing run is logged
+    without stopping the ones after it.
+
+    :ivar interval: The number of seconds between the end of a run and the start of the next.
+    """
+
+    def __init__(self, function, interval, name=None):
+        self.function = function
+        self.interval = interval
+        self.name = name or getattr(function, '__name__', 'periodic')
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start running the function in the background, unless already started."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop after the current run and wait for the thread to finish."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def run_once(self):
+        """Run the function once, logging instead of raising its errors."""
+        close_old_connections()
+        try:
+            return self.function()
+        except Exception:
+            logger.exception("Periodic task %s failed.", self.name)
+        finally:
+            close_old_connections()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.run_once()
+
+
+_maintenance_runner = None
+
+
+def start_maintenance_runner():
+    """
+    Start the in-process maintenance runner of this server process.
+
+    The runner is disabled when `MAINTENANCE_INTERVAL_SECONDS` is 0, e.g. when
+    the `run_maintenance` command is scheduled instead.
+
+    :return: The runner, or None if it is disabled.
+    """
+    global _maintenance_runner
+    interval = getattr(settings, 'MAINTENANCE_INTERVAL_SECONDS', 0)
+    if interval <= 0:
+        return None
+    if _maintenance_runner is None:
+        _maintenance_runner = PeriodicRunner(run_maintenance, interval, name='maintenance')
+    _maintenance_runner.start()
+    return _maintenance_runner
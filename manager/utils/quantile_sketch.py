@@ -0,0 +1,87 @@
+import math
+
+
+class QuantileSketch:
+    """
+    A mergeable quantile sketch with relative-error guarantees (DDSketch style).
+
+    Positive values are counted in logarithmically sized bins, so any quantile
+    is estimated within `relative_accuracy` of the true value whatever the
+    distribution, and two sketches with the same accuracy merge by adding their
+    bin counts. Values of zero or less share a single bin.
+
+    With the default 1% accuracy, durations from one second to one day need
+    fewer than 600 bins.
+    """
+    DEFAULT_RELATIVE_ACCURACY = 0.01
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY, bins=None,
+                 zero_count=0):
+        """
+        :param relative_accuracy: The maximum relative error of the quantiles.
+        :param bins: The bin counts keyed by bin index (optional).
+        :param zero_count: The number of values of zero or less (optional).
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {int(index): count for index, count in (bins or {}).items()}
+        self.zero_count = zero_count
+
+    @property
+    def count(self) -> int:
+        """The number of values added to the sketch."""
+        return self.zero_count + sum(self.bins.values())
+
+    def add(self, value, count=1) -> None:
+        """
+        Add a value to the sketch.
+
+        :param value: The value to add.
+        :param count: How many times to add it (default is 1).
+        """
+        if value <= 0:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + count
+
+    def merge(self, other) -> None:
+        """
+        Add the values of another sketch to this one.
+
+        :param other: A sketch with the same relative accuracy.
+        :raises ValueError: If the relative accuracies differ.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracies.")
+        self.zero_count += other.zero_count
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+
+    def quantile(self, q):
+        """
+        Estimate a quantile of the added values.
+
+        :param q: The quantile between 0 and 1, e.g. 0.9 for the 90th percentile.
+        :return: The estimated value, or None if the sketch is empty.
+        :raises ValueError: If `q` is outside [0, 1].
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("Quantile must be between 0 and 1.")
+        count = self.count
+        if not count:
+            return None
+        rank = q * (count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_dict(self) -> dict:
+        """Return the bin counts in a JSON-serializable form."""
+        return {str(index): count for index, count in sorted(self.bins.items())}
@@ -15,9 +15,8 @@ def get_general_queue_data(request, queue_id):
     :param queue_id: The ID of the queue to fetch data for.
     :return: A JsonResponse containing the participants' data grouped by state.
     """
-    Participant.remove_old_completed_participants()
     queue = get_object_or_404(Queue, id=queue_id)
-    waiting_participants = Participant.objects.filter(queue=queue, state='waiting').order_by('position')
+    waiting_participants = Participant.with_positions(Participant.objects.filter(queue=queue, state='waiting'))
     serving_participants = Participant.objects.filter(queue=queue, state='serving').order_by('service_started_at')
     completed_participants = Participant.objects.filter(queue=queue, state='completed').order_by('-service_completed_at')
 
@@ -74,12 +73,11 @@ def get_unique_queue_category_data(request, queue_id):
     :param queue_id: The ID of the queue to fetch data for.
     :return: A JsonResponse containing the participants' data grouped by state.
     """
-    Participant.remove_old_completed_participants()
     queue = get_object_or_404(Queue, id=queue_id)
     handler = CategoryHandlerFactory.get_handler(queue.category)
     queue = handler.get_queue_object(queue_id)
     participant = handler.get_participant_set(queue_id)
-    waiting_participants = participant.filter(queue=queue, state='waiting').order_by('position')
+    waiting_participants = Participant.with_positions(participant.filter(queue=queue, state='waiting'))
     serving_participants = participant.filter(queue=queue, state='serving').order_by('service_started_at')
     completed_participants = participant.filter(queue=queue, state='completed').order_by('-service_completed_at')
 
@@ -0,0 +1,427 @@
+import math
+from datetime import datetime, time, timedelta
+from django.apps import apps
+from django.db.models import (Avg, Count, DurationField, ExpressionWrapper, F,
+                              Func, IntegerField, Max, Q, Sum, Value)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+class WholeMinutes(Func):
+    """
+    Converts a duration expression into whole minutes, truncated the same way
+    as ``int(duration.total_seconds() / 60)`` in Python.
+
+    Backends without a native interval type (SQLite) store durations as
+    microseconds, PostgreSQL needs the epoch extracted from the interval.
+    """
+    output_field = IntegerField()
+    template = 'CAST(%(expressions)s / 60000000 AS integer)'
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(TRUNC(EXTRACT(EPOCH FROM %(expressions)s) / 60) AS integer)',
+            **extra_context
+        )
+
+
+def elapsed_minutes(end_field, start_field):
+    """
+    Build an expression for the whole minutes elapsed between two datetime fields.
+
+    :param end_field: The name of the later datetime field.
+    :param start_field: The name of the earlier datetime field.
+    :return: An integer expression, NULL when either field is NULL.
+    """
+    return WholeMinutes(ExpressionWrapper(F(end_field) - F(start_field),
+                                          output_field=DurationField()))
+
+
+def wait_minutes(prefix=''):
+    """
+    Build an expression for a participant's wait in whole minutes.
+
+    Mirrors `Participant.get_wait_time` for participants who are no longer
+    waiting: NULL until service has started.
+
+    :param prefix: The lookup path to the participant, e.g. ``'served_participants__'``.
+    """
+    return elapsed_minutes(f'{prefix}service_started_at', f'{prefix}joined_at')
+
+
+def service_minutes(prefix=''):
+    """
+    Build an expression for a completed participant's service duration in whole minutes.
+
+    Mirrors `Participant.get_service_duration`, which reports 0 when either
+    service timestamp is missing.
+
+    :param prefix: The lookup path to the participant, e.g. ``'served_participants__'``.
+    """
+    return Coalesce(elapsed_minutes(f'{prefix}service_completed_at',
+                                    f'{prefix}service_started_at'),
+                    Value(0))
+
+
+def start_of_day(day):
+    """
+    Return the aware datetime at which a local calendar day starts.
+
+    :param day: The local date.
+    :return: Midnight of `day` in the current time zone.
+    """
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def participant_aggregates():
+    """
+    Build the conditional aggregates shared by the live statistics and the daily rollups.
+
+    The keys match the counter fields of `QueueDailyStats`, so live results and
+    rollup sums can be merged field by field. Durations are in whole minutes.
+
+    :return: A dictionary of aggregate expressions.
+    """
+    wait = wait_minutes()
+    service = service_minutes()
+    waited = ~Q(state='waiting') & Q(service_started_at__isnull=False)
+    completed = Q(state='completed')
+    return {
+        'joined': Count('id'),
+        'waiting': Count('id', filter=Q(state='waiting')),
+        'serving': Count('id', filter=Q(state='serving')),
+        'completed': Count('id', filter=completed),
+        'cancelled': Count('id', filter=Q(state='cancelled')),
+        'no_show': Count('id', filter=Q(state='no_show')),
+        'created_by_guest': Count('id', filter=Q(created_by='guest')),
+        'created_by_staff': Count('id', filter=Q(created_by='staff')),
+        'wait_count': Count('id', filter=waited),
+        'wait_total': Sum(wait, filter=waited),
+        'wait_max': Max(wait, filter=waited),
+        'service_count': Count('id', filter=completed),
+        'service_total': Sum(service, filter=completed),
+        'service_max': Max(service, filter=completed),
+    }
+
+
+def resource_aggregates(prefix='', window=Q()):
+    """
+    Build the aggregates reported per resource on the statistics page.
+
+    :param prefix: The lookup path from the aggregated model to the participant,
+                   e.g. ``'served_participants__'`` when grouping resources.
+    :param window: A Q object every aggregate is restricted to.
+    :return: A dictionary of aggregate expressions; durations are averages in minutes.
+    """
+    def states(*names):
+        return window & Q(**{f'{prefix}state__in': names})
+
+    participant = f'{prefix}id'
+    return {
+        'total': Count(participant, filter=window),
+        'served': Count(participant, filter=states('serving', 'completed')),
+        'dropoff': Count(participant, filter=states('removed', 'cancelled')),
+        'completed': Count(participant, filter=states('completed')),
+        'avg_wait': Avg(wait_minutes(prefix), filter=states('serving', 'completed')),
+        'avg_serve': Avg(service_minutes(prefix), filter=states('completed')),
+    }
+
+
+class QueueStatistics:
+    """
+    Computes the statistics of a queue for a date window.
+
+    All participant metrics are collected with a single conditional-aggregation
+    query and the line length metrics from the downsampled line length buckets.
+    Both are evaluated lazily and cached on the instance.
+
+    With `use_rollups`, whole days before today are read from `QueueDailyStats`
+    and only the remaining partial days are aggregated from participants, which
+    adds one query but keeps long windows independent of the participant history.
+    """
+
+    def __init__(self, queue, start_date=None, end_date=None, use_rollups=False):
+        """
+        :param queue: The queue to compute statistics for.
+        :param start_date: The start date for the filter (optional).
+        :param end_date: The end date for the filter (optional).
+        :param use_rollups: Whether to read whole past days from the daily rollups.
+        """
+        self.queue = queue
+        self.start_date = start_date
+        self.end_date = end_date
+        self.use_rollups = use_rollups and end_date is not None
+        self._participant_metrics = None
+        self._line_length_metrics = None
+
+    def _in_window(self, field_name):
+        """Return a Q object restricting `field_name` to the date window, if one is set."""
+        if self.start_date and self.end_date:
+            return Q(**{f'{field_name}__range': (self.start_date, self.end_date)})
+        return Q()
+
+    def _rollup_days(self):
+        """
+        Split the window into whole local days covered by the rollups.
+
+        :return: A tuple of the first and last rollup day, or None if no whole
+                 past day lies within the window.
+        """
+        end_day = timezone.localdate(self.end_date)
+        last_day = end_day - timedelta(days=1)
+        if self.start_date is None:
+            first_day = None
+        else:
+            first_day = timezone.localdate(self.start_date)
+            if self.start_date > start_of_day(first_day):
+                first_day += timedelta(days=1)
+            if first_day > last_day:
+                return None
+        return first_day, last_day
+
+    def _live_metrics(self, window):
+        """Aggregate the participants matching `window` in one query."""
+        metrics = self.queue.participant_set.filter(window).aggregate(
+            **participant_aggregates())
+        return {field: value or 0 for field, value in metrics.items()}
+
+    def _rollup_metrics(self, first_day, last_day):
+        """
+        Sum the daily rollups between two days and aggregate the partial days around them.
+
+        :param first_day: The first rollup day, or None for no lower bound.
+        :param last_day: The last rollup day.
+        :return: The merged metrics dictionary.
+        """
+        QueueDailyStats = apps.get_model('manager', 'QueueDailyStats')  # Lazy load
+        rollups = QueueDailyStats.objects.filter(queue=self.queue, day__lte=last_day)
+        live_window = Q(joined_at__gte=start_of_day(last_day + timedelta(days=1)),
+                        joined_at__lte=self.end_date)
+        if first_day is not None:
+            rollups = rollups.filter(day__gte=first_day)
+            live_window |= Q(joined_at__gte=self.start_date,
+                             joined_at__lt=start_of_day(first_day))
+        aggregates = {
+            field: Max(field) if field in QueueDailyStats.MAXIMUM_FIELDS else Sum(field)
+            for field in QueueDailyStats.COUNTER_FIELDS
+        }
+        metrics = self._live_metrics(live_window)
+        for field, value in rollups.aggregate(**aggregates).items():
+            if field in QueueDailyStats.MAXIMUM_FIELDS:
+                metrics[field] = max(metrics[field], value or 0)
+            else:
+                metrics[field] += value or 0
+        return metrics
+
+    @property
+    def participant_metrics(self) -> dict:
+        """
+        Aggregate every participant metric of the window.
+
+        :return: A dictionary of counts and duration totals/maxima (in minutes),
+                 keyed like the `QueueDailyStats` counters.
+        """
+        if self._participant_metrics is None:
+            rollup_days = self._rollup_days() if self.use_rollups else None
+            if rollup_days:
+                self._participant_metrics = self._rollup_metrics(*rollup_days)
+            else:
+                self._participant_metrics = self._live_metrics(
+                    self._in_window('joined_at'))
+        return self._participant_metrics
+
+    @property
+    def line_length_metrics(self) -> dict:
+        """
+        Summarize the recorded line lengths of the window from the downsampled buckets.
+
+        :return: A dictionary with the peak, the average and the time-weighted average line length.
+        """
+        if self._line_length_metrics is None:
+            QueueLineLengthBucket = apps.get_model('manager', 'QueueLineLengthBucket')  # Lazy load
+            self._line_length_metrics = QueueLineLengthBucket.summarize(
+                self.queue, self.start_date, self.end_date)
+        return self._line_length_metrics
+
+    def resource_metrics(self) -> list:
+        """
+        Aggregate the participants served by each resource of the queue in one query.
+
+        Participants are matched through `Participant.resource_served`, so
+        resources with the same name in other queues are not counted.
+
+        :return: A list of dictionaries, one per resource, holding the resource
+                 with its counts and average wait/serve minutes (rounded up).
+        """
+        Resource = apps.get_model('manager', 'Resource')  # Lazy load
+        # The window filters inside the aggregates, so idle resources are kept.
+        aggregates = resource_aggregates(
+            'served_participants__', self._in_window('served_participants__joined_at'))
+        resources = Resource.objects.filter(queue=self.queue).annotate(
+            **{f'stats_{field}': aggregate for field, aggregate in aggregates.items()}
+        ).order_by('id')
+        return [
+            {
+                'resource': resource,
+                'total': resource.stats_total,
+                'served': resource.stats_served,
+                'dropoff': resource.stats_dropoff,
+                'completed': resource.stats_completed,
+                'avg_wait': math.ceil(resource.stats_avg_wait)
+                if resource.stats_avg_wait is not None else 0,
+                'avg_serve': math.ceil(resource.stats_avg_serve)
+                if resource.stats_avg_serve is not None else 0,
+            }
+            for resource in resources
+        ]
+
+    @property
+    def total(self) -> int:
+        """The number of participants who joined within the window."""
+        return self.participant_metrics['joined']
+
+    @property
+    def active(self) -> int:
+        """The number of participants who have not cancelled."""
+        return self.total - self.cancelled
+
+    @property
+    def waiting(self) -> int:
+        """The number of participants in the 'waiting' state."""
+        return self.participant_metrics['waiting']
+
+    @property
+    def serving(self) -> int:
+        """The number of participants in the 'serving' state."""
+        return self.participant_metrics['serving']
+
+    @property
+    def served(self) -> int:
+        """The number of participants in the 'completed' state."""
+        return self.participant_metrics['completed']
+
+    @property
+    def cancelled(self) -> int:
+        """The number of participants in the 'cancelled' state."""
+        return self.participant_metrics['cancelled']
+
+    @property
+    def no_show(self) -> int:
+        """The number of participants in the 'no_show' state."""
+        return self.participant_metrics['no_show']
+
+    @property
+    def dropoff(self) -> int:
+        """The number of participants who cancelled or did not show up."""
+        return self.cancelled + self.no_show
+
+    @property
+    def unhandled(self) -> int:
+        """The number of participants who are waiting or being served."""
+        return self.waiting + self.serving
+
+    @property
+    def created_by_guest(self) -> int:
+        """The number of participants who joined via link."""
+        return self.participant_metrics['created_by_guest']
+
+    @property
+    def created_by_staff(self) -> int:
+        """The number of participants who were added by staff."""
+        return self.participant_metrics['created_by_staff']
+
+    @property
+    def average_waiting_time(self) -> int:
+        """The average waiting time in minutes, rounded up."""
+        metrics = self.participant_metrics
+        return math.ceil(metrics['wait_total'] / metrics['wait_count']) \
+            if metrics['wait_count'] else 0
+
+    @property
+    def max_waiting_time(self) -> int:
+        """The maximum waiting time in minutes."""
+        return self.participant_metrics['wait_max']
+
+    @property
+    def average_service_duration(self) -> int:
+        """The average service duration in minutes, rounded up."""
+        metrics = self.participant_metrics
+        return math.ceil(metrics['service_total'] / metrics['service_count']) \
+            if metrics['service_count'] else 0
+
+    @property
+    def max_service_duration(self) -> int:
+        """The maximum service duration in minutes."""
+        return self.participant_metrics['service_max']
+
+    @property
+    def wait_percentiles(self) -> dict:
+        """The p50/p90/p99 waiting times in minutes, merged from the daily sketches."""
+        QueueDurationSketch = apps.get_model('manager', 'QueueDurationSketch')  # Lazy load
+        return QueueDurationSketch.percentiles(self.queue, QueueDurationSketch.WAIT,
+                                               self.start_date, self.end_date)
+
+    @property
+    def service_percentiles(self) -> dict:
+        """The p50/p90/p99 service durations in minutes, merged from the daily sketches."""
+        QueueDurationSketch = apps.get_model('manager', 'QueueDurationSketch')  # Lazy load
+        return QueueDurationSketch.percentiles(self.queue, QueueDurationSketch.SERVICE,
+                                               self.start_date, self.end_date)
+
+    @property
+    def peak_line_length(self) -> int:
+        """The peak recorded line length."""
+        return self.line_length_metrics['peak'] or 0
+
+    @property
+    def avg_line_length(self) -> int:
+        """The average recorded line length, rounded up."""
+        avg = self.line_length_metrics['avg']
+        return math.ceil(avg) if avg is not None else 0
+
+    @property
+    def time_weighted_line_length(self) -> float:
+        """The line length averaged over time, rounded to one decimal."""
+        time_weighted = self.line_length_metrics['time_weighted']
+        return round(time_weighted, 1) if time_weighted is not None else 0
+
+    @staticmethod
+    def _percentage(count, total) -> float:
+        """Return `count` as a percentage of `total`, rounded to two decimals."""
+        return round((count / total) * 100, 2) if total else 0
+
+    @property
+    def guest_percentage(self) -> float:
+        """The percentage of participants who joined via link."""
+        return self._percentage(self.created_by_guest, self.total)
+
+    @property
+    def staff_percentage(self) -> float:
+        """The percentage of participants who were added by staff."""
+        return self._percentage(self.created_by_staff, self.total)
+
+    @property
+    def served_percentage(self) -> float:
+        """The percentage of participants who have been served."""
+        return self._percentage(self.served, self.total)
+
+    @property
+    def dropoff_percentage(self) -> float:
+        """The percentage of participants who dropped off."""
+        return self._percentage(self.dropoff, self.total)
+
+    @property
+    def unhandled_percentage(self) -> float:
+        """The percentage of participants who are waiting or being served."""
+        return self._percentage(self.unhandled, self.total)
+
+    @property
+    def cancelled_percentage(self) -> float:
+        """The percentage of dropped off participants who cancelled."""
+        return self._percentage(self.cancelled, self.dropoff)
+
+    @property
+    def no_show_percentage(self) -> float:
+        """The percentage of dropped off participants who did not show up."""
+        return self._percentage(self.no_show, self.dropoff)
@@ -1,4 +1,5 @@
 from io import BytesIO
+from django.apps import apps
 from django.conf import settings
 from django.core.mail import EmailMessage
 import qrcode
@@ -104,3 +105,35 @@ def send_email_with_qr(participant, qr_code_url):
         return True
     except Exception as e:
         raise RuntimeError(f"Error sending QR code email: {e}")
+
+
+def send_pending_qr_emails(queue_id=None, limit=500):
+    """
+    Sends the QR code emails deferred by bulk imports.
+
+    Waiting participants with an email address who have not been sent their QR
+    code yet get one generated, uploaded and emailed. A failure is reported and
+    skipped so that the rest of the batch is still sent.
+
+    :param queue_id: Only send to participants of this queue (optional).
+    :param limit: The maximum number of emails to send (default is 500).
+    :return: A tuple of the number of emails sent and a list of (participant, error) failures.
+    """
+    Participant = apps.get_model('participant', 'Participant')  # Lazy load
+    pending = Participant.objects.filter(state='waiting', qrcode_email_sent=False).exclude(
+        email__isnull=True).exclude(email='').select_related('queue').order_by('pk')
+    if queue_id:
+        pending = pending.filter(queue_id=queue_id)
+
+    sent, failed = 0, []
+    for participant in pending[:limit]:
+        try:
+            qrcode_url = participant.qrcode_url or generate_participant_qr_code_url(participant)
+            Participant.objects.filter(pk=participant.pk).update(qrcode_url=qrcode_url)
+            send_email_with_qr(participant, qrcode_url)
+        except RuntimeError as e:
+            failed.append((participant, e))
+            continue
+        Participant.objects.filter(pk=participant.pk).update(qrcode_email_sent=True)
+        sent += 1
+    return sent, failed
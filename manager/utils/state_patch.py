@@ -0,0 +1,103 @@
+import copy
+
+_MISSING = object()
+
+
+def diff_state(old, new, lists=None):
+    """
+    Compute the operations turning one state dictionary into another.
+
+    Fields whose value changed are set or unset. Lists named in `lists` are
+    compared item by item, identified by a key field, so that a participant
+    joining, leaving or moving costs one operation rather than the whole list:
+
+    - ``{'op': 'set', 'path': field, 'value': value}``
+    - ``{'op': 'unset', 'path': field}``
+    - ``{'op': 'remove', 'path': list, 'key': key}``
+    - ``{'op': 'insert', 'path': list, 'index': index, 'value': item}``
+    - ``{'op': 'move', 'path': list, 'key': key, 'index': index}``
+    - ``{'op': 'update', 'path': list, 'key': key, 'value': changed fields}``
+
+    Operations apply in order, list indexes being those of the list after
+    the previous operations.
+
+    :param old: The previous state.
+    :param new: The current state.
+    :param lists: The key field of each list field compared item by item, keyed by field name.
+    :return: The list of operations, or None if a list has duplicate keys and must be sent whole.
+    """
+    lists = lists or {}
+    ops = []
+    for field, value in new.items():
+        previous = old.get(field, _MISSING)
+        if field in lists and isinstance(value, list) and isinstance(previous, list):
+            list_ops = _diff_list(field, lists[field], previous, value)
+            if list_ops is None:
+                return None
+            ops += list_ops
+        elif previous is _MISSING or previous != value:
+            ops.append({'op': 'set', 'path': field, 'value': value})
+    ops += [{'op': 'unset', 'path': field} for field in old if field not in new]
+    return ops
+
+
+def _diff_list(path, key, old, new):
+    """Compute the operations turning one list of dictionaries into another, or None on duplicate keys."""
+    old_items = {item[key]: item for item in old}
+    new_keys = {item[key] for item in new}
+    if len(old_items) != len(old) or len(new_keys) != len(new):
+        return None
+
+    ops = [{'op': 'remove', 'path': path, 'key': item[key]} for item in old if item[key] not in new_keys]
+    order = [item[key] for item in old if item[key] in new_keys]
+    for index, item in enumerate(new):
+        item_key = item[key]
+        previous = old_items.get(item_key)
+        if previous is None:
+            order.insert(index, item_key)
+            ops.append({'op': 'insert', 'path': path, 'index': index, 'value': item})
+            continue
+        if order[index] != item_key:
+            order.remove(item_key)
+            order.insert(index, item_key)
+            ops.append({'op': 'move', 'path': path, 'key': item_key, 'index': index})
+        if set(previous) - set(item):
+            ops += [{'op': 'remove', 'path': path, 'key': item_key},
+                    {'op': 'insert', 'path': path, 'index': index, 'value': item}]
+            continue
+        changes = {field: value for field, value in item.items() if previous.get(field, _MISSING) != value}
+        if changes:
+            ops.append({'op': 'update', 'path': path, 'key': item_key, 'value': changes})
+    return ops
+
+
+def apply_patch(state, ops, lists=None):
+    """
+    Apply the operations computed by `diff_state` to a state.
+
+    :param state: The state to patch, left unchanged.
+    :param ops: The operations.
+    :param lists: The key field of each list field, as given to `diff_state`.
+    :return: The patched state.
+    """
+    lists = lists or {}
+    state = copy.deepcopy(state)
+    for op in ops:
+        path = op['path']
+        if op['op'] == 'set':
+            state[path] = op['value']
+        elif op['op'] == 'unset':
+            state.pop(path, None)
+        else:
+            items, key = state[path], lists[path]
+            if op['op'] == 'insert':
+                items.insert(op['index'], op['value'])
+                continue
+            index = next(index for index, item in enumerate(items) if item[key] == op['key'])
+            if op['op'] == 'remove':
+                items.pop(index)
+            elif op['op'] == 'move':
+                items.insert(op['index'], items.pop(index))
+            elif op['op'] == 'update':
+                items[index].update(op['value'])
+    return state
@@ -0,0 +1,238 @@
+from abc import ABC, abstractmethod
+from django.conf import settings
+from django.utils import timezone
+
+WAIT = 'wait'
+SERVICE = 'service'
+
+
+class WaitTimeEstimatorFactory:
+    """
+    Factory class for creating and managing wait time estimators.
+
+    :ivar _estimators: A dictionary to store created estimators for reuse.
+    """
+
+    _estimators = {}
+
+    @staticmethod
+    def get_estimator(name):
+        """
+        Retrieves or creates the estimator registered under a name.
+
+        Unknown names fall back to the cumulative estimator, the original behaviour.
+
+        :param name: The estimator name (e.g., 'cumulative', 'ewma').
+        :return: An instance of the estimator.
+        """
+        if name in WaitTimeEstimatorFactory._estimators:
+            return WaitTimeEstimatorFactory._estimators[name]
+
+        if name == 'cumulative':
+            estimator = CumulativeEstimator()
+        elif name == 'hour_of_week':
+            estimator = HourOfWeekEstimator()
+        elif name == 'parallelism':
+            estimator = ResourceParallelismEstimator()
+        elif name == 'ewma':
+            estimator = EWMAEstimator()
+        else:
+            estimator = CumulativeEstimator()
+
+        WaitTimeEstimatorFactory._estimators[name] = estimator
+        return estimator
+
+    @staticmethod
+    def all_estimators():
+        """Return one instance of every estimator, keyed by name."""
+        return {name: WaitTimeEstimatorFactory.get_estimator(name)
+                for name, _ in ESTIMATOR_CHOICES}
+
+
+class WaitTimeEstimator(ABC):
+    """
+    Abstract base class for the models estimating the wait time per turn of a queue.
+
+    Estimators are stateless; their learned state is a small JSON-compatible
+    dictionary stored on the queue under the estimator's name.
+    """
+    name = None
+    uses_servers = False
+
+    @abstractmethod
+    def observe(self, state, kind, minutes, at):
+        """
+        Update the state with an observation.
+
+        :param state: The estimator state, updated in place.
+        :param kind: WAIT for the wait of a participant whose service started,
+                     SERVICE for the duration of a completed service.
+        :param minutes: The observed duration in minutes.
+        :param at: When the observation was made.
+        """
+        pass
+
+    @abstractmethod
+    def estimate(self, state, at, servers=1):
+        """
+        Estimate the wait time per turn.
+
+        :param state: The estimator state.
+        :param at: The time the estimate is for.
+        :param servers: The number of resources serving in parallel.
+        :return: The estimated minutes per turn, or None without observations.
+        """
+        pass
+
+
+class CumulativeEstimator(WaitTimeEstimator):
+    """The lifetime average of the observed waits."""
+    name = 'cumulative'
+
+    def observe(self, state, kind, minutes, at):
+        if kind != WAIT:
+            return
+        count = state.get('n', 0) + 1
+        state['mean'] = state.get('mean', 0) + (minutes - state.get('mean', 0)) / count
+        state['n'] = count
+
+    def estimate(self, state, at, servers=1):
+        return state.get('mean')
+
+
+class EWMAEstimator(WaitTimeEstimator):
+    """An exponentially weighted moving average that follows recent waits."""
+    name = 'ewma'
+
+    @staticmethod
+    def alpha():
+        """Return the weight of the newest observation."""
+        return getattr(settings, 'WAIT_TIME_EWMA_ALPHA', 0.3)
+
+    def observe(self, state, kind, minutes, at):
+        if kind != WAIT:
+            return
+        if 'value' not in state:
+            state['value'] = minutes
+        else:
+            state['value'] += self.alpha() * (minutes - state['value'])
+
+    def estimate(self, state, at, servers=1):
+        return state.get('value')
+
+
+class HourOfWeekEstimator(WaitTimeEstimator):
+    """
+    Moving averages kept separately for each of the 168 local hours of the week.
+
+    Hours with too few observations fall back to an EWMA over all hours, so
+    rush hours are learned without starving quiet ones.
+    """
+    name = 'hour_of_week'
+    MIN_SAMPLES = 3
+
+    @staticmethod
+    def hour_of_week(at):
+        """Return the local hour of the week, 0 being Monday midnight."""
+        local = timezone.localtime(at)
+        return str(local.weekday() * 24 + local.hour)
+
+    def observe(self, state, kind, minutes, at):
+        if kind != WAIT:
+            return
+        EWMAEstimator().observe(state.setdefault('all', {}), kind, minutes, at)
+        hour = self.hour_of_week(at)
+        count, value = state.setdefault('hours', {}).get(hour, (0, minutes))
+        state['hours'][hour] = [count + 1, value + EWMAEstimator.alpha() * (minutes - value)]
+
+    def estimate(self, state, at, servers=1):
+        count, value = state.get('hours', {}).get(self.hour_of_week(at), (0, None))
+        if count >= self.MIN_SAMPLES:
+            return value
+        return state.get('all', {}).get('value')
+
+
+class ResourceParallelismEstimator(WaitTimeEstimator):
+    """
+    A moving average of service durations shared by the resources serving in parallel.
+
+    Each turn takes the average service duration divided by the number of
+    resources. Until a service has been completed, it falls back to the EWMA
+    of the observed waits.
+    """
+    name = 'parallelism'
+    uses_servers = True
+
+    def observe(self, state, kind, minutes, at):
+        EWMAEstimator().observe(state.setdefault(kind, {}), WAIT, minutes, at)
+
+    def estimate(self, state, at, servers=1):
+        service = state.get(SERVICE, {}).get('value')
+        if service is None:
+            return state.get(WAIT, {}).get('value')
+        return service / max(servers, 1)
+
+
+ESTIMATOR_CHOICES = [
+    (CumulativeEstimator.name, 'Cumulative average'),
+    (EWMAEstimator.name, 'Moving average'),
+    (HourOfWeekEstimator.name, 'Hour of week'),
+    (ResourceParallelismEstimator.name, 'Resource parallelism'),
+]
+
+
+def replay_accuracy(participants, servers=1) -> dict:
+    """
+    Replay the history of a queue through every estimator and measure its accuracy.
+
+    Each participant is predicted to wait the per-turn estimate at their join
+    time multiplied by their position, counting the participants who joined
+    earlier and were not yet served. Estimators learn from the waits and
+    service durations in the order they happened, as they would have live.
+
+    :param participants: Served participants of a single queue.
+    :param servers: The number of resources serving in parallel.
+    :return: A dictionary keyed by estimator name of the number of predictions
+             and their mean absolute error, root mean square error and bias in minutes.
+    """
+    events = []
+    served = [p for p in participants if p.service_started_at]
+    for participant in served:
+        events.append((participant.joined_at, 0, participant))
+        events.append((participant.service_started_at, 1, participant))
+        if participant.service_completed_at:
+            events.append((participant.service_completed_at, 2, participant))
+    events.sort(key=lambda event: (event[0], event[1]))
+
+    estimators = WaitTimeEstimatorFactory.all_estimators()
+    states = {name: {} for name in estimators}
+    errors = {name: [] for name in estimators}
+    waiting = set()
+    for at, kind, participant in events:
+        if kind == 0:
+            position = len(waiting) + 1
+            waiting.add(participant.pk)
+            actual = (participant.service_started_at - participant.joined_at).total_seconds() / 60
+            for name, estimator in estimators.items():
+                per_turn = estimator.estimate(states[name], at, servers)
+                if per_turn is not None:
+                    errors[name].append(per_turn * position - actual)
+            continue
+        if kind == 1:
+            waiting.discard(participant.pk)
+            observation = WAIT, int((at - participant.joined_at).total_seconds() / 60)
+        else:
+            observation = SERVICE, int((at - participant.service_started_at).total_seconds() / 60)
+        for name, estimator in estimators.items():
+            estimator.observe(states[name], *observation, at)
+
+    report = {}
+    for name, values in errors.items():
+        count = len(values)
+        report[name] = {
+            'count': count,
+            'mae': sum(abs(value) for value in values) / count if count else None,
+            'rmse': (sum(value ** 2 for value in values) / count) ** 0.5 if count else None,
+            'bias': sum(values) / count if count else None,
+        }
+    return report
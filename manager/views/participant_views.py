@@ -3,9 +3,11 @@ import logging
 import os
 from datetime import timedelta
 from io import BytesIO
+from django.apps import apps
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import transaction
 from django.core.files.base import ContentFile
 from django.http import JsonResponse
 from django.shortcuts import redirect, get_object_or_404
@@ -17,6 +19,7 @@ from gtts.tts import gTTS
 from django.views.decorators.http import require_http_methods
 from manager.models import Queue
 from manager.utils.category_handler import CategoryHandlerFactory
+from manager.utils.concurrency import TransitionConflict
 from manager.utils.aws_s3_storage import upload_to_s3
 from manager.utils.send_email import send_html_email
 from django.conf import settings
@@ -76,8 +79,8 @@ class ManageWaitlist(LoginRequiredMixin, generic.TemplateView):
             participant_set = participant_set.filter(
                 name__icontains=search_query)
 
-        context['waiting_list'] = participant_set.filter(
-            state='waiting').order_by('position')[:5]
+        context['waiting_list'] = Participant.with_positions(
+            participant_set.filter(state='waiting'))[:5]
         context['serving_list'] = participant_set.filter(
             state='serving').order_by('service_started_at')[:5]
         context['completed_list'] = participant_set.filter(
@@ -215,7 +218,7 @@ class WaitingFull(LoginRequiredMixin, generic.TemplateView):
         handler = CategoryHandlerFactory.get_handler(queue.category)
         queue = handler.get_queue_object(queue_id)
         participant_set = handler.get_participant_set(queue_id)
-        waiting_list = participant_set.filter(state='waiting').order_by('position')
+        waiting_list = Participant.with_positions(participant_set.filter(state='waiting'))
         serving_list = participant_set.filter(state='serving').order_by('service_started_at')
         context['queue'] = queue
         context['waiting_list'] = waiting_list
@@ -341,21 +344,41 @@ def delete_participant(request, participant_id):
     if request.user != participant.queue.created_by:
         return JsonResponse({'error': 'Unauthorized.'}, status=403)
 
-    queue = participant.queue
     participant.delete()
     logger.info(f"Participant {participant_id} is deleted.")
-
-    waiting_participants = Participant.objects.filter(queue=queue,
-                                                      state='waiting').order_by(
-        'position')
-    for idx, p in enumerate(waiting_participants):
-        p.position = idx + 1
-        p.save()
     messages.success(request, f"Participant {participant.name} is deleted.")
     return JsonResponse(
         {'message': 'Participant deleted and positions updated.'})
 
 
+@login_required
+@require_http_methods(["POST"])
+def move_participant(request, participant_id):
+    """
+    Move a waiting participant to another position in the waiting list.
+
+    Only the moved participant is written; the positions of the others follow from the new order.
+
+    :param request: The HTTP request object containing the new position.
+    :param participant_id: The ID of the participant to be moved.
+    :return: A JSON response with the participant's new position, or an error message if the move fails.
+    """
+    participant = get_object_or_404(Participant, id=participant_id)
+    if request.user != participant.queue.created_by:
+        return JsonResponse({'error': 'Unauthorized.'}, status=403)
+    if participant.state != 'waiting':
+        return JsonResponse({
+            'error': f'{participant.name} cannot be moved because they are currently in state: {participant.state}.'
+        }, status=400)
+    try:
+        data = json.loads(request.body) if request.body else {}
+        position = participant.move_to(int(data['position']))
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+        return JsonResponse({'error': 'A positive position is required.'}, status=400)
+    logger.info(f"Participant {participant_id} moved to position {position}.")
+    return JsonResponse({'position': position, 'success': True})
+
+
 @login_required
 @require_http_methods(["POST"])
 def serve_participant(request, participant_id):
@@ -386,12 +409,12 @@ def serve_participant(request, participant_id):
                 'error': f'{participant.name} cannot be served because they are currently in state: {participant.state}.'
             }, status=400)
 
-        handler.assign_to_resource(participant, resource_id=resource_id)
-        participant.queue.update_estimated_wait_time_per_turn(
-            participant.get_wait_time())
-        participant.start_service()
-        participant.queue.update_participants_positions()
-        participant.save()
+        # A conflict on the participant rolls the resource claim back
+        with transaction.atomic():
+            handler.assign_to_resource(participant, resource_id=resource_id)
+            participant.start_service()
+            wait = participant.get_wait_time()
+            transaction.on_commit(lambda: participant.queue.update_estimated_wait_time_per_turn(wait))
         logger.info(
             f"Participant {participant_id} started service in queue {participant.queue.id}.")
 
@@ -407,6 +430,10 @@ def serve_participant(request, participant_id):
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON data.'}, status=400)
 
+    except TransitionConflict as e:
+        logger.warning(f"Conflict serving participant {participant_id}: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=409)
+
     except Exception as e:
         logger.error(f"Error serving participant {participant_id}: {str(e)}")
         return JsonResponse({
@@ -438,11 +465,10 @@ def serve_participant_no_resource(request, participant_id):
                 'error': f'{participant.name} cannot be served because they are currently in state: {participant.state}.'
             }, status=400)
 
-        participant.queue.update_estimated_wait_time_per_turn(
-            participant.get_wait_time())
-        participant.start_service()
-        participant.queue.update_participants_positions()
-        participant.save()
+        with transaction.atomic():
+            participant.start_service()
+            wait = participant.get_wait_time()
+            transaction.on_commit(lambda: participant.queue.update_estimated_wait_time_per_turn(wait))
         logger.info(
             f"Participant {participant_id} started service in queue {participant.queue.id}.")
 
@@ -458,6 +484,10 @@ def serve_participant_no_resource(request, participant_id):
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON data.'}, status=400)
 
+    except TransitionConflict as e:
+        logger.warning(f"Conflict serving participant {participant_id}: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=409)
+
     except Exception as e:
         logger.error(f"Error serving participant {participant_id}: {str(e)}")
         return JsonResponse({
@@ -465,6 +495,46 @@ def serve_participant_no_resource(request, participant_id):
         }, status=500)
 
 
+@login_required
+@require_http_methods(["POST"])
+def call_next_participant(request, queue_id):
+    """
+    Call the best eligible waiting participant to a resource and start their service.
+
+    Expects a JSON body with the ``resource_id`` calling. Staff at several resources
+    pressing "next" at the same time are each handed a different participant.
+
+    :param request: The HTTP request object containing the resource ID.
+    :param queue_id: The ID of the queue.
+    :return: A JSON response with the called participant, or an error message if no one could be called.
+    """
+    queue = get_object_or_404(Queue, id=queue_id)
+    if request.user != queue.created_by:
+        return JsonResponse({'error': 'Unauthorized.'}, status=403)
+    handler = CategoryHandlerFactory.get_handler(queue.category)
+    if not handler.resource_model:
+        return JsonResponse({'error': 'This queue has no resources to call participants to.'}, status=400)
+    try:
+        data = json.loads(request.body) if request.body else {}
+        resource_model = apps.get_model('manager', handler.resource_model)
+        resource = get_object_or_404(resource_model, id=int(data['resource_id']), queue=queue)
+        participant = handler.call_next(handler.get_queue_object(queue_id), resource)
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return JsonResponse({'error': 'A resource ID is required.'}, status=400)
+    except TransitionConflict as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if participant is None:
+        return JsonResponse({'error': 'No eligible participant is waiting.'}, status=404)
+    logger.info(f"Participant {participant.id} called to {resource.name} in queue {queue_id}.")
+    return JsonResponse({
+        'participant': {'id': participant.id, 'name': participant.name, 'number': participant.number},
+        'resource': resource.name,
+        'success': True,
+    })
+
+
 @login_required
 def mark_no_show(request, participant_id):
     """
@@ -488,8 +558,11 @@ def mark_no_show(request, participant_id):
     participant.waited = (timezone.localtime(
         timezone.now()) - participant.joined_at).total_seconds() / 60
 
-    participant.queue.update_participants_positions()
-    participant.save()
+    try:
+        participant.save()
+    except TransitionConflict as e:
+        messages.error(request, str(e))
+        return redirect('manager:manage_waitlist', participant.queue.id)
     logger.info(f"{participant.name} has been marked as No Show by {request.user}.")
     messages.success(request,
                      f"{participant.name} has been marked as No Show.")
@@ -529,8 +602,10 @@ def complete_participant(request, participant_id):
                 'error': f'{participant.name} cannot be marked as completed because they are currently in state: {participant.state}.'
             }, status=400)
 
-        handler.complete_service(participant)
-        participant.save()
+        # A conflict on the participant leaves their resource assigned
+        with transaction.atomic():
+            handler.complete_service(participant)
+            participant.save()
         logger.info(
             f"Participant {participant_id} completed service in queue {queue.id}.")
 
@@ -542,12 +617,48 @@ def complete_participant(request, participant_id):
             'completed_list': list(completed_list)
         })
 
+    except TransitionConflict as e:
+        logger.warning(f"Conflict completing participant {participant_id}: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=409)
+
     except Exception as e:
         return JsonResponse({
             'error': f'Error: {str(e)}'
         }, status=500)
 
 
+@login_required
+@require_http_methods(["POST"])
+def apply_participant_transitions(request, queue_id):
+    """
+    Serve, complete, mark as no-show or cancel many participants of a queue at once.
+
+    Expects a JSON body of the form ``{"transitions": [{"participant_id": 1, "action": "complete"}, ...]}``
+    and applies every transition in one transaction. Participants not in a state the action
+    applies to are skipped.
+
+    :param request: The HTTP request object containing the transitions.
+    :param queue_id: The ID of the queue.
+    :return: A JSON response with the IDs of the participants changed by each action and of those skipped.
+    """
+    queue = get_object_or_404(Queue, id=queue_id)
+    if request.user != queue.created_by:
+        return JsonResponse({'error': 'Unauthorized.'}, status=403)
+    try:
+        data = json.loads(request.body) if request.body else {}
+        transitions = [(int(item['participant_id']), item['action']) for item in data['transitions']]
+        handler = CategoryHandlerFactory.get_handler(queue.category)
+        result = handler.apply_transitions(queue, transitions)
+    except TransitionConflict as e:
+        logger.warning(f"Conflict applying transitions in queue {queue_id}: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=409)
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        return JsonResponse({'error': f'Invalid transitions: {e}'}, status=400)
+    logger.info(f"Applied {sum(len(ids) for ids in result['applied'].values())} transition(s) "
+                f"in queue {queue_id} by {request.user}.")
+    return JsonResponse({**result, 'success': True})
+
+
 @require_http_methods(["POST"])
 @login_required
 def notify_participant(request, participant_id):
@@ -41,6 +41,8 @@ class BaseViewAll(LoginRequiredMixin, generic.TemplateView):
         queue = handler.get_queue_object(queue_id)
         participant_set = handler.get_participant_set(queue_id)
         filtered_list = participant_set.filter(state=self.state)
+        if self.state == 'waiting':
+            filtered_list = Participant.with_positions(filtered_list)
 
         context['queue'] = queue
         context[f'{self.state}_list'] = filtered_list
@@ -213,12 +215,11 @@ class QueueDisplay(generic.TemplateView):
 
         next_in_line = Participant.objects.filter(queue_id=queue_id, state='waiting').exclude(
             is_notified=True).order_by(
-            'position').first()
+            *Participant.WAITING_ORDER).first()
         next_in_line_number = next_in_line.number if next_in_line else "-"
-        participants = (
+        participants = Participant.with_positions(
             Participant.objects.filter(queue_id=queue_id, state='waiting')
             .exclude(pk=calling.pk if calling else None)
-            .order_by('joined_at')
         )
 
 
@@ -4,6 +4,7 @@ from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from manager.models import Queue
 from manager.utils.category_handler import CategoryHandlerFactory
+from manager.utils.helpers import format_duration
 from django.utils.timezone import timedelta
 
 
@@ -55,62 +56,56 @@ class StatisticsView(LoginRequiredMixin, generic.TemplateView):
         else:
             start_date = None
 
+        # Past days of the longer windows are read from the daily rollups.
+        use_rollups = date_filter != 'today'
+        statistics = queue.get_statistics(start_date, end_date,
+                                          use_rollups=use_rollups)
         context['queue'] = queue
         context['participant_set'] = participant_set
-        context['waitlisted'] = queue.get_number_of_participants_by_date(
-            start_date, end_date)
-        context['currently_waiting'] = queue.get_number_waiting_now(start_date,
-                                                                    end_date)
-        context['currently_serving'] = queue.get_number_serving_now(start_date,
-                                                                    end_date)
-        context['served'] = queue.get_number_served(start_date, end_date)
-        context['served_percentage'] = queue.get_served_percentage(start_date,
-                                                                   end_date)
-        context['average_wait_time'] = queue.get_average_waiting_time(
-            start_date, end_date)
-        context['max_wait_time'] = queue.get_max_waiting_time(start_date,
-                                                              end_date)
-        context[
-            'average_service_duration'] = queue.get_average_service_duration(
-            start_date, end_date)
-        context['max_service_duration'] = queue.get_max_service_duration(
-            start_date, end_date)
-        context['peak_line_length'] = queue.get_peak_line_length(start_date,
-                                                                 end_date)
-        context['avg_line_length'] = queue.get_avg_line_length(start_date,
-                                                               end_date)
-        context['dropoff_percentage'] = queue.get_dropoff_percentage(
-            start_date, end_date)
-        context['unhandled_percentage'] = queue.get_unhandled_percentage(
-            start_date, end_date)
-        context['cancelled_percentage'] = queue.get_cancelled_percentage(
-            start_date, end_date)
-        context['no_show_percentage'] = queue.get_no_show_percentage(
-            start_date, end_date)
-        context['guest_percentage'] = queue.get_guest_percentage(start_date,
-                                                                 end_date)
-        context['staff_percentage'] = queue.get_staff_percentage(start_date,
-                                                                 end_date)
+        context['all_time_statistics'] = queue.get_statistics(
+            end_date=end_date, use_rollups=True)
+        context['waitlisted'] = statistics.total
+        context['currently_waiting'] = statistics.waiting
+        context['currently_serving'] = statistics.serving
+        context['served'] = statistics.served
+        context['served_percentage'] = statistics.served_percentage
+        context['average_wait_time'] = format_duration(
+            statistics.average_waiting_time)
+        context['max_wait_time'] = format_duration(statistics.max_waiting_time)
+        context['average_service_duration'] = format_duration(
+            statistics.average_service_duration)
+        context['max_service_duration'] = format_duration(
+            statistics.max_service_duration)
+        context['wait_percentiles'] = {
+            name: format_duration(minutes)
+            for name, minutes in statistics.wait_percentiles.items()
+        }
+        context['service_percentiles'] = {
+            name: format_duration(minutes)
+            for name, minutes in statistics.service_percentiles.items()
+        }
+        context['peak_line_length'] = statistics.peak_line_length
+        context['avg_line_length'] = statistics.time_weighted_line_length
+        context['dropoff_percentage'] = statistics.dropoff_percentage
+        context['unhandled_percentage'] = statistics.unhandled_percentage
+        context['cancelled_percentage'] = statistics.cancelled_percentage
+        context['no_show_percentage'] = statistics.no_show_percentage
+        context['guest_percentage'] = statistics.guest_percentage
+        context['staff_percentage'] = statistics.staff_percentage
         context['date_filter'] = date_filter
         context['date_filter_text'] = date_filter_text
         context['resource_totals'] = [
             {
-                'resource': resource,
-                'name': resource.name,
-                'total': resource.total(start_date=start_date,
-                                        end_date=end_date),
-                'served': resource.served(start_date=start_date,
-                                          end_date=end_date),
-                'dropoff': resource.dropoff(start_date=start_date,
-                                            end_date=end_date),
-                'completed': resource.completed(start_date=start_date,
-                                                end_date=end_date),
-                'avg_wait_time': resource.avg_wait_time(start_date=start_date,
-                                                        end_date=end_date),
-                'avg_serve_time': resource.avg_serve_time(
-                    start_date=start_date, end_date=end_date),
+                'resource': metrics['resource'],
+                'name': metrics['resource'].name,
+                'total': metrics['total'],
+                'served': metrics['served'],
+                'dropoff': metrics['dropoff'],
+                'completed': metrics['completed'],
+                'avg_wait_time': format_duration(metrics['avg_wait']),
+                'avg_serve_time': format_duration(metrics['avg_serve']),
             }
-            for resource in queue.resource_set.all()
+            for metrics in statistics.resource_metrics()
         ]
 
         return context
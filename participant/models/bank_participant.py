@@ -23,4 +23,8 @@ class BankParticipant(Participant):
         choices=SERVICE_TYPE_CHOICES,
         default='account_services',
     )
-    participant_category = models.CharField(max_length=20, choices=PARTICIPANT_CATEGORY_CHOICES, default='individual')
\ No newline at end of file
+    participant_category = models.CharField(max_length=20, choices=PARTICIPANT_CATEGORY_CHOICES, default='individual')
+
+    def get_ticket_service_type(self):
+        """Return the service type selecting the ticket prefix."""
+        return self.service_type
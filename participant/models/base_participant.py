@@ -1,11 +1,22 @@
-from django.db import models
-from manager.utils.code_generator import generate_unique_code, \
-    generate_unique_number
+from collections import Counter
+from django.db import connections, models, router, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import IsNull
+from manager.utils.code_generator import generate_many, generate_unique_code
+from manager.utils.concurrency import TransitionConflict
+from manager.utils.live_updates import publish_queue_change
 from django.utils import timezone
-from manager.models import Resource
+from manager.models import (Queue, Resource, QueueDailyStats, QueueDurationSketch, QueueSequence,
+                            QueueTicketSequence)
+from manager.utils.wait_time_estimators import SERVICE, WAIT
 from datetime import timedelta
 from django.conf import settings
 
+# Fields read by QueueDailyStats.snapshot() and Queue.live_counter_key().
+_STATS_FIELDS = {'queue_id', 'joined_at', 'state', 'created_by',
+                  'service_started_at', 'service_completed_at'}
+
 
 class Participant(models.Model):
     """Represents a participant in a queue."""
@@ -25,7 +36,9 @@ class Participant(models.Model):
     phone = models.CharField(max_length=20, null=True, blank=True)
     queue = models.ForeignKey('manager.Queue', on_delete=models.CASCADE)
     joined_at = models.DateTimeField(auto_now_add=True)
-    position = models.PositiveIntegerField(null=True, blank=True)
+    # Sparse ordering key of the waiting list; positions are ranks over it. Participants
+    # waiting from before keys were handed out have none until `rebalance_sort_keys`.
+    sort_key = models.FloatField(null=True, blank=True, editable=False)
     note = models.TextField(max_length=150, null=True, blank=True)
     code = models.CharField(max_length=12, unique=True, editable=False)
     state = models.CharField(max_length=10, choices=PARTICIPANT_STATE,
@@ -37,34 +50,470 @@ class Participant(models.Model):
     resource = models.ForeignKey(Resource, on_delete=models.CASCADE,
                                  blank=True, null=True)
     resource_assigned = models.CharField(max_length=20, null=True, blank=True)
+    resource_served = models.ForeignKey(Resource, on_delete=models.SET_NULL,
+                                        blank=True, null=True,
+                                        related_name='served_participants')
     is_notified = models.BooleanField(default=False)
     created_by = models.CharField(max_length=10, choices=CREATE_BY,
                                   default='guest')
     updated_at = models.DateTimeField(blank=True, null=True)
     status_qr_code = models.ImageField(upload_to='qrcodes/', null=True,
                                        blank=True)
-    number = models.CharField(max_length=4, editable=False)
+    number = models.CharField(max_length=10, editable=False)
+    # Numbering period of the ticket number, empty if the queue never resets numbers.
+    ticket_period = models.CharField(max_length=20, blank=True, editable=False)
     announcement_audio = models.TextField(null=True)
     qrcode_url = models.CharField(max_length=500, blank=True, null=True)
     qrcode_email_sent = models.BooleanField(default=False)
 
     class Meta:
-        unique_together = ('number', 'queue')
+        # Older versions could repeat numbers: run `dedupe_ticket_numbers` before migrating their data.
+        unique_together = ('queue', 'ticket_period', 'number')
+        indexes = [
+            models.Index(fields=['queue', 'joined_at']),
+            models.Index(fields=['queue', 'state', 'sort_key']),
+        ]
+
+    # Gap left between ordering keys, as handed out by the queue's sequence.
+    SORT_KEY_GAP = QueueSequence.SORT_KEY_GAP
+    # Order of the waiting list, participants without a key first as they joined before keys existed.
+    WAITING_ORDER = (F('sort_key').asc(nulls_first=True), 'pk')
+    # Batch transitions: the states each action applies to and the state it leads to.
+    TRANSITIONS = {
+        'serve': (('waiting',), 'serving'),
+        'complete': (('serving',), 'completed'),
+        'no_show': (('waiting',), 'no_show'),
+        'cancel': (('waiting',), 'cancelled'),
+    }
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded state so saves are conditional on it and can update the daily rollups and live counters."""
+        instance = super().from_db(db, field_names, values)
+        if 'state' in field_names:
+            instance._loaded_state = instance.state
+        if _STATS_FIELDS.issubset(field_names):
+            instance._stats_snapshot = QueueDailyStats.snapshot(instance)
+            instance._counter_key = Queue.live_counter_key(instance)
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        """Reload the participant and remember the reloaded state, as `from_db` does."""
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'state' in fields:
+            self._loaded_state = self.state
+        if fields is None or _STATS_FIELDS.issubset(fields):
+            self._stats_snapshot = QueueDailyStats.snapshot(self)
+            self._counter_key = Queue.live_counter_key(self)
 
     def save(self, *args, **kwargs):
-        """Assign unique code and number upon creation."""
-        if not self.pk:  # Only set these fields for new instances
+        """
+        Assign unique code and number upon creation and keep the daily rollups and live counters in step.
+
+        Saving a participant read from the database only succeeds if its state
+        has not changed since, so concurrent transitions cannot both apply. Once
+        the save commits, the live views of the queue are told it changed.
+
+        :raises TransitionConflict: If another transition changed the participant's state first.
+        """
+        adding = not self.pk
+        if adding:  # Only set these fields for new instances
             self.code = generate_unique_code(Participant)
-            self.number = generate_unique_number(self.queue)
-        if not self.position:  # Only set position if it's not already set
-            last_position = \
-            Participant.objects.aggregate(models.Max('position'))[
-                'position__max'] or 0
-            self.position = last_position + 1
+            self.ticket_period, self.number = QueueTicketSequence.allocate(
+                self.queue, self.get_ticket_service_type())
+            self.sort_key = QueueSequence.next_sort_key(self.queue_id)
+        elif self.sort_key is None and self.state == 'waiting':  # Key the queue, keeping this place
+            Participant.rebalance_sort_keys(self.queue_id)
+            self.sort_key = Participant.objects.filter(pk=self.pk).values_list('sort_key', flat=True).get()
+        if self.resource_id:  # Keep the resource after it is freed, for statistics
+            self.resource_served_id = self.resource_id
         self.updated_at = timezone.localtime()
-        super().save(*args, **kwargs)
+        previous_key = getattr(self, '_counter_key', None)
+        self._expected_state = None if adding else getattr(self, '_loaded_state', None)
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            self._expected_state = None
+        self._loaded_state = self.state
+        previous = getattr(self, '_stats_snapshot', None)
+        if adding or previous is not None:
+            current = QueueDailyStats.snapshot(self)
+            QueueDailyStats.record_change(previous, current)
+            self._stats_snapshot = current
+        if adding or previous_key is not None:
+            current_key = Queue.live_counter_key(self)
+            Queue.update_live_counters(previous_key, current_key)
+            self._counter_key = current_key
+        publish_queue_change(self.queue_id)
+        requested_position = getattr(self, '_requested_position', None)
+        if requested_position:
+            self._requested_position = None
+            self.move_to(requested_position)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        """Make writing the state of the base row conditional on the state it was read in."""
+        expected_state = getattr(self, '_expected_state', None)
+        writes_state = any(field.name == 'state' for field, _, _ in values)
+        if expected_state is None or not writes_state or base_qs.model is not Participant:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        if super()._do_update(base_qs.filter(state=expected_state), using, pk_val, values,
+                              update_fields, forced_update):
+            return True
+        if base_qs.filter(pk=pk_val).exists():
+            raise TransitionConflict(
+                f"{self.name} is no longer {expected_state}; someone else has just updated them.")
+        return False
+
+    def delete(self, *args, **kwargs):
+        """Delete the participant and remove it from its queue's daily rollup and live counters."""
+        key = getattr(self, '_counter_key', None) or Queue.live_counter_key(self)
+        snapshot = getattr(self, '_stats_snapshot', None) or QueueDailyStats.snapshot(self)
+        result = super().delete(*args, **kwargs)
+        QueueDailyStats.record_change(snapshot, None)
+        Queue.update_live_counters(key, None)
+        publish_queue_change(self.queue_id)
+        return result
+
+    @classmethod
+    def bulk_import(cls, participants, batch_size=500) -> list:
+        """
+        Insert many new participants of one queue with a handful of statements.
+
+        Codes, ticket numbers and ordering keys are reserved for the whole import
+        up front, the base table and the category table are each filled with
+        multi-row inserts, and the daily rollups and live counters are updated
+        once per distinct change. No QR code is generated and no email is sent;
+        the `send_pending_qr_emails` command takes care of those later.
+
+        :param participants: Unsaved participants of one queue and one model, in joining order.
+        :param batch_size: The maximum number of rows per insert (default is 500).
+        :return: The saved participants.
+        :raises ValueError: If the participants are not all new, of one model and in one queue.
+        """
+        if not participants:
+            return []
+        model, queue = type(participants[0]), participants[0].queue
+        if any(type(participant) is not model or participant.queue_id != queue.pk
+               or not participant._state.adding for participant in participants):
+            raise ValueError("Participants must be new and share one model and queue.")
+
+        now = timezone.localtime()
+        with transaction.atomic():
+            codes = generate_many(Participant, len(participants))
+            period, numbers = QueueTicketSequence.allocate_many(
+                queue, [participant.get_ticket_service_type() for participant in participants], now)
+            sort_keys = QueueSequence.reserve(queue.pk, len(participants))
+            for participant, code, number, sort_key in zip(participants, codes, numbers, sort_keys):
+                participant.code, participant.number, participant.sort_key = code, number, sort_key
+                participant.ticket_period = period
+                participant.updated_at = now
+            cls._bulk_insert(model, participants, batch_size)
+
+            changes = Counter()
+            for participant in participants:
+                participant._stats_snapshot = QueueDailyStats.snapshot(participant)
+                participant._counter_key = Queue.live_counter_key(participant)
+                changes[tuple(participant._stats_snapshot.items()), participant._counter_key] += 1
+            QueueDailyStats.record_changes((None, dict(snapshot), count)
+                                           for (snapshot, _), count in changes.items())
+            for (_, counter_key), count in changes.items():
+                Queue.update_live_counters(None, counter_key, count)
+            publish_queue_change(queue.pk)
+        return participants
+
+    @staticmethod
+    def _bulk_insert(model, participants, batch_size):
+        """
+        Insert participants into the base table and, for a category model, into its own table.
+
+        `bulk_create` refuses multi-table inherited models, so the rows are
+        inserted table by table, the base rows returning the primary keys.
+        """
+        using = router.db_for_write(model)
+        base_fields = [field for field in Participant._meta.local_concrete_fields if not field.primary_key]
+        batch_size = min(batch_size, connections[using].ops.bulk_batch_size(base_fields, participants))
+        for start in range(0, len(participants), batch_size):
+            batch = participants[start:start + batch_size]
+            rows = Participant._base_manager._insert(
+                batch, fields=base_fields, returning_fields=[Participant._meta.pk], using=using)
+            for participant, (pk,) in zip(batch, rows):
+                participant.id = pk
+                setattr(participant, model._meta.pk.attname, pk)
+                participant._state.adding, participant._state.db = False, using
+            if model is not Participant:
+                model._base_manager._insert(batch, fields=model._meta.local_concrete_fields, using=using)
+
+    @classmethod
+    def apply_transitions(cls, queue, transitions) -> dict:
+        """
+        Serve, complete, mark as no-show or cancel many participants of a queue in one transaction.
+
+        The participants are locked and read with one query and written with one
+        bulk update per source state, their resources are freed with one update,
+        and the daily rollups, live counters, duration sketches and wait time
+        estimators are each updated once for the whole batch. Participants who
+        are not in the queue or not in a state the action applies to are skipped.
+
+        Each bulk update only writes rows still in the state they were read in,
+        as single saves do, so a concurrent transition the row lock did not
+        prevent, such as on SQLite, rolls the whole batch back.
+
+        :param queue: The queue of the participants.
+        :param transitions: (participant ID, action) pairs, each action being a key of `TRANSITIONS`.
+        :return: A dictionary with the IDs of the participants changed by each action
+                 under 'applied', and the IDs of the skipped participants under 'skipped'.
+        :raises ValueError: If an action is unknown or a participant is given more than one action.
+        :raises TransitionConflict: If another transition changed one of the participants first.
+        """
+        transitions = list(transitions)
+        actions = dict(transitions)
+        if len(actions) != len(transitions):
+            duplicates = [pk for pk, count in Counter(pk for pk, _ in transitions).items() if count > 1]
+            raise ValueError(f"Participant(s) given more than one action: {', '.join(map(str, duplicates))}.")
+        unknown = set(actions.values()) - set(cls.TRANSITIONS)
+        if unknown:
+            raise ValueError(f"Unknown action(s): {', '.join(sorted(unknown))}.")
+
+        now = timezone.localtime()
+        applied = {action: [] for action in cls.TRANSITIONS}
+        changed, completed, freed, observations, stats_changes = [], [], [], [], []
+        counter_changes = Counter()
+        changed_by_source = {}
+        with transaction.atomic():
+            participants = Participant.objects.select_for_update(of=('self',)).select_related(
+                'resource').filter(queue_id=queue.pk, pk__in=actions).order_by('pk')
+            for participant in participants:
+                action = actions[participant.pk]
+                sources, target = cls.TRANSITIONS[action]
+                if participant.state not in sources:
+                    continue
+                if action == 'serve':
+                    participant.service_started_at = now
+                    participant.waited = int((now - participant.joined_at).total_seconds() / 60)
+                    observations.append((WAIT, participant.waited))
+                elif action == 'complete':
+                    if participant.service_started_at:
+                        participant.waited = int(
+                            (participant.service_started_at - participant.joined_at).total_seconds() / 60)
+                        observations.append(
+                            (SERVICE, int((now - participant.service_started_at).total_seconds() / 60)))
+                    participant.service_completed_at = now
+                    completed.append(participant)
+                elif action == 'no_show':
+                    participant.waited = int((now - participant.joined_at).total_seconds() / 60)
+                    participant.is_notified = False
+                if action != 'serve' and participant.resource_id:
+                    freed.append(participant.resource_id)
+                    participant.resource_assigned = participant.resource.name
+                    participant.resource = None
+                participant.state = target
+                participant.updated_at = now
+
+                previous_snapshot, previous_key = participant._stats_snapshot, participant._counter_key
+                participant._stats_snapshot = QueueDailyStats.snapshot(participant)
+                participant._counter_key = Queue.live_counter_key(participant)
+                stats_changes.append((previous_snapshot, participant._stats_snapshot, 1))
+                counter_changes[previous_key, participant._counter_key] += 1
+                applied[action].append(participant.pk)
+                changed.append(participant)
+                changed_by_source.setdefault(participant._loaded_state, []).append(participant)
+                participant._loaded_state = target
+
+            for source, participants in changed_by_source.items():
+                written = Participant.objects.filter(state=source).bulk_update(participants, [
+                    'state', 'service_started_at', 'service_completed_at', 'waited', 'is_notified',
+                    'resource', 'resource_assigned', 'updated_at'], batch_size=500)
+                if written != len(participants):
+                    raise TransitionConflict(
+                        "Some participants were changed by someone else while applying the transitions.")
+            finished = [participant.pk for participant in changed if participant.state != 'serving']
+            Resource.objects.filter(Q(pk__in=freed) | Q(assigned_to__in=finished)).update(
+                status='available', assigned_to=None)
+            QueueDailyStats.record_changes(stats_changes)
+            for (previous, current), count in counter_changes.items():
+                Queue.update_live_counters(previous, current, count)
+            QueueDurationSketch.record_many(completed)
+            queue.observe_durations(observations, now)
+            if changed:
+                publish_queue_change(queue.pk)
+
+        done = {pk for pks in applied.values() for pk in pks}
+        return {'applied': applied, 'skipped': [pk for pk in actions if pk not in done]}
+
+    def get_ticket_service_type(self):
+        """
+        Return the service type selecting the ticket prefix under a per-service-type numbering scheme.
 
+        :return: The service type, or None if the participant has none.
+        """
+        return None
+
+    @property
+    def position(self):
+        """
+        The participant's position in the waiting list, None unless waiting.
+
+        Read from the `waiting_rank` annotation of `with_positions` when present,
+        otherwise counted with one indexed query.
+        """
+        if self.state != 'waiting':
+            return None
+        rank = self.__dict__.get('waiting_rank')
+        if rank is not None:
+            return rank
+        return Participant.objects.filter(self._ahead_of(self.queue_id, self.sort_key, self.pk)).count() + 1
+
+    @position.setter
+    def position(self, new_position):
+        """Request a position, applied with `move_to` when the participant is next saved."""
+        self._requested_position = new_position
+        self.__dict__.pop('waiting_rank', None)
+
+    @staticmethod
+    def _ahead_of(queue_id, sort_key, pk):
+        """
+        Filter the waiting participants ordered before a given ordering key.
 
+        Participants without a key come first, in joining order, as in `WAITING_ORDER`.
+
+        :param sort_key: The ordering key, None, or a reference to the possibly NULL key of an outer query.
+        :return: A Q object matching the participants ahead.
+        """
+        if sort_key is None:
+            return Q(queue_id=queue_id, state='waiting', sort_key__isnull=True, pk__lt=pk)
+        unkeyed_ahead = Q(sort_key__isnull=True)
+        if isinstance(sort_key, OuterRef):
+            unkeyed_ahead &= Q(pk__lt=pk) | Q(IsNull(sort_key, False))
+        return Q(queue_id=queue_id, state='waiting') & (
+            unkeyed_ahead | Q(sort_key__lt=sort_key) | Q(sort_key=sort_key, pk__lt=pk))
+
+    @classmethod
+    def with_positions(cls, queryset):
+        """
+        Annotate a queryset of participants with their waiting list positions.
+
+        Each row counts the participants ahead of it with a correlated subquery
+        on the (queue, state, sort_key) index, so positions stay correct when
+        the queryset is filtered or sliced.
+
+        :param queryset: A queryset of participants.
+        :return: The queryset annotated with `waiting_rank`, in waiting list order.
+        """
+        ahead = Participant.objects.filter(
+            cls._ahead_of(OuterRef('queue_id'), OuterRef('sort_key'), OuterRef('pk'))
+        ).order_by().values('queue_id').annotate(count=Count('pk')).values('count')
+        return queryset.annotate(
+            waiting_rank=Coalesce(Subquery(ahead), 0) + 1
+        ).order_by(*cls.WAITING_ORDER)
+
+    def move_to(self, new_position: int) -> int | None:
+        """
+        Move a waiting participant to a position in the waiting list.
+
+        Only this participant's ordering key is written, halfway between its new
+        neighbours. The queue's keys are rebalanced in the rare case the gap
+        between the neighbours is exhausted.
+
+        :param new_position: The position to move to, clamped to the end of the list.
+        :return: The position moved to, or None if the participant is not waiting.
+        :raises ValueError: If the new position is less than 1.
+        """
+        if new_position < 1:
+            raise ValueError("Position must be positive.")
+        if self.state != 'waiting':
+            return None
+        others = Participant.objects.filter(queue_id=self.queue_id, state='waiting').exclude(
+            pk=self.pk).order_by(*self.WAITING_ORDER).values_list('sort_key', flat=True)
+        index = new_position - 1
+        with transaction.atomic():
+            if self.sort_key is None or others.filter(sort_key__isnull=True).exists():
+                self.rebalance_sort_keys(self.queue_id)
+                self.refresh_from_db(fields=['sort_key'])
+            if index == 0:
+                before, after = None, others.first()
+            else:
+                keys = list(others[index - 1:index + 1])
+                if not keys:
+                    keys, new_position = [others.last()], others.count() + 1
+                before, after = keys[0], keys[1] if len(keys) == 2 else None
+            if before is None and after is None:
+                return 1
+            if before is None:
+                sort_key = after - self.SORT_KEY_GAP
+            elif after is None:
+                sort_key = QueueSequence.next_sort_key(self.queue_id)
+            else:
+                sort_key = (before + after) / 2
+                if not before < sort_key < after:
+                    self.rebalance_sort_keys(self.queue_id)
+                    self.refresh_from_db(fields=['sort_key'])
+                    return self.move_to(new_position)
+            Participant.objects.filter(pk=self.pk).update(sort_key=sort_key)
+            self.sort_key = sort_key
+            publish_queue_change(self.queue_id)
+            self.__dict__.pop('waiting_rank', None)
+            return new_position
+
+    @staticmethod
+    def claim_next(candidates):
+        """
+        Lock and return the first waiting participant of an ordered queryset that no one else is claiming.
+
+        Where the database supports it the row is selected with FOR UPDATE SKIP
+        LOCKED, so concurrent callers each get a different participant without
+        waiting on one another. Elsewhere, such as on SQLite which serializes
+        writes, the first candidate is returned and a concurrent claim is caught
+        by the conditional save instead. Must be called inside a transaction.
+
+        :param candidates: A queryset of participants, best first.
+        :return: The claimed participant, or None if no candidate is waiting.
+        """
+        candidates = candidates.filter(state='waiting')
+        if connections[candidates.db].features.has_select_for_update_skip_locked:
+            of = ('self',) if candidates.model is Participant else ('self', candidates.model._meta.pk.name)
+            candidates = candidates.select_for_update(skip_locked=True, of=of)
+        return candidates.first()
+
+    @staticmethod
+    def rebalance_sort_keys(queue_id, legacy_positions=None) -> int:
+        """
+        Spread the ordering keys of a queue's waiting list evenly, keeping its order.
+
+        Participants without a key, waiting from before keys were handed out, are
+        keyed ahead of everyone who joined since: by their old position where
+        known, then by joining time. The queue's sequence is advanced past the
+        new keys so later joins stay behind them.
+
+        :param queue_id: The ID of the queue to rebalance.
+        :param legacy_positions: The old positions of participants without a key, keyed by participant ID.
+        :return: The number of participants whose key changed.
+        """
+        legacy_positions = legacy_positions or {}
+        waiting = list(Participant.objects.filter(queue_id=queue_id, state='waiting').order_by(
+            *Participant.WAITING_ORDER).values_list('pk', 'sort_key', 'joined_at'))
+        unkeyed = sorted((row for row in waiting if row[1] is None), key=lambda row: (
+            legacy_positions.get(row[0]) is None, legacy_positions.get(row[0], 0), row[2], row[0]))
+        ordered = unkeyed + [row for row in waiting if row[1] is not None]
+        changed = [Participant(pk=pk, sort_key=index * Participant.SORT_KEY_GAP)
+                   for index, (pk, sort_key, _) in enumerate(ordered, start=1)
+                   if sort_key != index * Participant.SORT_KEY_GAP]
+        with transaction.atomic():
+            Participant.objects.bulk_update(changed, ['sort_key'], batch_size=500)
+            if unkeyed:
+                QueueSequence.seed(queue_id)
+        return len(changed)
+
+    @staticmethod
+    def backfill_sort_keys(legacy_positions=None) -> int:
+        """
+        Key the waiting participants of every queue that still have no ordering key.
+
+        :param legacy_positions: The old positions of participants without a key, keyed by participant ID.
+        :return: The number of participants whose key changed.
+        """
+        queue_ids = Participant.objects.filter(state='waiting', sort_key__isnull=True).order_by().values_list(
+            'queue_id', flat=True).distinct()
+        return sum(Participant.rebalance_sort_keys(queue_id, legacy_positions) for queue_id in list(queue_ids))
 
     def update_position(self, new_position: int) -> None:
         """
@@ -75,22 +524,29 @@ class Participant(models.Model):
         """
         if new_position < 1:
             raise ValueError("Position must be positive.")
-        self.position = new_position
-        self.save()
+        self.move_to(new_position)
 
-    def calculate_estimated_wait_time(self) -> int:
+    def calculate_estimated_wait_time(self, wait_time_per_turn=None) -> int:
         """
         Calculate the estimated wait time for this participant in the queue.
 
+        :param wait_time_per_turn: The queue's estimated wait time per turn, when already
+                                   computed for a list of participants (optional).
+
         :returns: The estimated wait time in minutes for the participant based on their position in the queue.
                   If the participant is at the first position, the estimated wait time is the queue's
                   estimated wait time per turn. Otherwise, it is the queue's estimated wait time per turn
-                  multiplied by the participant's position minus one.
+                  multiplied by the participant's position minus one, and 0 once they stopped waiting.
         :raises ValueError: If the position is less than 1.
         """
-        if self.position == 1:
-            return self.queue.estimated_wait_time_per_turn
-        return self.queue.estimated_wait_time_per_turn * self.position
+        position = self.position
+        if position is None:
+            return 0
+        if wait_time_per_turn is None:
+            wait_time_per_turn = self.queue.get_estimated_wait_time_per_turn()
+        if position == 1:
+            return wait_time_per_turn
+        return wait_time_per_turn * position
 
     def start_service(self):
         """
@@ -104,7 +560,6 @@ class Participant(models.Model):
 
         if self.state == 'waiting':
             self.state = 'serving'
-            self.position = None
             self.service_started_at = timezone.localtime()
             self.save()
 
@@ -173,18 +628,63 @@ class Participant(models.Model):
             raise ValueError("No available resources")
 
     @staticmethod
-    def remove_old_completed_participants():
+    def remove_old_completed_participants(now=None, chunk_size=1000) -> int:
+        """
+        Removes participants whose service was completed longer ago than their queue's retention.
+
+        Queues keep completed participants for their own `retention_days`, or the
+        site-wide default. Participants are deleted in chunks of bounded size so
+        that no single statement locks a large part of the table; the daily
+        rollups and duration sketches keep their statistics.
+
+        :param now: The reference time (defaults to the current time).
+        :param chunk_size: The maximum number of participants deleted per statement.
+        :return: The number of participants deleted.
+        """
+        now = now or timezone.localtime()
+        overrides = {}
+        for queue_id, days in Queue.objects.exclude(retention_days=None).values_list('pk', 'retention_days'):
+            overrides.setdefault(days, []).append(queue_id)
+        completed = Participant.objects.filter(state='completed')
+        querysets = [completed.exclude(queue_id__in=[pk for pks in overrides.values() for pk in pks]).filter(
+            service_completed_at__lte=now - timedelta(days=Queue.default_retention_days()))]
+        querysets += [completed.filter(queue_id__in=queue_ids, service_completed_at__lte=now - timedelta(days=days))
+                      for days, queue_ids in overrides.items()]
+
+        deleted = 0
+        for queryset in querysets:
+            while True:
+                ids = list(queryset.values_list('id', flat=True)[:chunk_size])
+                if not ids:
+                    break
+                Participant.objects.filter(id__in=ids).delete()
+                deleted += len(ids)
+        return deleted
+
+    @staticmethod
+    def backfill_resource_served(chunk_size=1000) -> int:
         """
-        Removes participants whose service was completed 30 days ago.
+        Record the resource that served the participants saved before `resource_served` existed.
 
-        This method filters participants who have a 'completed' state and whose service was completed before the cutoff
-        time (30 days ago) and deletes them from the database.
+        The resource is the participant's `resource` if still set, otherwise the
+        resource of its queue named by `resource_assigned`, as resource names are
+        unique per queue. Participants are updated in chunks of bounded size.
 
-        :raises ValueError: If no participants match the criteria.
+        :param chunk_size: The maximum number of participants updated per statement.
+        :return: The number of participants updated.
         """
-        cutoff_time = timezone.localtime() - timedelta(days=30)
-        Participant.objects.filter(state='completed',
-                                   service_completed_at__lte=cutoff_time).delete()
+        by_name = Resource.objects.filter(
+            queue_id=OuterRef('queue_id'), name=OuterRef('resource_assigned')).values('pk')[:1]
+        missing = Participant.objects.filter(resource_served__isnull=True).filter(
+            Q(resource__isnull=False) | Exists(by_name))
+        updated = 0
+        while True:
+            ids = list(missing.values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            updated += Participant.objects.filter(id__in=ids).update(
+                resource_served=Coalesce(F('resource'), Subquery(by_name)))
+        return updated
 
     def get_status_link(self):
         """
@@ -28,5 +28,9 @@ class HospitalParticipant(Participant):
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES,
                                 default='normal')
 
+    def get_ticket_service_type(self):
+        """Return the medical field selecting the ticket prefix."""
+        return self.medical_field
+
     def __str__(self):
         return f"Hospital Participant: {self.name}"
\ No newline at end of file
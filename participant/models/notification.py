@@ -1,4 +1,5 @@
 from django.db import models
+from manager.utils.live_updates import publish_queue_change
 from participant.models import Participant
 
 
@@ -11,5 +12,26 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     played_sound = models.BooleanField(default=False)
 
+    def save(self, *args, **kwargs):
+        """Save the notification and push it to the participant's status page once committed."""
+        super().save(*args, **kwargs)
+        publish_queue_change(self.queue_id)
+
+    @classmethod
+    def mark_played(cls, participant_code, ids) -> int:
+        """
+        Record that a participant's status page played the sound of some notifications.
+
+        :param participant_code: The code of the participant the status page shows.
+        :param ids: The IDs of the notifications played.
+        :return: The number of notifications marked as played.
+        """
+        notifications = cls.objects.filter(participant__code=participant_code, id__in=ids, played_sound=False)
+        queue_id = notifications.values_list('queue_id', flat=True).first()
+        marked = notifications.update(played_sound=True)
+        if marked:
+            publish_queue_change(queue_id)
+        return marked
+
     def __str__(self):
         return f"Notification for {self.participant}: {self.message}"
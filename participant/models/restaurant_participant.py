@@ -13,3 +13,7 @@ class RestaurantParticipant(Participant):
     service_type = models.CharField(max_length=20,
                                     choices=SERVICE_TYPE_CHOICE,
                                     default='dine_in')
+
+    def get_ticket_service_type(self):
+        """Return the service type selecting the ticket prefix."""
+        return self.service_type
@@ -0,0 +1,85 @@
+// Keeps a live view of a queue in step over a WebSocket: a snapshot on connect, then versioned patches.
+// The server computes the patches with manager/utils/state_patch.py; applyPatch mirrors apply_patch there.
+
+function applyPatch(state, ops, keys) {
+    ops.forEach(op => {
+        if (op.op === 'set') {
+            state[op.path] = op.value;
+            return;
+        }
+        if (op.op === 'unset') {
+            delete state[op.path];
+            return;
+        }
+        const items = state[op.path];
+        if (op.op === 'insert') {
+            items.splice(op.index, 0, op.value);
+            return;
+        }
+        const index = items.findIndex(item => item[keys[op.path]] === op.key);
+        if (op.op === 'remove') {
+            items.splice(index, 1);
+        } else if (op.op === 'move') {
+            items.splice(op.index, 0, items.splice(index, 1)[0]);
+        } else if (op.op === 'update') {
+            Object.assign(items[index], op.value);
+        }
+    });
+}
+
+// Returns an object whose send(message) sends a message to the server while connected.
+function connectLiveState(path, onState, reconnectDelay = 5000) {
+    let stream = null;
+    let version = null;
+    let keys = {};
+    let state = null;
+    let socket = null;
+
+    function connect() {
+        // Use "wss://" if the current page is served over HTTPS, otherwise use "ws://"
+        const protocol = window.location.protocol === "https:" ? "wss://" : "ws://";
+        // Resume from the last applied version, so only the missed patches are sent
+        const query = stream ? `?stream=${stream}&version=${version}` : '';
+        socket = new WebSocket(`${protocol}${window.location.host}${path}${query}`);
+
+        socket.onmessage = function (event) {
+            const message = JSON.parse(event.data);
+            if (message.type === 'snapshot') {
+                stream = message.stream;
+                version = message.version;
+                keys = message.keys;
+                state = message.state;
+            } else if (message.type === 'patch') {
+                if (message.stream !== stream || message.base !== version) {
+                    // A patch was missed: ask for what is missing from the last applied version
+                    socket.send(JSON.stringify({type: 'resync', stream: stream, version: version}));
+                    return;
+                }
+                applyPatch(state, message.ops, keys);
+                version = message.version;
+            } else {
+                return;
+            }
+            onState(state);
+        };
+
+        socket.onerror = function (error) {
+            console.error("WebSocket error:", error);
+            socket.close();  // Close to trigger reconnect logic
+        };
+
+        socket.onclose = function () {
+            console.log("WebSocket connection closed. Reconnecting...");
+            setTimeout(connect, reconnectDelay);
+        };
+    }
+
+    connect();
+    return {
+        send(message) {
+            if (socket && socket.readyState === WebSocket.OPEN) {
+                socket.send(JSON.stringify(message));
+            }
+        }
+    };
+}
@@ -1,10 +1,16 @@
+from io import StringIO
+from django.core.management import call_command
+from django.db import transaction
 from django.test import TestCase
 from django.utils import timezone
 from participant.models import Participant, RestaurantParticipant
-from manager.models import Queue, RestaurantQueue, Table
+from manager.models import Queue, QueueDailyStats, QueueDurationSketch, RestaurantQueue, Table
 from manager.models import Resource
 from django.contrib.auth.models import User
+from manager.utils.concurrency import TransitionConflict
+from manager.utils.maintenance import PeriodicRunner, run_maintenance
 from datetime import timedelta
+from unittest.mock import patch
 
 
 class ParticipantModelTests(TestCase):
@@ -44,8 +50,12 @@ class ParticipantModelTests(TestCase):
 
     def test_update_position(self):
         """Test updating the position of the participant."""
+        for name in ('Jane Doe', 'Jim Doe'):
+            Participant.objects.create(name=name, queue=self.queue)
         self.participant.update_position(3)
         self.assertEqual(self.participant.position, 3)
+        self.participant.update_position(10)  # Clamped to the end of the list
+        self.assertEqual(self.participant.position, 3)
 
         with self.assertRaises(ValueError) as context:
             self.participant.update_position(0)  # Attempt to set position to 0
@@ -137,6 +147,30 @@ class ParticipantModelTests(TestCase):
         self.assertFalse(
             Participant.objects.filter(id=old_participant.id).exists())
 
+    def test_remove_old_completed_participants_per_queue_retention(self):
+        """Test that each queue's retention applies and deletion proceeds in chunks."""
+        short_queue = Queue.objects.create(name='Short Queue', created_by=self.user, retention_days=7,
+                                           longitude=100.5163, latitude=13.7285)
+        for queue, days in ((self.queue, 10), (self.queue, 10), (short_queue, 10), (short_queue, 3)):
+            Participant.objects.create(name=f'{queue.name} {days}', queue=queue, state='completed',
+                                       service_completed_at=timezone.now() - timedelta(days=days))
+        self.assertEqual(Participant.remove_old_completed_participants(chunk_size=1), 1)
+        self.assertEqual(sorted(Participant.objects.filter(state='completed').values_list('name', flat=True)),
+                         ['General Queue 10', 'General Queue 10', 'Short Queue 3'])
+
+        out = StringIO()
+        with self.settings(PARTICIPANT_RETENTION_DAYS=5):
+            call_command('run_maintenance', stdout=out)
+        self.assertIn("Deleted 2 participants", out.getvalue())
+        self.assertEqual(Participant.objects.filter(state='completed').count(), 1)
+
+    def test_maintenance_runner_logs_failures(self):
+        """Test that a failing maintenance run is logged instead of stopping the runner."""
+        runner = PeriodicRunner(lambda: 1 / 0, interval=60, name='failing')
+        with self.assertLogs('queue', level='ERROR'):
+            self.assertIsNone(runner.run_once())
+        self.assertEqual(PeriodicRunner(run_maintenance, interval=60).run_once()['participants'], 0)
+
     def test_assign_to_resource(self):
         """Test assign_to_resource method."""
         # Ensure the resource is available and associated with the queue
@@ -173,6 +207,81 @@ class ParticipantModelTests(TestCase):
         self.assertEqual(str(context.exception), "No available resources")
 
 
+    def test_concurrent_transition_conflicts(self):
+        """Test that a participant changed by another terminal since it was read is not overwritten."""
+        other_terminal = Participant.objects.get(pk=self.participant.pk)
+        self.participant.start_service()
+        with self.assertRaises(TransitionConflict), transaction.atomic():
+            other_terminal.state = 'no_show'
+            other_terminal.save()
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.state, 'serving')
+        self.assertEqual(Queue.check_live_counters(), {})
+
+        other_terminal.refresh_from_db()
+        other_terminal.note = 'Edited after reloading'
+        other_terminal.save()
+
+    def test_apply_transitions(self):
+        """Test that a batch of transitions updates participants, resources and statistics together."""
+        self.resource.queue = self.queue
+        self.resource.save()
+        serving, no_show, leaving, done = (Participant.objects.create(name=name, queue=self.queue)
+                                           for name in ('Serving', 'No Show', 'Leaving', 'Done'))
+        serving.assign_to_resource()
+        serving.state = 'serving'
+        serving.joined_at = timezone.localtime() - timedelta(minutes=15)
+        serving.service_started_at = timezone.localtime() - timedelta(minutes=10)
+        serving.save()
+        done.state = 'completed'
+        done.save()
+
+        result = Participant.apply_transitions(self.queue, [
+            (self.participant.pk, 'serve'), (serving.pk, 'complete'), (no_show.pk, 'no_show'),
+            (leaving.pk, 'cancel'), (done.pk, 'serve'),
+        ])
+        self.assertEqual(result, {
+            'applied': {'serve': [self.participant.pk], 'complete': [serving.pk],
+                        'no_show': [no_show.pk], 'cancel': [leaving.pk]},
+            'skipped': [done.pk],
+        })
+        states = dict(Participant.objects.values_list('name', 'state'))
+        self.assertEqual(states, {'John Doe': 'serving', 'Serving': 'completed', 'No Show': 'no_show',
+                                  'Leaving': 'cancelled', 'Done': 'completed'})
+        serving.refresh_from_db()
+        self.resource.refresh_from_db()
+        self.assertEqual((serving.resource, serving.resource_assigned), (None, 'Test Resource'))
+        self.assertEqual((self.resource.status, self.resource.assigned_to), ('available', None))
+
+        self.assertEqual(Queue.check_live_counters(), {})
+        stats = QueueDailyStats.objects.get(queue=self.queue)
+        self.assertEqual((stats.waiting, stats.serving, stats.completed, stats.no_show, stats.cancelled),
+                         (0, 1, 2, 1, 1))
+        self.assertEqual((stats.service_count, stats.service_total, stats.service_max), (2, 10, 10))
+        self.assertEqual(QueueDurationSketch.objects.filter(queue=self.queue).count(), 2)
+        self.queue.refresh_from_db()
+        self.assertIn('service', self.queue.wait_estimator_state['parallelism'])
+
+        with self.assertRaises(ValueError):
+            Participant.apply_transitions(self.queue, [(self.participant.pk, 'finish')])
+        with self.assertRaises(ValueError):
+            Participant.apply_transitions(self.queue, [(no_show.pk, 'serve'), (no_show.pk, 'cancel')])
+
+    def test_apply_transitions_conflict(self):
+        """Test that a batch is rolled back when another terminal changed a participant after it was read."""
+        second = Participant.objects.create(name='Second', queue=self.queue)
+        snapshot = QueueDailyStats.snapshot
+
+        def other_terminal_cancels(participant):
+            Participant.objects.filter(pk=second.pk).update(state='cancelled')
+            return snapshot(participant)
+
+        with patch.object(QueueDailyStats, 'snapshot', side_effect=other_terminal_cancels), \
+                self.assertRaises(TransitionConflict):
+            Participant.apply_transitions(self.queue, [(self.participant.pk, 'serve'), (second.pk, 'serve')])
+        self.assertEqual(dict(Participant.objects.values_list('name', 'state')),
+                         {'John Doe': 'waiting', 'Second': 'waiting'})
+
 class RestaurantParticipantModelTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser',
@@ -115,6 +115,7 @@ class MarkNotificationAsReadTests(TestCase):
         # Verify the notification is marked as read
         self.notification.refresh_from_db()
         self.assertTrue(self.notification.is_read)
+        self.assertTrue(self.notification.played_sound)
 
     def test_mark_notification_as_read_not_found(self):
         """Test marking a non-existent notification as read."""
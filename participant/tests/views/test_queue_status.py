@@ -1,8 +1,12 @@
-from django.test import TestCase, Client
+import asyncio
+from contextlib import suppress
+from asgiref.sync import sync_to_async
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 from manager.models import Queue
-from participant.models import Participant
+from manager.utils.live_updates import QueueSnapshotHub
+from participant.models import Notification, Participant
 from datetime import time
 import json
 
@@ -54,25 +58,71 @@ class QueueStatusTests(TestCase):
             list(Participant.objects.filter(queue=self.queue).order_by('joined_at')),
         )
 
-    # @patch('manager.utils.category_handler.CategoryHandlerFactory.get_handler')
-    # def test_sse_queue_status(self, mock_handler_factory):
-    #     """Test server-sent events for queue status."""
-    #     # Mock handler behavior
-    #     mock_handler = mock_handler_factory.return_value
-    #     mock_handler.get_participant_set.return_value.get.return_value = self.participant
-    #     mock_handler.get_participant_data.return_value = {'position': 1, 'name': 'John Doe'}
-    #
-    #     response = self.client.get(self.sse_url)
-    #
-    #     # Assert streaming response type
-    #     self.assertEqual(response.status_code, 200)
-    #     self.assertEqual(response['Content-Type'], 'text/event-stream')
-    #
-    #     # Simulate the generator's behavior
-    #     event_generator = response.streaming_content
-    #     event_data = next(event_generator).decode('utf-8')
-    #     self.assertIn('data: {"position": 1, "name": "John Doe"}', event_data)
-
+    async def read_events(self, url, headers=None):
+        """Start reading a status stream in a task, as the ASGI server would, returning its events' queue."""
+        response = await self.async_client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = asyncio.Queue()
+
+        async def read():
+            async for chunk in response.streaming_content:
+                await events.put(chunk.decode())
+        return asyncio.create_task(read()), events
+
+    @staticmethod
+    async def next_event(events):
+        event = await asyncio.wait_for(events.get(), 5)
+        if event.startswith(':'):
+            return event, None
+        event_id, data = event.split('\n')[:2]
+        return event_id.removeprefix('id: '), json.loads(data.removeprefix('data: '))
+
+    def notify(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(queue=self.queue, participant=self.participant, message="Your turn")
+
+    @override_settings(SSE_HEARTBEAT_SECONDS=0.2, LIVE_UPDATE_RESYNC_SECONDS=0)
+    async def test_sse_queue_status(self):
+        """Test that the status stream sends a snapshot, heartbeats and patches, and stops on disconnect."""
+        reader, events = await self.read_events(self.sse_url)
+        event_id, snapshot = await self.next_event(events)
+        self.assertEqual(snapshot['type'], 'snapshot')
+        self.assertEqual(snapshot['state']['name'], 'John Doe')
+        self.assertEqual(event_id, f"{snapshot['stream']}:{snapshot['version']}")
+        self.assertEqual(await self.next_event(events), (": heartbeat\n\n", None))
+
+        await sync_to_async(self.notify)()
+        event_id, patch_message = await self.next_event(events)
+        self.assertEqual((patch_message['type'], patch_message['base']), ('patch', snapshot['version']))
+        self.assertEqual(event_id, f"{snapshot['stream']}:{patch_message['version']}")
+
+        reader.cancel()
+        with suppress(asyncio.CancelledError):
+            await reader
+        self.assertEqual(QueueSnapshotHub.get().subscribers, {})
+
+    @override_settings(LIVE_UPDATE_RESYNC_SECONDS=0)
+    async def test_sse_queue_status_resumes_from_last_event_id(self):
+        """Test that a reconnecting client is only sent the events after its Last-Event-ID."""
+        watcher, watcher_events = await self.read_events(self.sse_url)
+        snapshot_id, _ = await self.next_event(watcher_events)
+        await sync_to_async(self.notify)()
+        patch_id, _ = await self.next_event(watcher_events)
+
+        reader, events = await self.read_events(self.sse_url, headers={'Last-Event-ID': snapshot_id})
+        event_id, message = await self.next_event(events)
+        self.assertEqual((event_id, message['type']), (patch_id, 'patch'))
+        for task in (reader, watcher):
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+    async def test_sse_queue_status_not_found(self):
+        """Test that streaming the status of an unknown participant returns 404."""
+        response = await self.async_client.get(
+            reverse('participant:sse_queue_status', kwargs={'participant_code': 'unknown'}))
+        self.assertEqual(response.status_code, 404)
 
     # def test_participant_leave_success(self):
     #     """Test successful removal of a participant from the queue."""
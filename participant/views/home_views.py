@@ -11,7 +11,7 @@ class HomePageView(generic.TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        featured_queues = Queue.get_top_featured_queues()
+        featured_queues = Queue.get_cached_featured_queues()
         context['featured_queues'] = featured_queues
         location_status = self.request.session.get('location_status', None)
         if location_status == 'blocked':
@@ -26,6 +26,8 @@ class HomePageView(generic.TemplateView):
                     user_lat = float(user_lat)
                     user_lon = float(user_lon)
                     nearby_queues = Queue.get_nearby_queues(user_lat, user_lon)
+                    for queue in featured_queues:
+                        queue.set_distance_from(user_lat, user_lon)
                     context['nearby_queues'] = nearby_queues
                     context['num_nearby_queues'] = len(
                         nearby_queues) if nearby_queues else 0
@@ -7,7 +7,7 @@ from django.views.decorators.http import require_POST
 @require_POST
 def mark_notification_as_read(request, notification_id):
     """
-    Marks the specified notification as read.
+    Marks the specified notification as read, and so as played.
 
     :param request: The HTTP request object.
     :param notification_id: The ID of the notification to mark as read.
@@ -16,6 +16,7 @@ def mark_notification_as_read(request, notification_id):
     try:
         notification = Notification.objects.get(id=notification_id)
         notification.is_read = True
+        notification.played_sound = True
         notification.save()
         return JsonResponse({"status": "success"})
     except Notification.DoesNotExist: